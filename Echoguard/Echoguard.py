@@ -1,114 +1,201 @@
 import numpy as np
-import librosa
 import pandas as pd
 import os
 from tqdm import tqdm # A library for displaying progress bars
 import glob
+import csv
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Shared modules (feature_store.py, ...) live in the root project directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from feature_store import FeatureStore, file_hash
+# The same extractor the API serves with; FEATURE_VERSION tags stored vectors
+from features import FEATURE_VERSION, SAMPLE_RATE, load_audio, extract_features as compute_features
 
 # --- 1. Feature Extraction Function ---
-def extract_features(file_path, n_mfcc=13):
-    """Loads audio and extracts aggregated MFCC, Delta, and Delta-Delta features."""
+def extract_features_or_error(file_path, n_mfcc=13):
+    """
+    Loads audio and extracts aggregated MFCC, Delta, and Delta-Delta features.
+
+    Returns:
+        tuple: (feature vector, None) on success or (None, error message) on failure.
+    """
     try:
-        # Load audio at native sample rate (sr=None)
-        # Using mono=True is generally recommended for feature extraction
-        y, sr = librosa.load(file_path, sr=None, mono=True) 
-        
-        # 1. MFCCs
-        # The hop_length is set to the default (512) for standard feature extraction
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
-        
-        # 2. Delta (1st difference) and Delta-Delta (2nd difference)
-        mfccs_delta = librosa.feature.delta(mfccs)
-        mfccs_delta2 = librosa.feature.delta(mfccs, order=2)
-        
-        # Combine all features (mfccs, delta, delta-delta)
-        combined_features = np.vstack([mfccs, mfccs_delta, mfccs_delta2])
-        
-        # Aggregate: Calculate Mean and Standard Deviation across all time frames (axis=1)
-        mean_features = np.mean(combined_features, axis=1)
-        std_features = np.std(combined_features, axis=1)
-        
-        # Create a single feature vector
-        # If n_mfcc=13, this vector will have 3 * 13 * 2 = 78 elements
-        final_vector = np.hstack([mean_features, std_features])
-        
-        return final_vector
+        # Resampled to SAMPLE_RATE (16 kHz), the rate the API scores at
+        y = load_audio(file_path)
+
+        # 3 * 13 * 2 = 78 elements: mean and std of MFCC, Delta and Delta-Delta
+        final_vector = compute_features(y, SAMPLE_RATE, n_mfcc=n_mfcc)
+
+        return final_vector, None
 
     except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def extract_features(file_path, n_mfcc=13):
+    """Loads audio and extracts aggregated MFCC, Delta, and Delta-Delta features."""
+    final_vector, error = extract_features_or_error(file_path, n_mfcc=n_mfcc)
+    if error is not None:
         # Added os.path.basename to keep the error message clean
-        print(f"Error processing {os.path.basename(file_path)}: {e}") 
+        print(f"Error processing {os.path.basename(file_path)}: {error}") 
         return None # Return None if processing fails
-    
+    return final_vector
+
+
+def extract_chunk(file_paths):
+    """
+    Extracts features for one work unit (a chunk of files).
+
+    Returns:
+        tuple: (paths, features, hashes, errors) where paths/features/hashes
+        cover the files that worked and errors is a list of (path, message)
+        for the rest.
+    """
+    paths, features, hashes, errors = [], [], [], []
+    for file_path in file_paths:
+        vector, error = extract_features_or_error(file_path)
+        if error is None:
+            paths.append(file_path)
+            features.append(vector)
+            hashes.append(file_hash(file_path))
+        else:
+            errors.append((file_path, error))
+    return paths, features, hashes, errors
+
 
 # --- 2. Batch Processing ---
-def process_dataset(data_dir, file_exts=('.wav', '.mp3', '.flac')):
+def process_dataset(data_dir, file_exts=('.wav', '.mp3', '.flac'), workers=1, chunk_size=64, store=None, label=None):
     """
     Loops through all specified audio files in a directory and extracts features.
     
     Args:
         data_dir (str): The path to the folder containing the audio files.
         file_exts (tuple): A tuple of file extensions to process.
+        workers (int): Number of worker processes (1 = run in this process).
+        chunk_size (int): Files per work unit.
+        store (FeatureStore): If set, every finished chunk is appended to the
+            store under `label`, and files already in it are skipped, so an
+            interrupted run resumes where it stopped.
+        label (int): Label recorded in the store for this directory.
+
+    Returns:
+        tuple: (features, paths, errors) for the files processed in this run,
+        where row i of features came from paths[i] and errors lists
+        (path, message) for files that failed. With a store, features is
+        None: vectors go straight to the store and are not kept in memory.
     """
-    all_features = []
-    
     # Use glob to find all files matching the extensions
     # Use recursive=True if you need to search subfolders as well
     search_path = os.path.join(data_dir, '*') 
-    all_files = [f for f in glob.glob(search_path) if f.lower().endswith(file_exts)]
-    
-    print(f"\nProcessing {len(all_files)} files in: {data_dir}")
-    
-    # Use tqdm to show a progress bar
-    for file_path in tqdm(all_files):
-        # Extract features
-        features = extract_features(file_path)
-        
-        if features is not None:
-            # Add the features to our list
-            all_features.append(features)
-            
+    all_files = sorted(f for f in glob.glob(search_path) if f.lower().endswith(file_exts))
+
+    # Resume: skip files the store already has at this feature version
+    done = store.known_paths(FEATURE_VERSION) if store is not None else set()
+    todo = [f for f in all_files if f not in done]
+
+    print(f"\nProcessing {len(todo)} files in: {data_dir} ({len(all_files) - len(todo)} already done)")
+
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    paths, features, errors = [], [], []
+
+    def collect(result):
+        chunk_paths, chunk_features, chunk_hashes, chunk_errors = result
+        paths.extend(chunk_paths)
+        errors.extend(chunk_errors)
+        if store is None:
+            features.extend(chunk_features)
+        for file_path, error in chunk_errors:
+            print(f"Error processing {os.path.basename(file_path)}: {error}")
+        if store is not None and chunk_paths:
+            store.append(chunk_features, chunk_paths, [label] * len(chunk_paths), FEATURE_VERSION, chunk_hashes)
+
+    # Use tqdm to show a progress bar (one tick per chunk)
+    if workers <= 1:
+        for chunk in tqdm(chunks):
+            collect(extract_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(extract_chunk, chunk) for chunk in chunks]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                collect(future.result())
+
+    if store is not None:
+        return None, paths, errors
     # Convert the list of arrays into a single 2D NumPy array
-    return np.array(all_features)
+    return np.array(features).reshape(len(paths), -1), paths, errors
+
+
+def write_manifest(manifest_path, paths, labels):
+    """Maps each row of X_features.npy back to its source file."""
+    with open(manifest_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['row', 'path', 'label'])
+        for row, (file_path, label) in enumerate(zip(paths, labels)):
+            writer.writerow([row, file_path, int(label)])
+
+
+def write_error_report(report_path, errors):
+    """Lists every file that could not be processed, with the reason."""
+    with open(report_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path', 'label', 'error'])
+        writer.writerows(errors)
+
 
 # --- 3. Run the Processing and Save ---
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract MFCC features from the REAL and FAKE audio folders.")
+    parser.add_argument('--real-dir', default='Echoguard/REAL')
+    parser.add_argument('--fake-dir', default='Echoguard/FAKE')
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (default: 1, serial)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Files per work unit (and per store shard)")
+    parser.add_argument('--store', default='feature_store',
+                        help="Feature store directory; new files are appended, known files are skipped")
+    parser.add_argument('--no-export', action='store_true',
+                        help="Only update the store, do not rewrite X_features.npy / y_labels.npy")
+    args = parser.parse_args()
+
     # Define the directory paths (Ensure these folders exist and contain audio files)
     # Folders must be named 'REAL' and 'FAKE' in the same directory as this script.
-    REAL_DIR = 'Echoguard/REAL' 
-    FAKE_DIR = 'Echoguard/FAKE' 
+    REAL_DIR = args.real_dir
+    FAKE_DIR = args.fake_dir
     
     # --- Check for Directories ---
     if not os.path.isdir(REAL_DIR) or not os.path.isdir(FAKE_DIR):
         print("!!! ERROR: One or both directories (REAL, FAKE) were not found.")
         print("Please ensure the folders are in the same location as this script.")
     else:
+        store = FeatureStore(args.store)
+
         # Process the real and fake data
-        real_features = process_dataset(REAL_DIR)
-        fake_features = process_dataset(FAKE_DIR)
+        # Labels: 0 for Real, 1 for Fake (or vice-versa, just be consistent)
+        _, _, real_errors = process_dataset(
+            REAL_DIR, workers=args.workers, chunk_size=args.chunk_size, store=store, label=0)
+        _, _, fake_errors = process_dataset(
+            FAKE_DIR, workers=args.workers, chunk_size=args.chunk_size, store=store, label=1)
+
+        errors = [(p, 0, e) for p, e in real_errors] + [(p, 1, e) for p, e in fake_errors]
+        write_error_report('extraction_errors.csv', errors)
+        print(f"\n{len(errors)} failed files listed in 'extraction_errors.csv'")
         
         # Check if any features were successfully extracted
-        if real_features.size == 0 and fake_features.size == 0:
+        if len(store.known_paths(FEATURE_VERSION)) == 0:
             print("!!! ERROR: No features were successfully extracted. Check file paths and audio formats.")
-        else:
-            # --- 4. Create Labels ---
-            # Create the 'y' labels for the machine learning model: 
-            # 0 for Real, 1 for Fake (or vice-versa, just be consistent)
-            real_labels = np.zeros(real_features.shape[0])  # Array of 0s
-            fake_labels = np.ones(fake_features.shape[0])   # Array of 1s
-            
-            # --- 5. Combine and Finalize Dataset ---
-            
-            # Combine the feature arrays (X)
-            X = np.vstack([real_features, fake_features])
-            
-            # Combine the labels arrays (y)
-            y = np.hstack([real_labels, fake_labels])
-            
-            # Save the final data for machine learning training
-            np.save('X_features.npy', X)
-            np.save('y_labels.npy', y)
+        elif not args.no_export:
+            # Save the final data for machine learning training (streamed out of the store)
+            rows = store.export('X_features.npy', 'y_labels.npy', feature_version=FEATURE_VERSION)
+
+            # Row -> source file mapping
+            write_manifest('features_manifest.csv', [row['path'] for row in rows], [row['label'] for row in rows])
             
             print("\n--- Processing Complete ---")
-            print(f"Total Features (X) Shape: {X.shape}") 
-            print(f"Total Labels (y) Shape: {y.shape}") 
-            print("Features and labels saved as 'X_features.npy' and 'y_labels.npy'")
\ No newline at end of file
+            print(f"Total Features (X) Shape: ({len(rows)}, {store.shard(rows[0]['shard']).shape[1]})") 
+            print(f"Total Labels (y) Shape: ({len(rows)},)") 
+            print("Features and labels saved as 'X_features.npy' and 'y_labels.npy'")
+            print("Row-to-file manifest saved as 'features_manifest.csv'")
+        else:
+            print(f"\n--- Processing Complete --- Store '{args.store}' holds {len(store)} vectors.")
@@ -1,10 +1,13 @@
 import os
+import sys
 import joblib
-import numpy as np
-import librosa
 from flask import Flask, request, render_template, redirect, url_for
 from werkzeug.utils import secure_filename # Used to sanitize uploaded filenames
 
+# Shared feature extractor (features.py) lives in the root project directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import features
+
 # --- Configuration ---
 app = Flask(__name__)
 # The folder where uploaded files will be temporarily stored
@@ -36,25 +39,9 @@ def allowed_file(filename):
 def extract_features(file_path, n_mfcc=13):
     """Loads audio and extracts aggregated MFCC, Delta, and Delta-Delta features."""
     try:
-        # NOTE: Use the SAME sample rate (e.g., 16000) that you used 
-        # for training to ensure consistency.
-        y, sr = librosa.load(file_path, sr=16000, mono=True) 
-        
-        # 1. MFCCs
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
-        
-        # 2. Delta and Delta-Delta
-        mfccs_delta = librosa.feature.delta(mfccs)
-        mfccs_delta2 = librosa.feature.delta(mfccs, order=2)
-        
-        # Combine all features
-        combined_features = np.vstack([mfccs, mfccs_delta, mfccs_delta2])
-        
-        # Aggregate: Calculate Mean and Standard Deviation (3 * 13 * 2 = 78 features)
-        mean_features = np.mean(combined_features, axis=1)
-        std_features = np.std(combined_features, axis=1)
-        
-        final_vector = np.hstack([mean_features, std_features])
+        # Same sample rate and extractor as training (features.py)
+        y = features.load_audio(file_path)
+        final_vector = features.extract_features(y, features.SAMPLE_RATE, n_mfcc=n_mfcc)
         
         # Reshape the vector from (78,) to (1, 78) for scikit-learn's predict method
         return final_vector.reshape(1, -1) 
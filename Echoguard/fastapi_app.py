@@ -1,7 +1,7 @@
 import os
+import io
 import joblib
 import numpy as np
-import tempfile
 import wave
 from fastapi import FastAPI, UploadFile, File, HTTPException
 try:
@@ -28,10 +28,10 @@ except Exception as e:
 
 ALLOWED_EXT = {"wav"}
 
-def extract_features_from_wav(file_path):
-    """Extract basic audio features from WAV file."""
+def extract_features_from_wav(wav_source):
+    """Extract basic audio features from a WAV file path or file-like object."""
     try:
-        with wave.open(file_path, 'rb') as wav_file:
+        with wave.open(wav_source, 'rb') as wav_file:
             n_frames = wav_file.getnframes()
             frame_rate = wav_file.getframerate()
             audio_data = wav_file.readframes(n_frames)
@@ -76,13 +76,9 @@ async def predict(audio_file: UploadFile = File(...)):
     if ext not in ALLOWED_EXT:
         raise HTTPException(status_code=400, detail=f"Unsupported file type. Allowed: {ALLOWED_EXT}")
 
-    # Save uploaded file into a temporary directory (automatically cleaned up)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmp_path = os.path.join(tmpdir, filename)
-        with open(tmp_path, "wb") as f:
-            f.write(await audio_file.read())
-
-        features = extract_features_from_wav(tmp_path)
+    # Read the upload straight from memory (no temporary files)
+    contents = await audio_file.read()
+    features = extract_features_from_wav(io.BytesIO(contents))
 
     if features is None:
         raise HTTPException(status_code=400, detail="Could not extract features from the audio file.")
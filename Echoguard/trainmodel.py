@@ -1,12 +1,32 @@
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold, GridSearchCV, cross_validate
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingGridSearchCV)
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVC
+from sklearn.svm import SVC, LinearSVC
+from sklearn.kernel_approximation import Nystroem
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import pandas as pd
 import os
+import sys
+import json
+import time
+import hashlib
+import argparse
 import joblib # <--- ADDED: Library for saving the model
 
+# Shared modules (feature_store.py, ...) live in the root project directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from feature_store import FeatureStore
+from compiled_model import CompiledSVM
+from features import FEATURE_VERSION
+import tabular_source
+from calibration import sweep, auc, equal_error_rate
+from model_registry import ModelRegistry, REGISTRY_DIR
+
 # --- 1. Load Data ---
 def load_data(X_path='X_features.npy', y_path='y_labels.npy'):
     """Loads feature and label arrays from disk."""
@@ -19,6 +39,17 @@ def load_data(X_path='X_features.npy', y_path='y_labels.npy'):
     print(f"Data loaded. Features (X) shape: {X.shape}, Labels (y) shape: {y.shape}")
     return X, y
 
+def load_store(store_dir, feature_version=None):
+    """Loads features and labels from a feature store written by Echoguard.py."""
+    if not os.path.exists(os.path.join(store_dir, 'index.csv')):
+        print(f"!!! ERROR: No feature store found in '{store_dir}'.")
+        return None, None
+
+    # Shards are memory-mapped and copied once into a single float32 matrix
+    X, y = FeatureStore(store_dir).to_arrays(feature_version)
+    print(f"Data loaded from store. Features (X) shape: {X.shape}, Labels (y) shape: {y.shape}")
+    return X, y
+
 # --- 2. Preprocessing and Splitting ---
 def preprocess_and_split(X, y, test_size=0.2, random_state=42):
     """Scales features and splits data into training and testing sets."""
@@ -82,32 +113,608 @@ def evaluate_model(model, X_test, y_test):
     cm_df = pd.DataFrame(cm, index=['Actual REAL', 'Actual FAKE'], columns=['Predicted REAL', 'Predicted FAKE'])
     print("Confusion Matrix:")
     print(cm_df)
+
+    # Threshold-free view; run calibration.py for full curves and calibration
+    curve = sweep(model.decision_function(X_test), y_test)
+    eer, _ = equal_error_rate(curve)
+    print(f"\nROC AUC: {auc(curve):.4f}   EER: {eer*100:.2f}%")
     print("="*50)
+    return accuracy
+
+
+# --- 5. Hyperparameter Search ---
+def _n_support(estimator, X, y):
+    """CV 'scorer' that records how many support vectors the fitted SVM kept."""
+    return float(estimator[-1].n_support_.sum())
+
+
+def _latency_us(estimator, X, y):
+    """CV 'scorer' that records scaling + decision_function time per sample (microseconds)."""
+    start = time.perf_counter()
+    estimator.decision_function(X)
+    return (time.perf_counter() - start) / len(X) * 1e6
+
+
+def search_hyperparameters(X_train, y_train, C_grid, gamma_grid, method='grid', folds=5, n_jobs=-1, cache_mb=2000):
+    """
+    Stratified k-fold search over C and gamma for the scaler + RBF SVM pipeline.
+
+    Args:
+        method (str): 'grid' tries every setting on every fold; 'halving'
+            (successive halving) drops the weakest settings early on growing
+            subsets of the data.
+        n_jobs (int): Parallel fits (-1 = all cores).
+        cache_mb (int): Total memory for libsvm kernel caches, split across
+            the parallel jobs so n_jobs copies do not exhaust RAM.
+
+    Returns:
+        tuple: (fitted search object, list of per-setting result dicts)
+    """
+    jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    cache_size = max(100, cache_mb // max(1, jobs))
+    pipeline = Pipeline([
+        ('scaler', StandardScaler()),
+        ('svm', SVC(kernel='rbf', cache_size=cache_size, random_state=42)),
+    ])
+    param_grid = {'svm__C': C_grid, 'svm__gamma': gamma_grid}
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+
+    print(f"Searching {len(C_grid) * len(gamma_grid)} settings ({method}, {folds}-fold, "
+          f"n_jobs={n_jobs}, kernel cache {cache_size} MB per job)...")
+    if method == 'halving':
+        # Successive halving only supports a single metric; the extra
+        # measurements are taken afterwards for the final round.
+        search = HalvingGridSearchCV(pipeline, param_grid, cv=cv, scoring='accuracy',
+                                     n_jobs=n_jobs, random_state=42, refit=True)
+    else:
+        scoring = {'accuracy': 'accuracy', 'n_support': _n_support, 'latency_us': _latency_us}
+        search = GridSearchCV(pipeline, param_grid, cv=cv, scoring=scoring, refit='accuracy', n_jobs=n_jobs)
+
+    search.fit(X_train, y_train)
+
+    res = search.cv_results_
+    rows = []
+    for i, params in enumerate(res['params']):
+        if method == 'halving' and res['iter'][i] != max(res['iter']):
+            continue  # keep only the settings that survived to the last round
+        score_key = 'mean_test_accuracy' if method == 'grid' else 'mean_test_score'
+        std_key = 'std_test_accuracy' if method == 'grid' else 'std_test_score'
+        rows.append({
+            'C': params['svm__C'],
+            'gamma': params['svm__gamma'],
+            'accuracy': float(res[score_key][i]),
+            'accuracy_std': float(res[std_key][i]),
+            'fit_time_s': float(res['mean_fit_time'][i]),
+            'latency_us_per_sample': float(res['mean_test_latency_us'][i]) if method == 'grid' else None,
+            'n_support': float(res['mean_test_n_support'][i]) if method == 'grid' else None,
+        })
+
+    if method == 'halving':
+        # Measure serving cost of the surviving settings on the same folds
+        extra = {'n_support': _n_support, 'latency_us': _latency_us}
+        for row in rows:
+            estimator = clone(pipeline).set_params(svm__C=row['C'], svm__gamma=row['gamma'])
+            scores = cross_validate(estimator, X_train, y_train, cv=cv, scoring=extra, n_jobs=n_jobs)
+            row['n_support'] = float(np.mean(scores['test_n_support']))
+            row['latency_us_per_sample'] = float(np.mean(scores['test_latency_us']))
+
+    rows.sort(key=lambda r: -r['accuracy'])
+    return search, rows
+
+
+def print_search_report(rows):
+    """Prints accuracy against fit time, latency and support-vector count for each setting."""
+    print("\n" + "="*78)
+    print(f"{'C':>8} {'gamma':>10} {'accuracy':>15} {'fit (s)':>9} {'latency (us)':>13} {'support vecs':>13}")
+    print("-"*78)
+    for r in rows:
+        latency = f"{r['latency_us_per_sample']:.1f}" if r['latency_us_per_sample'] is not None else '-'
+        n_support = f"{r['n_support']:.0f}" if r['n_support'] is not None else '-'
+        print(f"{r['C']:>8} {str(r['gamma']):>10} {r['accuracy']*100:>8.2f}±{r['accuracy_std']*100:<5.2f} "
+              f"{r['fit_time_s']:>9.3f} {latency:>13} {n_support:>13}")
+    print("="*78)
+
+
+def _parse_gamma(value):
+    return value if value in ('scale', 'auto') else float(value)
+
+
+# --- 6. Approximate Engine ---
+def train_approx_model(X_train, y_train, gamma, n_components=256, C=1.0):
+    """
+    Trains the low-latency approximate engine: a Nystroem RBF feature map with
+    a fixed number of landmarks feeding a linear SVM.
+
+    Unlike the exact SVC, whose serving cost grows with the number of support
+    vectors, its cost is fixed by n_components. X_train must already be scaled.
+    """
+    print(f"Training approximate engine (Nystroem, {n_components} components, gamma={gamma:.5g})...")
+    approx = Pipeline([
+        ('nystroem', Nystroem(kernel='rbf', gamma=gamma, n_components=min(n_components, len(X_train)),
+                              random_state=42)),
+        ('linear', LinearSVC(C=C, random_state=42, max_iter=10000)),
+    ])
+    approx.fit(X_train, y_train)
+    return approx
+
+
+def _per_request_latency_us(compiled, X_raw, repeats=200):
+    """Median time to score a single request with a compiled engine (microseconds)."""
+    timings = []
+    for i in range(min(repeats, len(X_raw))):
+        x = X_raw[i:i + 1]
+        start = time.perf_counter()
+        compiled.predict(x)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1e6)
+
+
+def compare_engines(svm_model, approx_model, scaler, X_test, y_test):
+    """Prints and returns held-out accuracy and serving latency for both engines."""
+    X_test_raw = scaler.inverse_transform(X_test)
+    results = {}
+    for name, model in (('exact', svm_model), ('approx', approx_model)):
+        compiled = CompiledSVM.from_estimator(model, scaler)
+        labels, _ = compiled.predict(X_test_raw)
+        results[name] = {
+            'accuracy': float(accuracy_score(y_test, labels)),
+            'kernel_rows': int(compiled.n_support),
+            'latency_us_per_request': _per_request_latency_us(compiled, X_test_raw),
+        }
+
+    print("\n" + "="*62)
+    print("        EXACT vs APPROXIMATE ENGINE (held-out split)")
+    print("="*62)
+    print(f"{'engine':>8} {'accuracy':>10} {'kernel rows':>13} {'latency/request (us)':>22}")
+    for name, r in results.items():
+        print(f"{name:>8} {r['accuracy']*100:>9.2f}% {r['kernel_rows']:>13} {r['latency_us_per_request']:>22.1f}")
+    print("="*62)
+    return results
+
+
+# --- 7. Data Sources ---
+def load_source(source, args):
+    """
+    Loads (X, y) for one --source: 'features' is our own 78-dim vectors
+    (X_features.npy or --store); other names are pre-extracted tables from
+    tabular_source.SOURCES, read from their memory-mapped column cache.
+    """
+    if source == 'features':
+        if args.store:
+            feature_version = args.feature_version or FEATURE_VERSION
+            return load_store(args.store, None if feature_version == 'all' else feature_version)
+        return load_data()
+    X, y = tabular_source.load_source(source, columns=args.columns, rebuild=args.rebuild_cache)
+    print(f"Data loaded from '{source}'. Features (X) shape: {X.shape}, Labels (y) shape: {y.shape}")
+    return X, y
+
+
+def registry_feature_version(args, base=None):
+    """
+    The feature version --register records for the model being trained.
+
+    It must be known: the registry refuses to promote a version whose
+    features differ from what the API extracts. Store rows carry their
+    version; X_features.npy does not, so it needs an explicit
+    --feature-version. An incremental update adds current-version feedback
+    to its base's support vectors, so with a base this is checked on every
+    run, registered or not: the base must be at the current version.
+
+    Returns:
+        str: the version, or None (after printing why) if it is not known.
+    """
+    if args.feature_version == 'all':
+        print("!!! ERROR: --register needs rows of one feature version, not --feature-version all.")
+        return None
+    if base is not None:
+        known = None
+        if os.path.exists(os.path.join(base, 'version.json')):
+            with open(os.path.join(base, 'version.json')) as f:
+                known = json.load(f)['feature_version']
+        known = known or args.feature_version
+        if known != FEATURE_VERSION:
+            print(f"!!! ERROR: The feedback is at feature version {FEATURE_VERSION!r}, so the base model must be "
+                  f"too (base: {known or 'unknown; pass --feature-version if you know it'}).")
+            return None
+        return known
+    if args.store:
+        return args.feature_version or FEATURE_VERSION
+    if args.feature_version is None:
+        print("!!! ERROR: X_features.npy does not record its feature version. Train from --store, "
+              "or pass the version it was extracted with as --feature-version to --register.")
+        return None
+    return args.feature_version
+
+
+def train_on(X, y, args):
+    """
+    Runs the fixed-setting or searched training on one dataset and evaluates
+    it on the held-out split.
+
+    Returns:
+        tuple: (svm_model, scaler, approx_model, metrics)
+    """
+    if args.search:
+        # 2. Hold out the same test split, then search on the training part only
+        X_train_raw, X_test_raw, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y
+        )
+        search, rows = search_hyperparameters(
+            X_train_raw, y_train, args.C, args.gamma, method=args.search,
+            folds=args.folds, n_jobs=args.n_jobs, cache_mb=args.cache_mb,
+        )
+        print_search_report(rows)
+
+        # 3. Best setting, refit on the whole training split
+        scaler = search.best_estimator_.named_steps['scaler']
+        svm_model = search.best_estimator_.named_steps['svm']
+        print(f"Best setting: {search.best_params_}")
+
+        # 4. Evaluation on the held-out split
+        X_train = scaler.transform(X_train_raw)
+        X_test = scaler.transform(X_test_raw)
+        accuracy = evaluate_model(svm_model, X_test, y_test)
+
+        metrics = {
+            'params': {'C': svm_model.C, 'gamma': svm_model.gamma},
+            'cv_accuracy': float(search.best_score_),
+            'test_accuracy': float(accuracy),
+            'n_support': int(svm_model.n_support_.sum()),
+            'search': {'method': args.search, 'folds': args.folds, 'results': rows},
+        }
+    else:
+        # 2. Preprocess and Split
+        # The 'scaler' object is now returned here
+        X_train, X_test, y_train, y_test, scaler = preprocess_and_split(X, y)
+
+        if X_train is None:
+            exit() # Stop if splitting failed
+
+        # 3. Model Training
+        start = time.perf_counter()
+        svm_model = train_model(X_train, y_train)
+        fit_time = time.perf_counter() - start
+
+        # 4. Evaluation
+        accuracy = evaluate_model(svm_model, X_test, y_test)
+        metrics = {
+            'params': {'C': svm_model.C, 'gamma': svm_model.gamma},
+            'test_accuracy': float(accuracy),
+            'fit_time_s': fit_time,
+            'n_support': int(svm_model.n_support_.sum()),
+        }
+
+    start = time.perf_counter()
+    svm_model.decision_function(X_test)
+    metrics['latency_us_per_sample'] = (time.perf_counter() - start) / len(X_test) * 1e6
+    metrics['samples'] = int(len(X))
+    metrics['n_features'] = int(X.shape[1])
+
+    # --- Optional: approximate engine, compared with the exact one ---
+    approx_model = None
+    if args.approx_components > 0:
+        approx_model = train_approx_model(X_train, y_train, svm_model._gamma,
+                                          n_components=args.approx_components, C=args.approx_C)
+        metrics['engines'] = compare_engines(svm_model, approx_model, scaler, X_test, y_test)
+    return svm_model, scaler, approx_model, metrics
+
+
+def print_source_report(results):
+    """Prints held-out accuracy and cost of the model trained on each source."""
+    print("\n" + "="*78)
+    print(f"{'source':>10} {'samples':>8} {'features':>9} {'accuracy':>9} {'fit (s)':>8} "
+          f"{'support vecs':>13} {'latency (us)':>13}")
+    print("-"*78)
+    for source, m in results.items():
+        fit = f"{m['fit_time_s']:.3f}" if 'fit_time_s' in m else '-'
+        print(f"{source:>10} {m['samples']:>8} {m['n_features']:>9} {m['test_accuracy']*100:>8.2f}% {fit:>8} "
+              f"{m['n_support']:>13} {m['latency_us_per_sample']:>13.1f}")
+    print("="*78)
+
+
+# --- 8. Incremental Retraining from Feedback ---
+def load_base(args):
+    """
+    Loads the model being updated: --base (a directory with svm_model.pkl,
+    scaler.pkl and model_metrics.json, or a registry version), else the
+    registry's served version, else the files in the current directory.
+
+    Returns:
+        tuple: (svm_model, scaler, metrics, base directory)
+    """
+    base = args.base
+    if base is None:
+        registry = ModelRegistry(args.registry)
+        current = registry.current()
+        base = registry.path(current) if current else '.'
+    svm_model = joblib.load(os.path.join(base, 'svm_model.pkl'))
+    scaler = joblib.load(os.path.join(base, 'scaler.pkl'))
+
+    metrics = {}
+    if os.path.exists(os.path.join(base, 'version.json')):
+        with open(os.path.join(base, 'version.json')) as f:
+            metrics = json.load(f).get('metrics') or {}
+    elif os.path.exists(os.path.join(base, args.metrics)):
+        with open(os.path.join(base, args.metrics)) as f:
+            metrics = json.load(f)
+    print(f"Base model loaded from '{base}' ({svm_model.n_support_.sum() if hasattr(svm_model, 'n_support_') else '?'} "
+          f"support vectors, trained on {metrics.get('feedback_rows', 0)} feedback rows).")
+    return svm_model, scaler, metrics, base
+
+
+def load_feedback(store_dir, since=0):
+    """
+    Loads the feedback store's rows of the current feature version.
+
+    A clip labelled more than once keeps its latest label. A fixed fifth of
+    the clips (chosen by content hash) is held out for testing, so no run
+    trains on a clip that another run tested on.
+
+    Returns:
+        tuple: (X, y, new, test, rows) where new marks rows appended at index
+        position `since` or later (after the base model was trained) and rows
+        is the store's total row count (the next run's `since`).
+    """
+    store = FeatureStore(store_dir)
+    index = store.index()
+    latest = {}
+    for position, row in enumerate(index):
+        if row['feature_version'] == FEATURE_VERSION:
+            latest[row['content_hash'] or row['path']] = position
+    positions = sorted(latest.values())
+    if not positions:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=int), np.empty(0, bool), np.empty(0, bool), len(index)
+
+    X = np.vstack([store.shard(index[p]['shard'])[index[p]['offset']] for p in positions]).astype(np.float32)
+    y = np.array([index[p]['label'] for p in positions])
+    new = np.array([p >= since for p in positions])
+    keys = [index[p]['content_hash'] or index[p]['path'] for p in positions]
+    test = np.array([int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % 5 == 0 for key in keys])
+    return X, y, new, test, len(index)
+
+
+def support_set(svm_model):
+    """
+    The base SVM's support vectors (already scaled) with their labels: the
+    only training points its decision function depends on.
+    """
+    labels = np.where(svm_model.dual_coef_[0] > 0, svm_model.classes_[1], svm_model.classes_[0])
+    return svm_model.support_vectors_, labels
+
+
+def _report_entry(svm_model, scaler, X_test, y_test, feedback_test, fit_time, train_samples):
+    X_test_scaled = scaler.transform(X_test)
+    start = time.perf_counter()
+    y_pred = svm_model.predict(X_test_scaled)
+    latency = (time.perf_counter() - start) / len(X_test) * 1e6
+    return {
+        'test_accuracy': float(accuracy_score(y_test, y_pred)),
+        'feedback_test_accuracy': float(accuracy_score(y_test[feedback_test], y_pred[feedback_test]))
+        if feedback_test.any() else None,
+        'fit_time_s': fit_time,
+        'train_samples': int(train_samples),
+        'n_support': int(svm_model.n_support_.sum()),
+        'latency_us_per_sample': latency,
+    }
+
+
+def train_incremental(args):
+    """
+    Updates the base model with the feedback that arrived since it was
+    trained, instead of refitting on everything.
+
+    The new SVM is fitted on the base model's support vectors plus the new
+    feedback, with the base scaler and kernel width kept. Points that were
+    not support vectors cannot change an SVM's decision function, so this
+    fit covers the old data at a fraction of its size. A full refit on all
+    data is trained alongside for comparison, unless --no-full-refit is set.
+    Every model is scored on the original held-out split plus the held-out
+    feedback.
+    """
+    svm_model, scaler, base_metrics, base = load_base(args)
+    if not hasattr(svm_model, 'support_vectors_'):
+        print("!!! ERROR: Incremental training needs an exact RBF SVC as the base model.")
+        return None
+    # Its support vectors are mixed with current-version feedback, registered or not
+    feature_version = registry_feature_version(args, base)
+    if feature_version is None:
+        return None
+
+    X_fb, y_fb, new, test, rows = load_feedback(args.feedback, base_metrics.get('feedback_rows', 0))
+    train_new = new & ~test
+    print(f"Feedback: {len(y_fb)} clips, {int(new.sum())} new since the base model "
+          f"({int(train_new.sum())} to train on, {int(test.sum())} held out).")
+    if not train_new.any():
+        print("No new feedback to train on; the base model stays as it is.")
+        return None
+
+    # Evaluation set: the original data's held-out split plus every held-out feedback clip
+    X_src, y_src = load_source('features', args)
+    if X_src is None:
+        return None
+    X_src_train, X_src_test, y_src_train, y_src_test = train_test_split(
+        X_src, y_src, test_size=0.2, random_state=42, stratify=y_src
+    )
+    X_test = np.vstack([X_src_test, X_fb[test]])
+    y_test = np.concatenate([y_src_test, y_fb[test]])
+    feedback_test = np.arange(len(y_test)) >= len(y_src_test)
+
+    report = {'base': _report_entry(svm_model, scaler, X_test, y_test, feedback_test, None, 0)}
+
+    # 1. Incremental: support set + new feedback
+    X_sv, y_sv = support_set(svm_model)
+    X_train = np.vstack([X_sv, scaler.transform(X_fb[train_new])])
+    y_train = np.concatenate([y_sv, y_fb[train_new]])
+    print(f"Incremental fit on {len(X_sv)} support vectors + {int(train_new.sum())} new clips...")
+    start = time.perf_counter()
+    incremental = SVC(kernel='rbf', C=svm_model.C, gamma=svm_model._gamma, random_state=42).fit(X_train, y_train)
+    report['incremental'] = _report_entry(incremental, scaler, X_test, y_test, feedback_test,
+                                          time.perf_counter() - start, len(X_train))
+    models = {'incremental': (incremental, scaler)}
+
+    # 2. Full refit on everything: the original training split and all training feedback, new scaler
+    if not args.no_full_refit:
+        X_full = np.vstack([X_src_train, X_fb[~test]])
+        y_full = np.concatenate([y_src_train, y_fb[~test]])
+        print(f"Full refit on {len(X_full)} clips for comparison...")
+        start = time.perf_counter()
+        full_scaler = StandardScaler().fit(X_full)
+        full = SVC(kernel='rbf', C=svm_model.C, gamma=svm_model.gamma, random_state=42)
+        full.fit(full_scaler.transform(X_full), y_full)
+        report['full_refit'] = _report_entry(full, full_scaler, X_test, y_test, feedback_test,
+                                             time.perf_counter() - start, len(X_full))
+        models['full_refit'] = (full, full_scaler)
+
+    print_incremental_report(report)
+
+    # 3. Save the chosen model as a candidate; the served files are left alone
+    keep = 'full_refit' if args.keep == 'full' else 'incremental'
+    if keep not in models:
+        print("!!! ERROR: --keep full needs the full refit (drop --no-full-refit).")
+        return report
+    chosen, chosen_scaler = models[keep]
+    metrics = {
+        'params': {'C': chosen.C, 'gamma': chosen.gamma},
+        'test_accuracy': report[keep]['test_accuracy'],
+        'fit_time_s': report[keep]['fit_time_s'],
+        'n_support': report[keep]['n_support'],
+        'latency_us_per_sample': report[keep]['latency_us_per_sample'],
+        'samples': report[keep]['train_samples'],
+        'n_features': int(X_fb.shape[1]),
+        'feedback_rows': rows,
+        'base': os.path.abspath(base),
+        'kept': keep,
+        'incremental_report': report,
+    }
+    metrics_path = args.metrics.replace('.json', '_incremental.json')
+    joblib.dump(chosen, 'svm_model_incremental.pkl')
+    joblib.dump(chosen_scaler, 'scaler_incremental.pkl')
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f, indent=2)
+    print(f"Candidate ({keep}) saved: 'svm_model_incremental.pkl', 'scaler_incremental.pkl' and '{metrics_path}'")
+
+    if args.register:
+        # Shadow-scored next to the served version until someone promotes it
+        registry = ModelRegistry(args.registry)
+        version = registry.register('svm_model_incremental.pkl', 'scaler_incremental.pkl', metrics_path,
+                                    feature_version=feature_version,
+                                    note=f"{keep} update with {int(train_new.sum())} feedback clips")
+        registry.set_candidate(version)
+        print(f"Registered as {version} and set as the shadow candidate. "
+              f"Serve it with: python model_registry.py promote {version}")
+    return report
+
+
+def print_incremental_report(report):
+    """Prints held-out accuracy and fit cost of the base, incremental and fully refitted models."""
+    print("\n" + "="*86)
+    print(f"{'model':>12} {'accuracy':>9} {'feedback acc':>13} {'fit (s)':>8} {'train rows':>11} "
+          f"{'support vecs':>13} {'latency (us)':>13}")
+    print("-"*86)
+    for name, m in report.items():
+        fit = f"{m['fit_time_s']:.3f}" if m['fit_time_s'] is not None else '-'
+        feedback = f"{m['feedback_test_accuracy']*100:.2f}%" if m['feedback_test_accuracy'] is not None else '-'
+        print(f"{name:>12} {m['test_accuracy']*100:>8.2f}% {feedback:>13} {fit:>8} {m['train_samples']:>11} "
+              f"{m['n_support']:>13} {m['latency_us_per_sample']:>13.1f}")
+    if 'full_refit' in report:
+        speedup = report['full_refit']['fit_time_s'] / max(report['incremental']['fit_time_s'], 1e-9)
+        print("-"*86)
+        print(f"Incremental fit was {speedup:.1f}x faster than the full refit "
+              f"({(report['incremental']['test_accuracy'] - report['full_refit']['test_accuracy'])*100:+.2f} "
+              f"points of accuracy).")
+    print("="*86)
 
 
 # --- Main Execution ---
 if __name__ == '__main__':
-    # 1. Load Data
-    X, y = load_data()
-    
-    if X is None:
-        exit() # Stop if data loading failed
+    parser = argparse.ArgumentParser(description="Train the Echoguard SVM.")
+    parser.add_argument('--source', nargs='+', choices=['features'] + sorted(tabular_source.SOURCES),
+                        default=['features'],
+                        help="Training data: 'features' (our 78-dim vectors) and/or pre-extracted tables "
+                             "such as 'kaggle'; several sources are trained and compared side by side")
+    parser.add_argument('--columns', nargs='+', default=None,
+                        help="Columns to use from a table source (default: the source's configured selection)")
+    parser.add_argument('--rebuild-cache', action='store_true', help="Re-parse table sources' CSV files")
+    parser.add_argument('--store', default=None,
+                        help="Train from a feature store directory instead of X_features.npy / y_labels.npy")
+    parser.add_argument('--feature-version', default=None,
+                        help="Feature version of the training rows: filters --store rows (default: the current "
+                             "one, 'all' mixes every version) and is what --register records. Required with "
+                             "--register when training from X_features.npy")
+    parser.add_argument('--search', choices=['grid', 'halving'], default=None,
+                        help="Pick C/gamma by stratified k-fold search instead of the fixed C=10, gamma='scale'")
+    parser.add_argument('--C', type=float, nargs='+', default=[0.1, 1, 10, 100], help="C values to search")
+    parser.add_argument('--gamma', type=_parse_gamma, nargs='+', default=['scale', 0.001, 0.01, 0.1],
+                        help="gamma values to search ('scale', 'auto' or numbers)")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Parallel fits for the search (-1 = all cores)")
+    parser.add_argument('--cache-mb', type=int, default=2000, help="Total kernel cache memory for the search")
+    parser.add_argument('--metrics', default='model_metrics.json', help="Where to save the chosen model's metrics")
+    parser.add_argument('--approx-components', type=int, default=0,
+                        help="Also train the approximate Nystroem engine with this many components (0 = off)")
+    parser.add_argument('--approx-C', type=float, default=1.0, help="C of the approximate engine's linear SVM")
+    parser.add_argument('--register', action='store_true',
+                        help="Also add the served model to the model registry as a new version (see model_registry.py)")
+    parser.add_argument('--registry', default=os.environ.get('ECHOGUARD_REGISTRY') or REGISTRY_DIR,
+                        help="Model registry directory")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Update the served model with new feedback instead of training from scratch")
+    parser.add_argument('--feedback', default=os.environ.get('ECHOGUARD_FEEDBACK_STORE') or 'feedback_store',
+                        help="Feedback store (written by POST /feedback or Echoguard.py --store)")
+    parser.add_argument('--base', default=None,
+                        help="Directory of the model to update (default: the registry's served version, "
+                             "else the current directory)")
+    parser.add_argument('--keep', choices=['incremental', 'full'], default='incremental',
+                        help="Which of the two --incremental models to save as the candidate")
+    parser.add_argument('--no-full-refit', action='store_true',
+                        help="Skip the full refit that --incremental compares against (daily runs on a budget)")
+    args = parser.parse_args()
 
-    # 2. Preprocess and Split
-    # The 'scaler' object is now returned here
-    X_train, X_test, y_train, y_test, scaler = preprocess_and_split(X, y) 
-    
-    if X_train is None:
-        exit() # Stop if splitting failed
+    if args.incremental:
+        train_incremental(args)
+        sys.exit()
 
-    # 3. Model Training
-    svm_model = train_model(X_train, y_train)
+    if args.register and 'features' in args.source:
+        # Checked before training: the registry trusts the recorded version
+        feature_version = registry_feature_version(args)
+        if feature_version is None:
+            sys.exit(1)
 
-    # 4. Evaluation
-    evaluate_model(svm_model, X_test, y_test)
-    
-    # --- 5. Save the Model and Scaler for Deployment --- <--- ADDED SECTION
-    print("\nSaving model and scaler for web deployment...")
-    joblib.dump(svm_model, 'svm_model.pkl')
-    joblib.dump(scaler, 'scaler.pkl')
-    print("Files saved: 'svm_model.pkl' and 'scaler.pkl'")
\ No newline at end of file
+    results = {}
+    for source in args.source:
+        # 1. Load Data
+        X, y = load_source(source, args)
+        if X is None:
+            exit() # Stop if data loading failed
+
+        # 2.-4. Split, train and evaluate
+        svm_model, scaler, approx_model, metrics = train_on(X, y, args)
+        metrics['source'] = source
+        results[source] = metrics
+
+        # --- 5. Save the Model and Scaler for Deployment --- <--- ADDED SECTION
+        # Only our own features can be served: the API extracts 78-dim vectors from audio.
+        # Models trained on other sources are saved next to them for experiments.
+        suffix = '' if source == 'features' else f'_{source}'
+        metrics_path = args.metrics if not suffix else args.metrics.replace('.json', f'{suffix}.json')
+        print("\nSaving model and scaler for web deployment..." if not suffix else
+              f"\nSaving the '{source}' model (not served by the API)...")
+        joblib.dump(svm_model, f'svm_model{suffix}.pkl')
+        joblib.dump(scaler, f'scaler{suffix}.pkl')
+        if approx_model is not None:
+            # Served with ECHOGUARD_ENGINE=approx
+            joblib.dump(approx_model, f'approx_model{suffix}.pkl')
+            print(f"Approximate engine saved: 'approx_model{suffix}.pkl'")
+        with open(metrics_path, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        print(f"Files saved: 'svm_model{suffix}.pkl', 'scaler{suffix}.pkl' and '{metrics_path}'")
+
+        if args.register and not suffix:
+            # A running API only switches once the version is promoted
+            version = ModelRegistry(args.registry).register(
+                'svm_model.pkl', 'scaler.pkl', metrics_path, feature_version=feature_version)
+            print(f"Registered as {version} in '{args.registry}'. "
+                  f"Serve it with: python model_registry.py promote {version}")
+
+    if len(results) > 1:
+        print_source_report(results)
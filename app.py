@@ -1,18 +1,562 @@
+import time
+# Measured from here so /ready can report how long startup took
+STARTED_AT = time.perf_counter()
+
 import os
-import joblib
-import numpy as np
+import json
+import uuid
+import shutil
+import asyncio
+import random
+import hashlib
+import socket
 import tempfile
-import wave
-import librosa
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import ipaddress
+import urllib.parse
+import urllib.request
+from typing import List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+
+import inference
+from audio_io import is_archive, read_archive
+from inference import SCALER_PATH
+from worker_pool import WorkerPool, PoolFullError
+from result_cache import ResultCache, model_fingerprint
+from job_queue import JobQueue, ClientLimitError
+from compiled_model import CompiledSVM
+from calibration import Calibration, CLASS_NAMES, model_id
+from vector_index import VectorIndex
+from model_registry import ModelRegistry
+from feature_store import FeatureStore
+from features import FEATURE_VERSION
+from streaming import StreamingFeatureExtractor
+from metrics import Registry, Counter, Histogram, Gauge, DURATION_BUCKETS, server_timing
+
+# Worker pool settings (all optional)
+#   ECHOGUARD_WORKERS      number of worker processes (default: CPU count)
+#   ECHOGUARD_MAX_QUEUE    requests allowed to wait for a worker (default: 4 per worker)
+#   ECHOGUARD_RETRY_AFTER  seconds clients are told to back off when the queue is full
+WORKERS = int(os.environ.get("ECHOGUARD_WORKERS", "0")) or None
+MAX_QUEUE = os.environ.get("ECHOGUARD_MAX_QUEUE")
+MAX_QUEUE = int(MAX_QUEUE) if MAX_QUEUE else None
+RETRY_AFTER = int(os.environ.get("ECHOGUARD_RETRY_AFTER", "5"))
+#   ECHOGUARD_MAX_BATCH    most clips accepted by one /predict/batch call
+MAX_BATCH = int(os.environ.get("ECHOGUARD_MAX_BATCH", "256"))
+#   ECHOGUARD_MAX_ARCHIVE_MB  most bytes one uploaded zip/tar may unpack to (default 512)
+MAX_ARCHIVE_BYTES = int(float(os.environ.get("ECHOGUARD_MAX_ARCHIVE_MB", "512")) * 1024 * 1024)
+#   ECHOGUARD_FLOAT32      score in float32 instead of float64 (slightly faster)
+FLOAT32 = os.environ.get("ECHOGUARD_FLOAT32", "0") == "1"
+
+# Result cache settings (all optional)
+#   ECHOGUARD_CACHE_MB     memory for cached results per worker (default 64, 0 disables)
+#   ECHOGUARD_CACHE_TTL    seconds a cached result stays valid (default 3600)
+#   ECHOGUARD_CACHE_DIR    directory for an on-disk tier shared by all uvicorn workers
+CACHE_MB = float(os.environ.get("ECHOGUARD_CACHE_MB", "64"))
+CACHE_TTL = int(os.environ.get("ECHOGUARD_CACHE_TTL", "3600"))
+CACHE_DIR = os.environ.get("ECHOGUARD_CACHE_DIR") or None
+
+#   ECHOGUARD_STREAM_INTERVAL  seconds of audio between rolling scores on /stream (default 2)
+STREAM_INTERVAL = float(os.environ.get("ECHOGUARD_STREAM_INTERVAL", "2"))
+
+# Long audio (all optional)
+#   ECHOGUARD_MAX_SECONDS      longest audio accepted by /predict, /predict/batch and /stream
+#                              (default 3600, 0 = no limit)
+#   ECHOGUARD_LONG_AUDIO_MB    uploads larger than this are spooled to disk and decoded block by
+#                              block in the worker, so memory does not grow with duration (default 16)
+MAX_SECONDS = float(os.environ.get("ECHOGUARD_MAX_SECONDS", "3600")) or None
+LONG_AUDIO_BYTES = int(float(os.environ.get("ECHOGUARD_LONG_AUDIO_MB", "16")) * 1024 * 1024)
+
+#   ECHOGUARD_ENGINE           "exact" (svm_model.pkl, default) or "approx" (approx_model.pkl,
+#                              Nystroem + linear, fixed cost per request)
+ENGINE = os.environ.get("ECHOGUARD_ENGINE", "exact")
+if ENGINE not in ("exact", "approx"):
+    raise ValueError(f"ECHOGUARD_ENGINE must be 'exact' or 'approx', got {ENGINE!r}")
+MODEL_PATH = inference.APPROX_MODEL_PATH if ENGINE == "approx" else inference.MODEL_PATH
+
+#   ECHOGUARD_MODEL_EXPORT     directory written by `python compiled_model.py export`; when set,
+#                              every worker memory-maps it instead of unpickling the .pkl files
+MODEL_EXPORT = os.environ.get("ECHOGUARD_MODEL_EXPORT") or None
+
+#   ECHOGUARD_CALIBRATION      calibration.json written by `python calibration.py`: confidence becomes
+#                              a calibrated P(label) and FAKE is called at its threshold
+#                              (default ./calibration.json when present)
+CALIBRATION_PATH = os.environ.get("ECHOGUARD_CALIBRATION") or os.path.join(inference.BASE_DIR, "calibration.json")
+
+# Known-sample index (all optional)
+#   ECHOGUARD_INDEX_DIR        vector index written by `python vector_index.py build`; every verdict
+#                              lists the nearest known clips (default ./vector_index when present)
+#   ECHOGUARD_INDEX_K          neighbours returned per verdict (default 5)
+#   ECHOGUARD_MATCH_DISTANCE   a known FAKE at most this far away (in scaled feature space) makes the
+#                              verdict FAKE outright (default 0 = only report the neighbours)
+INDEX_DIR = os.environ.get("ECHOGUARD_INDEX_DIR") or os.path.join(inference.BASE_DIR, "vector_index")
+INDEX_K = int(os.environ.get("ECHOGUARD_INDEX_K", "5"))
+MATCH_DISTANCE = float(os.environ.get("ECHOGUARD_MATCH_DISTANCE", "0"))
+
+# Model registry (all optional)
+#   ECHOGUARD_REGISTRY         directory managed by `python model_registry.py`; when set, its CURRENT
+#                              version is served and a newly promoted one is swapped in without a restart
+#   ECHOGUARD_REGISTRY_POLL    seconds between checks of the registry pointers (default 2)
+#   ECHOGUARD_SHADOW_RATE      share of /predict uploads also scored on the CANDIDATE version, on idle
+#                              workers only, to compare latency and agreement (default 0.1)
+REGISTRY_DIR = os.environ.get("ECHOGUARD_REGISTRY") or None
+REGISTRY_POLL = float(os.environ.get("ECHOGUARD_REGISTRY_POLL", "2"))
+SHADOW_RATE = float(os.environ.get("ECHOGUARD_SHADOW_RATE", "0.1"))
+# Dummy inferences a new version runs in every worker before it takes traffic
+PREWARM_RUNS = 3
+
+# Feedback for retraining (all optional)
+#   ECHOGUARD_FEEDBACK_STORE   feature store POST /feedback appends labelled clips to (unset = endpoint off);
+#                              `trainmodel.py --incremental --feedback <dir>` retrains from it
+#   ECHOGUARD_FEEDBACK_TOKEN   when set, POST /feedback requires it in the X-Feedback-Token header
+FEEDBACK_STORE = os.environ.get("ECHOGUARD_FEEDBACK_STORE") or None
+FEEDBACK_TOKEN = os.environ.get("ECHOGUARD_FEEDBACK_TOKEN") or None
+FEEDBACK = FeatureStore(FEEDBACK_STORE) if FEEDBACK_STORE else None
+
+# Job queue for large uploads (all optional)
+#   ECHOGUARD_JOBS_DIR             SQLite queue + spooled inputs, shared by all uvicorn workers (default ./jobs)
+#   ECHOGUARD_JOB_WORKERS          jobs run at once by this process (default: worker pool size)
+#   ECHOGUARD_JOB_CLIENT_RUNNING   jobs one client may have running at once (default 2)
+#   ECHOGUARD_JOB_CLIENT_QUEUED    unfinished jobs one client may have (default 20, then 429)
+#   ECHOGUARD_JOB_TTL              seconds finished jobs (and their dedup entries) are kept (default 86400)
+#   ECHOGUARD_CALLBACK_ALLOW       comma-separated hosts callback_url may name even though they resolve to
+#                                  loopback, private or link-local addresses (default: none)
+JOBS_DIR = os.environ.get("ECHOGUARD_JOBS_DIR") or os.path.join(inference.BASE_DIR, "jobs")
+JOB_WORKERS = int(os.environ.get("ECHOGUARD_JOB_WORKERS", "0")) or None
+JOB_CLIENT_RUNNING = int(os.environ.get("ECHOGUARD_JOB_CLIENT_RUNNING", "2"))
+JOB_CLIENT_QUEUED = int(os.environ.get("ECHOGUARD_JOB_CLIENT_QUEUED", "20"))
+JOB_TTL = int(os.environ.get("ECHOGUARD_JOB_TTL", "86400"))
+CALLBACK_ALLOW = {h.strip().lower() for h in os.environ.get("ECHOGUARD_CALLBACK_ALLOW", "").split(",") if h.strip()}
+CALLBACK_SENDERS = 4
+JOB_POLL_SECONDS = 0.5
+JOB_PURGE_SECONDS = 600
+
+# Instrumentation (all optional)
+#   ECHOGUARD_SERVER_TIMING    set to 0 to drop the per-request Server-Timing header
+#   ECHOGUARD_SLOW_MS          log the stage breakdown of requests slower than this (0 disables)
+SERVER_TIMING = os.environ.get("ECHOGUARD_SERVER_TIMING", "1") == "1"
+SLOW_MS = float(os.environ.get("ECHOGUARD_SLOW_MS", "0"))
+
+# Startup timings reported by /ready
+STARTUP = {"import_s": round(time.perf_counter() - STARTED_AT, 3)}
+READY = False
+
+REGISTRY = ModelRegistry(REGISTRY_DIR) if REGISTRY_DIR else None
+VERSION = REGISTRY.current() if REGISTRY is not None else None
+if VERSION is not None:
+    # The registry's served version takes the place of the static model files
+    MODEL_EXPORT = REGISTRY.export_dir(VERSION)
+
+# Load model & scaler (look in root project directory)
 try:
-    from scipy.io import wavfile
-    SCIPY_AVAILABLE = True
-except ImportError:
-    SCIPY_AVAILABLE = False
+    loaded_at = time.perf_counter()
+    # Scored in-process by the /stream websocket (blocks are small)
+    COMPILED = inference.load_compiled(MODEL_PATH, SCALER_PATH, FLOAT32, MODEL_EXPORT)
+    STARTUP["model_load_s"] = round(time.perf_counter() - loaded_at, 3)
+    source = f"registry version {VERSION}" if VERSION else "memory-mapped export" if MODEL_EXPORT else ENGINE + " engine"
+    print(f"Model loaded ({source}).")
+except Exception as e:
+    print(f"Model/scaler load error: {e}")
+    COMPILED = None
+
+
+def load_calibration(path, compiled):
+    """Loads a calibration if it was fitted on this model, else returns None (saying why)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        calibration = Calibration.load(path)
+    except Exception as e:
+        print(f"Calibration load error: {e}")
+        return None
+    if calibration.model_id != model_id(compiled):
+        print(f"Calibration '{path}' was fitted on a different model; ignoring it.")
+        return None
+    print(f"Calibration loaded (threshold {calibration.threshold:.4f}).")
+    return calibration
+
+
+def _calibration_path(version):
+    """A registry version's own calibration.json if it has one, else ECHOGUARD_CALIBRATION."""
+    if version is not None:
+        own = os.path.join(REGISTRY.path(version), "calibration.json")
+        if os.path.exists(own):
+            return own
+    return CALIBRATION_PATH
+
+
+# Memory-mapped, so every uvicorn worker shares one copy; inserts and compactions are picked up live
+INDEX = None
+if COMPILED is not None and os.path.exists(os.path.join(INDEX_DIR, "meta.json")):
+    try:
+        INDEX = VectorIndex(INDEX_DIR)
+        if INDEX.model_id != model_id(COMPILED):
+            print(f"Vector index '{INDEX_DIR}' was built with a different model's scaler; "
+                  "it is used only by a version with the same scaler.")
+        else:
+            print(f"Vector index loaded ({len(INDEX)} vectors).")
+    except Exception as e:
+        print(f"Vector index load error: {e}")
+        INDEX = None
+
+
+def _fingerprint(export_dir=None):
+    if export_dir:
+        files = [os.path.join(export_dir, name + ".npy") for name in CompiledSVM.ARRAYS]
+        return model_fingerprint(*files, os.path.join(export_dir, "meta.json"))
+    return model_fingerprint(MODEL_PATH, SCALER_PATH, extra=f"float32={FLOAT32}")
+
+
+class ServingModel:
+    """
+    One model version and everything tied to it: the compiled arrays (for
+    /stream and index lookups), its calibration, its result-cache
+    fingerprint and the vector index if it was built with this scaler.
+
+    Handlers read ACTIVE once and use that object throughout, so a hot swap
+    never mixes two versions within one response; the swap itself is one
+    assignment on the event loop.
+    """
+
+    def __init__(self, version, compiled, model_dir, fingerprint, calibration=None):
+        self.version = version
+        self.compiled = compiled
+        # Sent with every pool job (None = the model the workers were started with)
+        self.model_dir = model_dir
+        self.fingerprint = fingerprint
+        self.calibration = calibration
+        self.model_id = model_id(compiled)
+        self.index = INDEX if INDEX is not None and INDEX.model_id == self.model_id else None
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_registry(cls, version):
+        info = REGISTRY.info(version)
+        if info is None:
+            raise ValueError(f"Version {version!r} is not registered.")
+        if info["feature_version"] != FEATURE_VERSION:
+            raise ValueError(f"{version} expects features {info['feature_version']!r}, "
+                             f"this server extracts {FEATURE_VERSION!r}.")
+        export_dir = REGISTRY.export_dir(version)
+        compiled = REGISTRY.load(version)
+        return cls(version, compiled, export_dir, _fingerprint(export_dir),
+                   load_calibration(_calibration_path(version), compiled))
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "model_id": self.model_id,
+            "calibration": {"threshold": self.calibration.threshold} if self.calibration else None,
+            "vector_index": self.index is not None,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ShadowStats:
+    """Running comparison of the served version with the shadow candidate (recent window)."""
+
+    def __init__(self, active, candidate, window=500):
+        self.active = active
+        self.candidate = candidate
+        self.compared = 0
+        self.agreed = 0
+        self.skipped_busy = 0
+        self.errors = 0
+        self.seconds = {"active": deque(maxlen=window), "candidate": deque(maxlen=window)}
+        self.score_deltas = deque(maxlen=window)
+
+    def record(self, agreed, active_seconds, candidate_seconds, score_delta):
+        self.compared += 1
+        self.agreed += agreed
+        self.seconds["active"].append(active_seconds)
+        self.seconds["candidate"].append(candidate_seconds)
+        self.score_deltas.append(score_delta)
+
+    def snapshot(self):
+        def p50_ms(values):
+            return round(float(np.median(values)) * 1000, 3) if values else None
+
+        return {
+            "active": self.active,
+            "candidate": self.candidate,
+            "compared": self.compared,
+            "agreement": round(self.agreed / self.compared, 4) if self.compared else None,
+            "skipped_busy": self.skipped_busy,
+            "errors": self.errors,
+            "active_p50_ms": p50_ms(self.seconds["active"]),
+            "candidate_p50_ms": p50_ms(self.seconds["candidate"]),
+            "mean_abs_score_delta": round(float(np.mean(self.score_deltas)), 4) if self.score_deltas else None,
+        }
+
+
+# The version answering requests, and the one shadow-scored next to it
+ACTIVE = None
+if COMPILED is not None:
+    ACTIVE = ServingModel(VERSION, COMPILED, MODEL_EXPORT, _fingerprint(MODEL_EXPORT),
+                          load_calibration(_calibration_path(VERSION), COMPILED))
+CANDIDATE = None
+SHADOW = None
+# Keeps fire-and-forget shadow jobs referenced until they finish
+SHADOW_TASKS = set()
+
+
+CACHE = ResultCache(
+    max_bytes=int(CACHE_MB * 1024 * 1024),
+    ttl=CACHE_TTL,
+    disk_dir=CACHE_DIR,
+    fingerprint=ACTIVE.fingerprint if ACTIVE is not None else "",
+)
+
+JOBS = JobQueue(
+    JOBS_DIR,
+    fingerprint=CACHE.fingerprint,
+    max_running_per_client=JOB_CLIENT_RUNNING,
+    max_queued_per_client=JOB_CLIENT_QUEUED,
+    ttl=JOB_TTL,
+)
+
+POOL = WorkerPool(
+    workers=WORKERS,
+    max_queue=MAX_QUEUE,
+    initializer=inference.init_worker,
+    initargs=(MODEL_PATH, SCALER_PATH, FLOAT32, MODEL_EXPORT),
+)
+
+
+# --- Metrics (exposed on /metrics) ---
+METRICS = Registry()
+REQUEST_SECONDS = METRICS.register(Histogram(
+    "echoguard_request_seconds", "Time to answer an HTTP request.", ["endpoint", "status"]))
+STAGE_SECONDS = METRICS.register(Histogram(
+    "echoguard_stage_seconds",
+    "Time spent per inference stage (upload_read, queue_wait, decode, resample, features, scale, score, match).",
+    ["endpoint", "stage"]))
+AUDIO_SECONDS = METRICS.register(Histogram(
+    "echoguard_audio_duration_seconds", "Duration of decoded input audio.", buckets=DURATION_BUCKETS))
+ERRORS = METRICS.register(Counter(
+    "echoguard_errors", "Failed requests and clips by error type.", ["endpoint", "type"]))
+CACHE_LOOKUPS = METRICS.register(Counter(
+    "echoguard_cache_lookups", "Result cache lookups by outcome.", ["result"]))
+DECODE_PATHS = METRICS.register(Counter(
+    "echoguard_decode_paths", "Decoded clips by path (native, resampled, decoder; see audio_io.py).",
+    ["endpoint", "path"]))
+INDEX_MATCHES = METRICS.register(Counter(
+    "echoguard_index_matches", "Verdicts made FAKE by a known FAKE within ECHOGUARD_MATCH_DISTANCE."))
+MODEL_SWAPS = METRICS.register(Counter(
+    "echoguard_model_swaps", "Registry versions swapped in without a restart."))
+SHADOW_COMPARISONS = METRICS.register(Counter(
+    "echoguard_shadow_comparisons", "Uploads also scored on the shadow candidate, by verdict agreement.",
+    ["result"]))
+SHADOW_SECONDS = METRICS.register(Histogram(
+    "echoguard_shadow_inference_seconds",
+    "Worker time (decode to score) of shadow-compared uploads on the served and candidate versions.",
+    ["model"]))
+METRICS.register(Gauge("echoguard_pool_in_flight", "Jobs running or waiting in the worker pool.",
+                       lambda: POOL.stats()["in_flight"]))
+METRICS.register(Gauge("echoguard_pool_queue_depth", "Jobs waiting for a free worker.",
+                       lambda: POOL.queue_depth))
+# JOBS.stats() queries SQLite: /metrics reads it once per scrape, off the event loop
+JOB_STATS = {}
+METRICS.register(Gauge("echoguard_jobs_queued", "Queued /jobs waiting to run.",
+                       lambda: JOB_STATS.get("queued", 0)))
+METRICS.register(Gauge("echoguard_jobs_running", "/jobs currently running.",
+                       lambda: JOB_STATS.get("running", 0)))
+METRICS.register(Gauge("echoguard_jobs_oldest_queued_seconds", "Age of the oldest queued job.",
+                       lambda: JOB_STATS.get("oldest_queued_seconds", 0.0)))
+
+
+# Stages timed inside the pool workers
+WORKER_STAGES = ("decode", "resample", "features", "scale", "score")
+
+
+def record_stages(request, endpoint, timings):
+    """
+    Adds worker-side stage timings to the histograms and to the request's
+    breakdown (request is None for queued jobs).
+    """
+    for stage in WORKER_STAGES:
+        if stage in timings:
+            STAGE_SECONDS.observe(timings[stage], endpoint, stage)
+            if request is not None:
+                request.state.timings[stage] = request.state.timings.get(stage, 0.0) + timings[stage]
+    if "audio_seconds" in timings:
+        AUDIO_SECONDS.observe(timings["audio_seconds"])
+    if "decode_path" in timings:
+        DECODE_PATHS.inc(endpoint, timings["decode_path"])
+
+
+def record_stage(request, endpoint, stage, seconds):
+    STAGE_SECONDS.observe(seconds, endpoint, stage)
+    if request is not None:
+        request.state.timings[stage] = request.state.timings.get(stage, 0.0) + seconds
+
+
+async def warm_up():
+    """
+    Imports librosa and runs a first inference in this process and in every
+    pool worker, in the background, so the server can accept connections
+    (and answer /) while the heavy imports happen.
+    """
+    global READY
+    warm_started = time.perf_counter()
+    try:
+        STARTUP["api_process"] = await run_in_threadpool(inference.warm_up)
+        # One job per worker forces every worker process to spawn and warm up
+        results = await asyncio.gather(*[POOL.submit(inference.warm_up) for _ in range(POOL.workers)])
+        STARTUP["workers"] = [result for result, _ in results]
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        STARTUP["warm_up_error"] = str(e)
+        return
+    STARTUP["warm_up_s"] = round(time.perf_counter() - warm_started, 3)
+    STARTUP["ready_s"] = round(time.perf_counter() - STARTED_AT, 3)
+    READY = True
+    print(f"Ready for inference after {STARTUP['ready_s']}s.")
+
+
+# --- Hot swaps from the model registry ---
+def _prewarm_local(compiled):
+    vector = np.zeros(compiled.n_features)
+    for _ in range(PREWARM_RUNS):
+        compiled.predict(vector)
+
+
+async def prewarm(serving):
+    """
+    Runs PREWARM_RUNS dummy inferences of a version here and on every pool
+    worker, so its arrays are paged in before it takes traffic. A worker
+    that misses its warm-up job loads the version on its first request.
+    """
+    await run_in_threadpool(_prewarm_local, serving.compiled)
+    await asyncio.gather(*[
+        POOL.submit(inference.warm_up, serving.model_dir, PREWARM_RUNS) for _ in range(POOL.workers)
+    ])
+
+
+async def activate(version):
+    """Loads and pre-warms a registry version while the old one keeps serving, then swaps it in."""
+    global ACTIVE, CANDIDATE, SHADOW
+    started = time.perf_counter()
+    serving = await run_in_threadpool(ServingModel.from_registry, version)
+    await prewarm(serving)
+
+    previous, ACTIVE = ACTIVE, serving
+    CACHE.fingerprint = JOBS.fingerprint = serving.fingerprint
+    if CANDIDATE is not None and CANDIDATE.version == version:
+        CANDIDATE, SHADOW = None, None
+    elif CANDIDATE is not None:
+        SHADOW = ShadowStats(version, CANDIDATE.version)
+    MODEL_SWAPS.inc()
+    print(f"Now serving {version} (was {previous.version if previous else None}); "
+          f"loaded and pre-warmed in {time.perf_counter() - started:.2f}s.")
+
+
+async def set_candidate(version):
+    """Loads and pre-warms the shadow candidate (None stops shadow scoring)."""
+    global CANDIDATE, SHADOW
+    if version is None:
+        if CANDIDATE is not None:
+            print(f"Stopped shadow scoring {CANDIDATE.version}: {SHADOW.snapshot()}")
+        CANDIDATE, SHADOW = None, None
+        return
+    candidate = await run_in_threadpool(ServingModel.from_registry, version)
+    await prewarm(candidate)
+    CANDIDATE, SHADOW = candidate, ShadowStats(ACTIVE.version, version)
+    print(f"Shadow scoring {version} on {SHADOW_RATE:.0%} of /predict uploads.")
+
+
+async def registry_watcher():
+    """
+    Background loop: polls the registry pointers and follows them. A version
+    that fails to load is reported once and skipped until a pointer names
+    another one; a busy pool just postpones the swap to the next poll.
+    """
+    failed = set()
+    while True:
+        await asyncio.sleep(REGISTRY_POLL)
+        if not READY:
+            continue
+        current = await run_in_threadpool(REGISTRY.current)
+        candidate = await run_in_threadpool(REGISTRY.candidate)
+        if candidate == current:
+            candidate = None
+
+        steps = []
+        if current is not None and current != ACTIVE.version:
+            steps.append((current, activate))
+        if candidate != (CANDIDATE.version if CANDIDATE else None):
+            steps.append((candidate, set_candidate))
+        for version, step in steps:
+            if version in failed:
+                continue
+            try:
+                await step(version)
+            except PoolFullError:
+                pass
+            except Exception as e:
+                failed.add(version)
+                print(f"Could not load registry version {version}: {e}")
+
+
+def shadow(serving, contents, result):
+    """
+    Scores a sample of uploads on the candidate version too, in the
+    background and only when a worker is idle, so the served request never
+    waits for it.
+    """
+    candidate, stats = CANDIDATE, SHADOW
+    if candidate is None or random.random() >= SHADOW_RATE:
+        return
+    if POOL.stats()["in_flight"] >= POOL.workers:
+        stats.skipped_busy += 1
+        return
+    task = asyncio.create_task(_shadow_score(serving, candidate, stats, contents, result))
+    SHADOW_TASKS.add(task)
+    task.add_done_callback(SHADOW_TASKS.discard)
+
+
+async def _shadow_score(serving, candidate, stats, contents, result):
+    try:
+        shadowed, _ = await POOL.submit(inference.predict_bytes, contents, MAX_SECONDS, candidate.model_dir)
+    except Exception:
+        stats.errors += 1
+        return
+    agreed = (verdict(serving, result["prediction"], result["score"])["prediction"]
+              == verdict(candidate, shadowed["prediction"], shadowed["score"])["prediction"])
+    active_seconds, candidate_seconds = (
+        sum(r["timings"].get(stage, 0.0) for stage in WORKER_STAGES) for r in (result, shadowed)
+    )
+    stats.record(agreed, active_seconds, candidate_seconds, abs(shadowed["score"] - result["score"]))
+    SHADOW_COMPARISONS.inc("agree" if agreed else "disagree")
+    SHADOW_SECONDS.observe(active_seconds, "active")
+    SHADOW_SECONDS.observe(candidate_seconds, "candidate")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    tasks = []
+    if ACTIVE is not None:
+        POOL.start()
+        print(f"Worker pool started: {POOL.workers} workers, queue limit {POOL.max_queue}.")
+        tasks.append(asyncio.create_task(warm_up()))
+        tasks.extend(asyncio.create_task(job_runner()) for _ in range(JOB_WORKERS or POOL.workers))
+        tasks.append(asyncio.create_task(job_janitor()))
+        tasks.extend(asyncio.create_task(callback_sender()) for _ in range(CALLBACK_SENDERS))
+        if REGISTRY is not None:
+            tasks.append(asyncio.create_task(registry_watcher()))
+    yield
+    for task in tasks + list(SHADOW_TASKS):
+        task.cancel()
+    POOL.shutdown()
 
-app = FastAPI(title="Echoguard API")
+
+app = FastAPI(title="Echoguard API", lifespan=lifespan)
 
 # Add CORS middleware for Vercel deployment
 app.add_middleware(
@@ -23,105 +567,815 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model & scaler (look in root project directory)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "svm_model.pkl")
-SCALER_PATH = os.path.join(BASE_DIR, "scaler.pkl")
+ALLOWED_EXT = {"wav"}
 
-try:
-    MODEL = joblib.load(MODEL_PATH)
-    SCALER = joblib.load(SCALER_PATH)
-    print("Model and scaler loaded.")
-except Exception as e:
-    print(f"Model/scaler load error: {e}")
-    MODEL = None
-    SCALER = None
 
-ALLOWED_EXT = {"wav"}
+def _route_template(request):
+    """The matched route's template (/jobs/{job_id}), not the raw path, so label cardinality stays bounded."""
+    return getattr(request.scope.get("route"), "path", "unmatched")
 
-def extract_features_from_wav(file_path, n_mfcc=13):
-    """Loads audio and extracts aggregated MFCC, Delta, and Delta-Delta features."""
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """
+    Times every request, tags it with a request id (the client's X-Request-ID
+    if sent) and returns the stage breakdown in a Server-Timing header.
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    request.state.request_id = request_id
+    request.state.timings = {}
+    started = time.perf_counter()
     try:
-        # Load audio at 16kHz sample rate (same as training)
-        y, sr = librosa.load(file_path, sr=16000, mono=True)
-        
-        # 1. MFCCs
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
-        
-        # 2. Delta and Delta-Delta
-        mfccs_delta = librosa.feature.delta(mfccs)
-        mfccs_delta2 = librosa.feature.delta(mfccs, order=2)
-        
-        # Combine all features
-        combined_features = np.vstack([mfccs, mfccs_delta, mfccs_delta2])
-        
-        # Aggregate: Calculate Mean and Standard Deviation (3 * 13 * 2 = 78 features)
-        mean_features = np.mean(combined_features, axis=1)
-        std_features = np.std(combined_features, axis=1)
-        
-        final_vector = np.hstack([mean_features, std_features])
-        
-        return final_vector
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing audio: {str(e)}")
+        response = await call_next(request)
+    except Exception:
+        ERRORS.inc(_route_template(request), "internal")
+        raise
+    elapsed = time.perf_counter() - started
+
+    endpoint = _route_template(request)
+    REQUEST_SECONDS.observe(elapsed, endpoint, str(response.status_code))
+
+    stages = dict(request.state.timings, total=elapsed)
+    response.headers["X-Request-ID"] = request_id
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(stages)
+    if SLOW_MS and elapsed * 1000 >= SLOW_MS:
+        print(f"Slow request {request_id} {request.method} {endpoint} -> {response.status_code}: "
+              + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in stages.items()))
+    return response
+
+
+def verdict(serving, prediction, score, matches=None):
+    """
+    The label and confidence returned for one score of the serving model
+    (training labels: 0 = REAL, 1 = FAKE).
+
+    Without a calibration, confidence is |decision value| and the label is
+    the model's own. With one, FAKE is called at the calibrated threshold and
+    confidence is the calibrated probability of the returned label. Nearest
+    known clips (see nearest_known) are listed under "matches", and a known
+    FAKE within ECHOGUARD_MATCH_DISTANCE makes the verdict FAKE outright.
+    """
+    calibration = serving.calibration
+    if calibration is None:
+        body = {
+            "prediction": CLASS_NAMES[int(prediction)],
+            "confidence": float(abs(score)),
+            "raw_prediction": int(prediction),
+        }
+    else:
+        fake_probability = float(calibration.fake_probability(score))
+        fake = score >= calibration.threshold
+        body = {
+            "prediction": CLASS_NAMES[1] if fake else CLASS_NAMES[0],
+            "confidence": fake_probability if fake else 1.0 - fake_probability,
+            "fake_probability": fake_probability,
+            "raw_prediction": int(prediction),
+        }
+
+    if matches is not None:
+        body["matches"] = matches
+        known_fake = next((m for m in matches if m["label"] == CLASS_NAMES[1]), None)
+        if MATCH_DISTANCE and known_fake is not None and known_fake["distance"] <= MATCH_DISTANCE:
+            INDEX_MATCHES.inc()
+            body.update(prediction=CLASS_NAMES[1], confidence=1.0, matched=known_fake)
+    return body
+
+
+def nearest_known(serving, request, endpoint, vectors):
+    """
+    Looks up the ECHOGUARD_INDEX_K nearest known clips of each raw feature
+    vector in the vector index (sub-millisecond, in this process).
+
+    Returns:
+        list: per vector, a list of {"id", "label", "distance"}, or None
+        when no index is loaded.
+    """
+    if serving.index is None or not len(vectors):
+        return [None] * len(vectors)
+    started = time.perf_counter()
+    ids, labels, distances = serving.index.search(serving.compiled.scale(np.vstack(vectors)), INDEX_K)
+    record_stage(request, endpoint, "match", time.perf_counter() - started)
+    return [
+        [{"id": int(i), "label": CLASS_NAMES[int(label)], "distance": round(float(d), 4)}
+         for i, label, d in zip(row_ids, row_labels, row_distances) if i >= 0]
+        for row_ids, row_labels, row_distances in zip(ids, labels, distances)
+    ]
+
+
+def fail(endpoint, error_type, status_code, detail, headers=None):
+    """Counts an error by type and returns the HTTPException to raise."""
+    ERRORS.inc(endpoint, error_type)
+    return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+
+async def run_in_pool(fn, *args, endpoint="/predict"):
+    """Runs a CPU-bound job on the worker pool, mapping failures to HTTP errors."""
+    try:
+        return await POOL.submit(fn, *args)
+    except PoolFullError:
+        raise fail(
+            endpoint, "pool_full",
+            503,
+            "Server is busy. Please retry shortly.",
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+    except ValueError as e:
+        raise fail(endpoint, "bad_audio", 400, str(e))
+    except BrokenProcessPool:
+        raise fail(
+            endpoint, "pool_broken",
+            503,
+            "Worker pool unavailable.",
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+
 
 @app.get("/")
 async def root():
     """Health check endpoint."""
-    model_status = "loaded" if MODEL is not None else "not loaded"
+    serving = ACTIVE
+    model_status = "loaded" if serving is not None else "not loaded"
+    calibration = serving.calibration if serving is not None else None
+    model_dir = serving.model_dir if serving is not None else None
     return {
         "message": "Echoguard API is running",
         "model_status": model_status,
-        "model_path": MODEL_PATH,
-        "scaler_path": SCALER_PATH
+        "model_version": serving.version if serving is not None else None,
+        "engine": ENGINE,
+        "calibration": {"threshold": calibration.threshold} if calibration else None,
+        "model_path": model_dir or MODEL_PATH,
+        "scaler_path": None if model_dir else SCALER_PATH,
+        "worker_pool": POOL.stats(),
+        "cache": CACHE.stats(),
+        "vector_index": {"path": INDEX_DIR, "vectors": len(INDEX)}
+        if serving is not None and serving.index is not None else None,
+        "shadow": SHADOW.snapshot() if SHADOW is not None else None,
     }
 
+
+@app.get("/models")
+async def models():
+    """The registry's versions, the served one, the shadow candidate and how the two compare."""
+    if REGISTRY is None:
+        raise HTTPException(status_code=404, detail="No model registry configured (set ECHOGUARD_REGISTRY).")
+    versions = await run_in_threadpool(lambda: [REGISTRY.info(v) for v in REGISTRY.versions()])
+    return {
+        "registry": REGISTRY.root,
+        "active": ACTIVE.describe() if ACTIVE is not None else None,
+        "candidate": CANDIDATE.describe() if CANDIDATE is not None else None,
+        "shadow": SHADOW.snapshot() if SHADOW is not None else None,
+        "versions": versions,
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check: 200 once the model is loaded and the first inference has
+    run in every worker, 503 until then. Reports measured startup times.
+    """
+    body = {"ready": READY, "startup": STARTUP}
+    return JSONResponse(body, status_code=200 if READY else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus-style metrics: stage latency histograms, audio durations, errors by type."""
+    JOB_STATS.update(await run_in_threadpool(JOBS.stats))
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/predict")
-async def predict(audio_file: UploadFile = File(...)):
+async def predict(request: Request, audio_file: UploadFile = File(...), segment_seconds: Optional[float] = None):
     """
     Predict if audio is REAL or FAKE.
+
+    With ?segment_seconds=N the response also scores every N-second segment
+    (a timeline of where the audio looks fake).
     """
-    if MODEL is None or SCALER is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Model not available. Please ensure svm_model.pkl and scaler.pkl are in the root directory."
+    serving = ACTIVE
+    if serving is None:
+        raise fail(
+            "/predict", "model_unavailable",
+            503,
+            "Model not available. Please ensure svm_model.pkl and scaler.pkl are in the root directory."
         )
-    
+
     # Validate file extension
     file_ext = audio_file.filename.split('.')[-1].lower()
     if file_ext not in ALLOWED_EXT:
-        raise HTTPException(status_code=400, detail=f"File type .{file_ext} not allowed. Use .wav")
-    
-    # Save uploaded file to temp location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-        temp_path = temp_file.name
-        contents = await audio_file.read()
-        temp_file.write(contents)
-    
+        raise fail("/predict", "bad_extension", 400, f"File type .{file_ext} not allowed. Use .wav")
+    if segment_seconds is not None and segment_seconds < 1:
+        raise fail("/predict", "bad_request", 400, "segment_seconds must be at least 1.")
+
+    # Long uploads and timelines are decoded block by block in the worker
+    if segment_seconds or audio_file.size is None or audio_file.size > LONG_AUDIO_BYTES:
+        return await predict_long(request, serving, audio_file, segment_seconds)
+
+    # Read the upload into memory; decoding happens in the worker
+    read_started = time.perf_counter()
+    contents = await audio_file.read()
+    record_stage(request, "/predict", "upload_read", time.perf_counter() - read_started)
+
+    # Identical uploads skip decode and inference entirely
+    cache_key = None
+    result = None
+    queue_wait = 0.0
+    if CACHE.enabled:
+        cache_key = await run_in_threadpool(CACHE.key, contents, serving.fingerprint)
+        result = await run_in_threadpool(CACHE.get, cache_key)
+        CACHE_LOOKUPS.inc("hit" if result is not None else "miss")
+    cached = result is not None
+
+    if not cached:
+        # Extract features and predict in a worker process
+        result, queue_wait = await run_in_pool(inference.predict_bytes, contents, MAX_SECONDS, serving.model_dir)
+        record_stage(request, "/predict", "queue_wait", queue_wait)
+        record_stages(request, "/predict", result["timings"])
+        if cache_key is not None:
+            await run_in_threadpool(CACHE.put, cache_key, result["features"], result["prediction"], result["score"])
+        shadow(serving, contents, result)
+    matches = nearest_known(serving, request, "/predict", [result["features"]])[0]
+
+    return {
+        "filename": audio_file.filename,
+        **verdict(serving, result["prediction"], result["score"], matches),
+        "model_version": serving.version,
+        "queue_wait_ms": round(queue_wait * 1000, 2),
+        "cached": cached,
+    }
+
+
+def _spool_to_disk(upload):
+    """Copies an upload to a named temp file in 1 MB pieces so a worker can read it by path."""
+    upload.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="echoguard-", suffix=".wav", delete=False) as f:
+        shutil.copyfileobj(upload, f, 1 << 20)
+        return f.name
+
+
+async def predict_long(request, serving, audio_file, segment_seconds):
+    """
+    /predict for long uploads or segment timelines: the worker decodes the
+    audio block by block (see inference.predict_stream). Uploads above
+    ECHOGUARD_LONG_AUDIO_MB never enter this process's memory whole.
+    """
+    read_started = time.perf_counter()
+    path = None
+    if audio_file.size is None or audio_file.size > LONG_AUDIO_BYTES:
+        path = await run_in_threadpool(_spool_to_disk, audio_file.file)
+        source = path
+    else:
+        source = await audio_file.read()
+    record_stage(request, "/predict", "upload_read", time.perf_counter() - read_started)
+
     try:
-        # Extract features
-        features = extract_features_from_wav(temp_path)
-        features = features.reshape(1, -1)
-        
-        # Scale features
-        features_scaled = SCALER.transform(features)
-        
-        # Predict
-        prediction = MODEL.predict(features_scaled)[0]
-        probability = MODEL.decision_function(features_scaled)[0]
-        
-        # Determine label
-        label = "REAL" if prediction == 1 else "FAKE"
-        confidence = abs(probability)
-        
-        return {
-            "filename": audio_file.filename,
-            "prediction": label,
-            "confidence": float(confidence),
-            "raw_prediction": int(prediction)
-        }
-    
+        result, queue_wait = await run_in_pool(
+            inference.predict_stream, source, segment_seconds, MAX_SECONDS, serving.model_dir)
     finally:
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if path is not None:
+            os.remove(path)
+    record_stage(request, "/predict", "queue_wait", queue_wait)
+    record_stages(request, "/predict", result["timings"])
+
+    matches = nearest_known(serving, request, "/predict", [result["features"]])[0]
+    body = _prediction_body(serving, audio_file.filename, result, segment_seconds, matches)
+    body["queue_wait_ms"] = round(queue_wait * 1000, 2)
+    body["cached"] = False
+    return body
+
+
+def _prediction_body(serving, filename, result, segment_seconds=None, matches=None):
+    """Formats an inference.predict_stream result like a /predict response."""
+    body = {
+        "filename": filename,
+        **verdict(serving, result["prediction"], result["score"], matches),
+        "model_version": serving.version,
+        "duration_seconds": round(result["timings"]["audio_seconds"], 3),
+    }
+    if segment_seconds:
+        body["segments"] = [
+            {
+                "start": segment["start"],
+                "end": segment["end"],
+                **verdict(serving, segment["prediction"], segment["score"]),
+            }
+            for segment in result["segments"]
+        ]
+    return body
+
+
+def _chunks(items, n_chunks):
+    """Splits items into at most n_chunks contiguous, evenly sized chunks."""
+    size = max(1, -(-len(items) // n_chunks))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Predict REAL or FAKE for many WAV files at once.
+
+    Accepts several WAV files and/or zip/tar archives of WAV files. Features
+    are extracted in parallel across the worker pool, then the whole batch is
+    scaled and scored in one pass. Results come back in upload order (archive
+    members in archive order); a file that fails gets an "error" entry instead
+    of failing the batch.
+    """
+    serving = ACTIVE
+    if serving is None:
+        raise fail(
+            "/predict/batch", "model_unavailable",
+            503,
+            "Model not available. Please ensure svm_model.pkl and scaler.pkl are in the root directory."
+        )
+
+    # 1. Collect clips in order, expanding archives
+    clips = []  # (filename, bytes or None, error or None)
+    read_started = time.perf_counter()
+    for upload in files:
+        filename = upload.filename or ""
+        contents = await upload.read()
+        if is_archive(filename):
+            try:
+                members = await run_in_threadpool(read_archive, contents, ALLOWED_EXT, MAX_BATCH, MAX_ARCHIVE_BYTES)
+            except ValueError as e:
+                clips.append((filename, None, str(e)))
+                continue
+            clips.extend((f"{filename}/{name}", data, None) for name, data in members)
+        elif filename.split('.')[-1].lower() in ALLOWED_EXT:
+            clips.append((filename, contents, None))
+        else:
+            clips.append((filename, None, f"File type .{filename.split('.')[-1].lower()} not allowed. Use .wav"))
+
+        if len(clips) > MAX_BATCH:
+            raise fail("/predict/batch", "batch_too_large", 413, f"Batch holds more than {MAX_BATCH} files.")
+    record_stage(request, "/predict/batch", "upload_read", time.perf_counter() - read_started)
+
+    # 2. Reuse cached features for uploads we have seen before
+    todo = [i for i, (_, data, _) in enumerate(clips) if data is not None]
+    features = {}
+    errors = {i: error for i, (_, _, error) in enumerate(clips) if error is not None}
+    cache_keys = {}
+    if CACHE.enabled:
+        for i in todo:
+            cache_keys[i] = await run_in_threadpool(CACHE.key, clips[i][1], serving.fingerprint)
+            entry = await run_in_threadpool(CACHE.get, cache_keys[i])
+            CACHE_LOOKUPS.inc("hit" if entry is not None else "miss")
+            if entry is not None:
+                features[i] = entry["features"]
+        todo = [i for i in todo if i not in features]
+
+    # 3. Extract the rest in parallel: one pool job per chunk of clips
+
+    chunks = _chunks(todo, POOL.workers) if todo else []
+    jobs = [POOL.submit(inference.extract_many, [clips[i][1] for i in chunk], MAX_SECONDS) for chunk in chunks]
+    outcomes = await asyncio.gather(*jobs, return_exceptions=True)
+
+    queue_wait = 0.0
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            pool_full = isinstance(outcome, PoolFullError)
+            reason = "Server is busy. Please retry shortly." if pool_full else str(outcome)
+            ERRORS.inc("/predict/batch", "pool_full" if pool_full else "internal", amount=len(chunk))
+            errors.update((i, reason) for i in chunk)
+            continue
+        results, wait = outcome
+        queue_wait = max(queue_wait, wait)
+        for i, (vector, error, timings) in zip(chunk, results):
+            if error is None:
+                features[i] = vector
+                record_stages(request, "/predict/batch", timings)
+            else:
+                ERRORS.inc("/predict/batch", "bad_audio")
+                errors[i] = error
+    for i, (_, _, error) in enumerate(clips):
+        if error is not None:
+            ERRORS.inc("/predict/batch", "bad_archive" if is_archive(clips[i][0]) else "bad_extension")
+
+    # 4. Scale and score every good clip with one matrix
+    order = sorted(features)
+    todo_set = set(todo)
+    scored = {}
+    if order:
+        matrix = np.vstack([features[i] for i in order])
+        result, wait = await run_in_pool(inference.score_matrix, matrix, serving.model_dir, endpoint="/predict/batch")
+        queue_wait = max(queue_wait, wait)
+        record_stages(request, "/predict/batch", result["timings"])
+        for i, prediction, score in zip(order, result["predictions"], result["scores"]):
+            scored[i] = (prediction, score)
+            if i in cache_keys and i in todo_set:
+                await run_in_threadpool(CACHE.put, cache_keys[i], features[i], prediction, score)
+
+    # 5. Per-file results in the original order
+    matches = dict(zip(order, nearest_known(serving, request, "/predict/batch", [features[i] for i in order])))
+    results = []
+    for i, (filename, _, _) in enumerate(clips):
+        if i in scored:
+            prediction, score = scored[i]
+            results.append({"filename": filename, **verdict(serving, prediction, score, matches[i])})
+        else:
+            results.append({"filename": filename, "error": errors.get(i, "Unknown error")})
+
+    record_stage(request, "/predict/batch", "queue_wait", queue_wait)
+    return {
+        "count": len(results),
+        "succeeded": len(scored),
+        "failed": len(results) - len(scored),
+        "model_version": serving.version,
+        "queue_wait_ms": round(queue_wait * 1000, 2),
+        "results": results,
+    }
+
+
+# --- Feedback ---
+def _store_feedback(vector, path, label, content_hash):
+    """
+    Appends one labelled clip to the feedback store, unless the same bytes
+    already carry the same label (a relabelled clip is appended again; the
+    trainer keeps its latest label).
+
+    Returns:
+        tuple: (whether a row was added, rows in the store)
+    """
+    shard = FEEDBACK.append([vector], [path], [label], FEATURE_VERSION, [content_hash], skip_labelled=True)
+    FEEDBACK.latest_labels()  # reads only the row just appended
+    return shard is not None, FEEDBACK.indexed_rows
+
+
+@app.post("/feedback")
+async def feedback(request: Request, audio_file: UploadFile = File(...), label: str = Form(...)):
+    """
+    Label a clip for retraining, e.g. a call later confirmed as FAKE.
+
+    The clip's features are appended to ECHOGUARD_FEEDBACK_STORE for
+    `trainmodel.py --incremental`. A confirmed FAKE also goes into the vector
+    index, so repeats of it are matched from now on.
+    """
+    if FEEDBACK is None:
+        raise HTTPException(status_code=404, detail="Feedback is off (set ECHOGUARD_FEEDBACK_STORE).")
+    if FEEDBACK_TOKEN and request.headers.get("x-feedback-token") != FEEDBACK_TOKEN:
+        raise fail("/feedback", "forbidden", 403, "Missing or wrong X-Feedback-Token.")
+    serving = ACTIVE
+    if serving is None:
+        raise fail("/feedback", "model_unavailable", 503, "Model not available.")
+    label = label.strip().upper()
+    classes = {name: class_id for class_id, name in CLASS_NAMES.items()}
+    if label not in classes:
+        raise fail("/feedback", "bad_request", 400, f"label must be one of {', '.join(classes)}.")
+    file_ext = (audio_file.filename or "").split('.')[-1].lower()
+    if file_ext not in ALLOWED_EXT:
+        raise fail("/feedback", "bad_extension", 400, f"File type .{file_ext} not allowed. Use .wav")
+
+    read_started = time.perf_counter()
+    contents = await audio_file.read()
+    record_stage(request, "/feedback", "upload_read", time.perf_counter() - read_started)
+
+    # Usually the clip was just scored: take its features from the cache
+    vector = None
+    if CACHE.enabled:
+        entry = await run_in_threadpool(CACHE.get, await run_in_threadpool(CACHE.key, contents, serving.fingerprint))
+        vector = entry["features"] if entry is not None else None
+    if vector is None:
+        results, queue_wait = await run_in_pool(inference.extract_many, [contents], MAX_SECONDS, endpoint="/feedback")
+        vector, error, timings = results[0]
+        if error is not None:
+            raise fail("/feedback", "bad_audio", 400, error)
+        record_stage(request, "/feedback", "queue_wait", queue_wait)
+        record_stages(request, "/feedback", timings)
+
+    class_id = classes[label]
+    content_hash = await run_in_threadpool(lambda: hashlib.sha256(contents).hexdigest())
+    path = f"feedback/{request.state.request_id}/{audio_file.filename}"
+    stored, rows = await run_in_threadpool(_store_feedback, vector, path, class_id, content_hash)
+
+    index_id = None
+    if stored and class_id == 1 and serving.index is not None:
+        ids = await run_in_threadpool(serving.index.add, serving.compiled.scale(vector), [class_id])
+        index_id = int(ids[0])
+    return {
+        "filename": audio_file.filename,
+        "label": label,
+        "stored": stored,
+        "feedback_rows": rows,
+        "index_id": index_id,
+    }
+
+
+# --- Asynchronous jobs ---
+def _spool_job_input(upload, path):
+    """Copies an upload to the job's input file, hashing it on the way for deduplication."""
+    digest = hashlib.sha256()
+    upload.seek(0)
+    with open(path, "wb") as f:
+        for block in iter(lambda: upload.read(1 << 20), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def _callback_target_error(url):
+    """
+    Why callback_url may not be POSTed to, or None if it may.
+
+    The host must resolve only to public addresses, so a client cannot make
+    the server call loopback, private networks or cloud metadata endpoints.
+    Hosts in ECHOGUARD_CALLBACK_ALLOW are exempt. Checked on submit and
+    again before every delivery (the DNS answer may have changed).
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "callback_url must be an http(s) URL."
+    if parts.hostname.lower() in CALLBACK_ALLOW:
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 80)}
+    except (OSError, UnicodeError, ValueError) as e:
+        return f"callback_url host could not be resolved: {e}"
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            return f"callback_url resolves to a non-public address ({ip})."
+    return None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Callbacks are not redirected: a redirect could point at an internal address."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+CALLBACK_OPENER = urllib.request.build_opener(_NoRedirect)
+
+
+def _post_callback(url, body):
+    """POSTs a finished job to its callback URL once. Returns (delivered, outcome for GET /jobs/{id})."""
+    error = _callback_target_error(url)
+    if error is not None:
+        return True, f"refused: {error}"  # final: retrying cannot help
+    data = json.dumps(body).encode()
+    try:
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+        with CALLBACK_OPENER.open(req, timeout=10) as response:
+            return True, f"delivered ({response.status})"
+    except Exception as e:
+        return False, f"failed: {e}"
+
+
+def _job_view(job):
+    """The public form of a job row."""
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "kind": job["kind"],
+        "filename": job["filename"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "queue_seconds": round(job["started_at"] - job["created_at"], 3) if job["started_at"] else None,
+        "run_seconds": round(job["finished_at"] - job["started_at"], 3)
+        if job["finished_at"] and job["started_at"] else None,
+    }
+    if job["result"] is not None:
+        view["result"] = job["result"]
+    if job["error"] is not None:
+        view["error"] = job["error"]
+    if job["callback_url"]:
+        view["callback_status"] = job["callback_status"] or "pending"
+    return view
+
+
+async def run_job(job):
+    """Runs one claimed job on the worker pool and stores its result."""
+    serving = ACTIVE
+    params = job["params"]
+    if job["kind"] == "batch":
+        members, _ = await POOL.submit(
+            inference.predict_archive, job["input_path"], tuple(ALLOWED_EXT), MAX_BATCH, MAX_SECONDS,
+            serving.model_dir, MAX_ARCHIVE_BYTES)
+        good = [i for i, m in enumerate(members) if "error" not in m]
+        matches = dict(zip(good, nearest_known(serving, None, "/jobs", [members[i]["features"] for i in good])))
+        results = [
+            {"filename": m["filename"], **verdict(serving, m["prediction"], m["score"], matches[i])}
+            if i in matches else m
+            for i, m in enumerate(members)
+        ]
+        succeeded = sum("error" not in r for r in results)
+        return {"count": len(results), "succeeded": succeeded, "failed": len(results) - succeeded,
+                "model_version": serving.version, "results": results}
+
+    result, _ = await POOL.submit(
+        inference.predict_stream, job["input_path"], params.get("segment_seconds"), MAX_SECONDS, serving.model_dir)
+    record_stages(None, "/jobs", result["timings"])
+    matches = nearest_known(serving, None, "/jobs", [result["features"]])[0]
+    return _prediction_body(serving, job["filename"], result, params.get("segment_seconds"), matches)
+
+
+async def job_janitor():
+    """
+    Background loop: deletes finished jobs (and their inputs) once they are
+    older than ECHOGUARD_JOB_TTL.
+    """
+    while True:
+        try:
+            await run_in_threadpool(JOBS.purge)
+        except Exception as e:
+            print(f"Job purge failed: {e}")
+        await asyncio.sleep(JOB_PURGE_SECONDS)
+
+
+async def job_runner():
+    """
+    Background loop: claims queued jobs from the shared SQLite queue and runs
+    them. Several run per process (ECHOGUARD_JOB_WORKERS); the per-client
+    running cap is enforced by the claim itself.
+    """
+    while True:
+        if not READY:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        job = await run_in_threadpool(JOBS.claim)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        try:
+            result = await run_job(job)
+        except PoolFullError:
+            # Interactive traffic has the pool; try again shortly
+            await run_in_threadpool(JOBS.release, job["id"])
+            await asyncio.sleep(RETRY_AFTER)
+            continue
+        except asyncio.CancelledError:
+            await run_in_threadpool(JOBS.release, job["id"])
+            raise
+        except Exception as e:
+            ERRORS.inc("/jobs", "bad_audio" if isinstance(e, ValueError) else "internal")
+            await run_in_threadpool(JOBS.finish, job["id"], None, str(e))
+        else:
+            await run_in_threadpool(JOBS.finish, job["id"], result)
+
+
+async def callback_sender():
+    """
+    Background loop: POSTs finished jobs to their callback URLs, retrying
+    twice. Runs apart from job_runner, so a slow or dead callback target
+    never holds up queued work.
+    """
+    while True:
+        job = await run_in_threadpool(JOBS.claim_callback)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        for attempt in range(3):
+            delivered, outcome = await run_in_threadpool(_post_callback, job["callback_url"], _job_view(job))
+            if delivered:
+                break
+            await asyncio.sleep(2 ** attempt)
+        await run_in_threadpool(JOBS.set_callback_status, job["id"], outcome)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    audio_file: UploadFile = File(...),
+    callback_url: Optional[str] = Form(None),
+    segment_seconds: Optional[float] = Form(None),
+):
+    """
+    Queue a WAV file or a zip/tar archive of WAV files and return at once.
+
+    Poll GET /jobs/{job_id} for the result, or pass callback_url to have it
+    POSTed when done (it must resolve to a public address). Identical
+    uploads from one client (same bytes, parameters and callback) share one
+    job. Clients are identified by X-Client-ID, else by address.
+    """
+    if ACTIVE is None:
+        raise fail(
+            "/jobs", "model_unavailable",
+            503,
+            "Model not available. Please ensure svm_model.pkl and scaler.pkl are in the root directory."
+        )
+
+    filename = audio_file.filename or ""
+    if is_archive(filename):
+        kind, params = "batch", {}
+    elif filename.split('.')[-1].lower() in ALLOWED_EXT:
+        kind, params = "predict", {"segment_seconds": segment_seconds} if segment_seconds else {}
+    else:
+        raise fail("/jobs", "bad_extension", 400,
+                   f"File type .{filename.split('.')[-1].lower()} not allowed. Use .wav or a zip/tar of .wav files")
+    if segment_seconds is not None and segment_seconds < 1:
+        raise fail("/jobs", "bad_request", 400, "segment_seconds must be at least 1.")
+    if callback_url:
+        error = await run_in_threadpool(_callback_target_error, callback_url)
+        if error is not None:
+            raise fail("/jobs", "bad_request", 400, error)
+
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+    read_started = time.perf_counter()
+    job_id, path = JOBS.new_input()
+    content_hash = await run_in_threadpool(_spool_job_input, audio_file.file, path)
+    record_stage(request, "/jobs", "upload_read", time.perf_counter() - read_started)
+
+    try:
+        job, deduplicated = await run_in_threadpool(
+            JOBS.submit, job_id, path, client, kind, filename, params, content_hash, callback_url)
+    except ClientLimitError as e:
+        raise fail("/jobs", "client_limit", 429, str(e), headers={"Retry-After": str(RETRY_AFTER)})
+
+    return {**_job_view(job), "deduplicated": deduplicated, "status_url": f"/jobs/{job['id']}"}
+
+
+@app.get("/jobs")
+async def job_stats():
+    """Queue length, job age and recent wait/run times (for sizing workers)."""
+    return await run_in_threadpool(JOBS.stats)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued job, with its result once done."""
+    job = await run_in_threadpool(JOBS.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return _job_view(job)
+
+
+def _stream_score(extractor, received_at, final=False):
+    """Scores the running statistics of a live stream with the version serving right now."""
+    serving = ACTIVE
+    vector = extractor.vector()
+    labels, scores = serving.compiled.predict(vector)
+    prediction = int(labels[0])
+    return {
+        "type": "score",
+        "final": final,
+        "seconds": round(extractor.seconds, 3),
+        **verdict(serving, prediction, float(scores[0]), nearest_known(serving, None, "/stream", [vector])[0]),
+        "model_version": serving.version,
+        # Time from receiving the audio that completed this window to sending the score
+        "latency_ms": round((time.perf_counter() - received_at) * 1000, 3),
+    }
+
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, interval: float = STREAM_INTERVAL, encoding: str = "int16"):
+    """
+    Live REAL/FAKE scoring for an ongoing call.
+
+    Send binary messages of raw 16 kHz mono PCM (little-endian int16, or
+    float32 with ?encoding=float32). A rolling score is sent every `interval`
+    seconds of audio; send the text message "end" to get a final score.
+    Only running statistics are kept, never the audio itself.
+    """
+    await websocket.accept()
+    if ACTIVE is None:
+        await websocket.close(code=1011, reason="Model not available.")
+        return
+    dtypes = {"int16": (np.dtype("<i2"), 32768.0), "float32": (np.dtype("<f4"), 1.0)}
+    if encoding not in dtypes or interval <= 0:
+        await websocket.close(code=1003, reason="encoding must be int16 or float32 and interval > 0.")
+        return
+    dtype, scale = dtypes[encoding]
+
+    extractor = StreamingFeatureExtractor()
+    next_score_at = interval
+    leftover = b""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes") is not None:
+                received_at = time.perf_counter()
+                data = leftover + message["bytes"]
+                usable = len(data) - len(data) % dtype.itemsize
+                leftover = data[usable:]
+                samples = np.frombuffer(data, dtype=dtype, count=usable // dtype.itemsize).astype(np.float32) / scale
+                await run_in_threadpool(extractor.push, samples)
+
+                if MAX_SECONDS and extractor.seconds > MAX_SECONDS:
+                    await websocket.send_json({"type": "error", "detail": f"Stream longer than {MAX_SECONDS:g}s."})
+                    await websocket.close(code=1009)
+                    return
+
+                if extractor.seconds >= next_score_at and extractor.ready():
+                    await websocket.send_json(_stream_score(extractor, received_at))
+                    while next_score_at <= extractor.seconds:
+                        next_score_at += interval
+
+            elif message.get("text") == "end":
+                # Pads the tail and adds the edge deltas, like the offline extractor
+                await run_in_threadpool(extractor.finish)
+                if extractor.ready():
+                    await websocket.send_json(_stream_score(extractor, time.perf_counter(), final=True))
+                else:
+                    await websocket.send_json({"type": "error", "detail": "Not enough audio to score."})
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        return
@@ -0,0 +1,265 @@
+import io
+import time
+import struct
+import tarfile
+import zipfile
+import numpy as np
+
+# librosa (numba, scipy, soundfile) is imported inside the functions that need
+# it, so importing this module stays cheap for the API process.
+
+# WAVE format tags we can read straight out of the upload buffer
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format tag, bits per sample) -> (numpy dtype, scale to [-1, 1])
+_PCM_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): (np.dtype("u1"), 128.0),
+    (WAVE_FORMAT_PCM, 16): (np.dtype("<i2"), 32768.0),
+    (WAVE_FORMAT_PCM, 32): (np.dtype("<i4"), 2147483648.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): (np.dtype("<f4"), 1.0),
+}
+
+
+# --- 1. WAV Header Parsing ---
+def parse_wav_header(data):
+    """
+    Reads the RIFF/WAVE chunks of an in-memory WAV file.
+
+    Returns:
+        dict: format_tag, channels, sample_rate, bits, data_offset and data_size,
+        or None if the buffer is not a WAV file we understand.
+    """
+    if len(data) < 12 or data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                # The real format tag is the first two bytes of the SubFormat GUID
+                format_tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = {
+                "format_tag": format_tag,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "bits": bits,
+            }
+        elif chunk_id == b"data" and fmt is not None:
+            # Streaming writers sometimes leave the size as 0 or 0xFFFFFFFF
+            data_size = min(chunk_size, len(data) - body)
+            if data_size == 0:
+                data_size = len(data) - body
+            fmt["data_offset"] = body
+            fmt["data_size"] = data_size
+            return fmt
+
+        # Chunks are word-aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+# --- 2. Decoding ---
+def pcm_view(data, header):
+    """
+    Returns the samples of a PCM/float WAV as a (frames, channels) view of `data`.
+
+    np.frombuffer does not copy, so this costs nothing beyond the upload itself.
+    Returns None for encodings that need a real decoder.
+    """
+    dtype_scale = _PCM_DTYPES.get((header["format_tag"], header["bits"]))
+    if dtype_scale is None or header["channels"] < 1:
+        return None
+    dtype, _ = dtype_scale
+    frame_bytes = dtype.itemsize * header["channels"]
+    n_frames = header["data_size"] // frame_bytes
+    samples = np.frombuffer(data, dtype=dtype, count=n_frames * header["channels"], offset=header["data_offset"])
+    return samples.reshape(n_frames, header["channels"])
+
+
+def resample(y, orig_sr, target_sr):
+    """
+    Resamples mono float32 audio with soxr's HQ filter, called directly.
+
+    Gives the same samples as librosa.resample's default (res_type='soxr_hq',
+    length fixed to ceil(n * ratio)), so features match training, without
+    librosa's per-call checks or the seconds its first call costs in a fresh
+    worker. soxr picks a polyphase filter bank for integer ratios such as
+    8 kHz -> 16 kHz by itself.
+    """
+    import soxr
+
+    n_samples = int(np.ceil(len(y) * (float(target_sr) / orig_sr)))
+    y = soxr.resample(y, orig_sr, target_sr, quality="soxr_hq")
+    if len(y) < n_samples:
+        y = np.pad(y, (0, n_samples - len(y)))
+    return y[:n_samples]
+
+
+def check_duration(seconds, max_seconds):
+    if max_seconds and seconds > max_seconds:
+        raise ValueError(f"Audio is {seconds:.1f}s long; the limit is {max_seconds:g}s.")
+
+
+# Decode paths reported by decode_audio / iter_audio_blocks
+NATIVE = "native"            # PCM/float WAV already at the target rate: no resampling
+RESAMPLED = "resampled"      # PCM/float WAV at another rate, resampled with soxr
+DECODER = "decoder"          # anything else (compressed WAV, FLAC, OGG, ...), decoded by librosa
+
+
+def decode_audio(data, sr=16000, max_seconds=None, timings=None):
+    """
+    Decodes an in-memory audio file to mono float32 at `sr` without touching disk.
+
+    Plain PCM/float WAV is read directly from the buffer: mono float32 at
+    `sr` is returned as a view of the upload (no copy), int16 is converted
+    in one pass, and other rates are resampled (see resample). Anything else
+    goes through librosa with a memory file. Audio longer than max_seconds
+    raises ValueError (before decoding, for PCM).
+
+    If a timings dict is given, the path taken (NATIVE, RESAMPLED or DECODER)
+    is stored in it as "decode_path", and any resampling time as "resample".
+
+    Returns:
+        tuple: (y, sr) like librosa.load
+    """
+    header = parse_wav_header(data)
+    samples = pcm_view(data, header) if header is not None else None
+    if timings is None:
+        timings = {}
+
+    if samples is None:
+        # Fallback: let soundfile/audioread decode from a memory file
+        import librosa
+        timings["decode_path"] = DECODER
+        y, sr = librosa.load(io.BytesIO(data), sr=sr, mono=True)
+        check_duration(len(y) / sr, max_seconds)
+        return y, sr
+
+    check_duration(len(samples) / header["sample_rate"], max_seconds)
+
+    _, scale = _PCM_DTYPES[(header["format_tag"], header["bits"])]
+    if header["format_tag"] == WAVE_FORMAT_PCM and header["bits"] == 8:
+        # 8-bit WAV is unsigned, centred on 128
+        y = (samples.astype(np.float32) - 128.0) / scale
+    elif scale == 1.0:
+        # float32 WAV: a view of the upload buffer
+        y = samples.astype(np.float32, copy=False)
+    else:
+        # One allocation; the scales are powers of two, so this equals dividing
+        y = samples.astype(np.float32)
+        y *= np.float32(1.0 / scale)
+
+    # Downmix to mono (same as librosa.to_mono)
+    y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+
+    if header["sample_rate"] == sr:
+        timings["decode_path"] = NATIVE
+    else:
+        timings["decode_path"] = RESAMPLED
+        started = time.perf_counter()
+        y = resample(y, header["sample_rate"], sr)
+        timings["resample"] = time.perf_counter() - started
+    return y, sr
+
+
+def iter_audio_blocks(source, sr=16000, block_seconds=10.0, max_seconds=None, timings=None):
+    """
+    Decodes an audio file (path or file object) block by block.
+
+    Yields mono float32 blocks at `sr`, so memory stays at one block no
+    matter how long the file is. Resampling uses a streaming soxr resampler
+    (the same 'soxr_hq' filter librosa.resample uses). The duration is checked
+    against max_seconds from the header before anything is decoded. A timings
+    dict gets the decode path and the total resampling time, like decode_audio.
+    """
+    import soundfile
+    import soxr
+
+    with soundfile.SoundFile(source) as f:
+        if f.frames > 0:
+            check_duration(f.frames / f.samplerate, max_seconds)
+        resampler = None
+        if timings is None:
+            timings = {}
+        timings["decode_path"] = NATIVE if f.samplerate == sr else RESAMPLED
+        if f.samplerate != sr:
+            resampler = soxr.ResampleStream(f.samplerate, sr, 1, dtype="float32", quality="HQ")
+            timings["resample"] = 0.0
+
+        frames_read = 0
+        for block in f.blocks(blocksize=max(1, int(block_seconds * f.samplerate)), dtype="float32", always_2d=True):
+            frames_read += len(block)
+            # Headers of streamed WAVs may not carry the length
+            check_duration(frames_read / f.samplerate, max_seconds)
+            y = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+            if resampler is not None:
+                started = time.perf_counter()
+                y = resampler.resample_chunk(y)
+                timings["resample"] += time.perf_counter() - started
+            yield y
+
+        if resampler is not None:
+            yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+# --- 3. Archives ---
+ARCHIVE_EXTS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTS)
+
+
+def read_archive(data, allowed_ext=("wav",), max_files=None, max_bytes=None):
+    """
+    Unpacks a zip/tar archive held in memory.
+
+    Each member's unpacked size is checked against what is left of max_bytes
+    before it is read. zipfile and tarfile never return more than that
+    declared size, so a small archive cannot unpack to more than max_bytes.
+
+    Returns:
+        list: (member name, bytes) for every member with an allowed extension,
+        in archive order. Raises ValueError for unreadable archives, when
+        there are more than max_files members or when they unpack to more
+        than max_bytes.
+    """
+    members = []
+    total = 0
+
+    def wanted(name):
+        return name.rsplit(".", 1)[-1].lower() in allowed_ext and "__MACOSX" not in name
+
+    def add(name, size, read):
+        nonlocal total
+        if max_files is not None and len(members) >= max_files:
+            raise ValueError(f"Archive holds more than {max_files} audio files.")
+        total += size
+        if max_bytes is not None and total > max_bytes:
+            raise ValueError(f"Archive unpacks to more than {max_bytes / 2**20:.0f} MB.")
+        members.append((name, read()))
+
+    try:
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and wanted(info.filename):
+                        add(info.filename, info.file_size, lambda: zf.read(info))
+        else:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tf:
+                for info in tf:
+                    if info.isfile() and wanted(info.name):
+                        add(info.name, info.size, lambda: tf.extractfile(info).read())
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Could not read archive: {e}")
+
+    return members
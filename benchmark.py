@@ -0,0 +1,221 @@
+"""
+End-to-end benchmark for the Echoguard inference path.
+
+Generates synthetic WAV clips locally, times every stage of feature extraction
+and scoring, and load-tests the FastAPI app in-process at several concurrency
+levels. Results are written as JSON; pass --baseline to compare with a
+previous run and exit non-zero if latency or throughput regressed.
+
+Usage:
+    python benchmark.py --out bench_results.json
+    python benchmark.py --baseline bench_results.json --tolerance 0.2
+"""
+import os
+import io
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+import platform
+import numpy as np
+
+DEFAULT_LENGTHS = [1.0, 5.0, 30.0]
+DEFAULT_RATES = [8000, 16000, 44100]
+DEFAULT_CONCURRENCY = [1, 4, 16]
+
+
+# --- 1. Synthetic Audio ---
+def synth_wav(seconds, sr, seed=0):
+    """A speech-like test clip (harmonics with vibrato plus noise) as 16-bit PCM WAV bytes."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 140 + 20 * np.sin(2 * np.pi * 3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 6)) * 0.2
+    y += 0.02 * rng.standard_normal(len(t))
+    pcm = np.clip(y * 32767, -32768, 32767).astype("<i2")
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def _percentiles(samples_s):
+    ms = np.asarray(samples_s) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 4), "p99_ms": round(float(np.percentile(ms, 99)), 4)}
+
+
+# --- 2. Stage Timings ---
+def bench_stages(lengths, rates, repeats):
+    """
+    Times decode, resample, MFCC, deltas + statistics (one fused pass, see
+    features.py), scale and score for every clip shape.
+    """
+    import inference
+    import features
+    from audio_io import decode_audio
+
+    compiled = inference.load_compiled()
+    results = {}
+    for sr in rates:
+        for seconds in lengths:
+            data = synth_wav(seconds, sr)
+            stages = ("decode", "resample", "mfcc", "deltas_stats", "scale", "score", "total")
+            timings = {stage: [] for stage in stages}
+            for _ in range(repeats):
+                decoding = {}
+                t0 = time.perf_counter()
+                y, _ = decode_audio(data, sr=features.SAMPLE_RATE, timings=decoding)
+                t2 = time.perf_counter()
+                t1 = t2 - decoding.get("resample", 0.0)
+                mfccs = features.mfcc(y, features.SAMPLE_RATE)
+                t3 = time.perf_counter()
+                vector = features.summarize(mfccs)
+                t4 = time.perf_counter()
+                Z = compiled.scale(vector)
+                t5 = time.perf_counter()
+                compiled.score_scaled(Z)
+                t6 = time.perf_counter()
+
+                for stage, (start, end) in zip(
+                    stages, ((t0, t1), (t1, t2), (t2, t3), (t3, t4), (t4, t5), (t5, t6), (t0, t6)),
+                ):
+                    timings[stage].append(end - start)
+
+            key = f"{sr}Hz_{seconds:g}s"
+            results[key] = {stage: _percentiles(values) for stage, values in timings.items()}
+            results[key]["decode_path"] = decoding["decode_path"]
+            print(f"  {key:>14}: total p50 {results[key]['total']['p50_ms']:.2f} ms "
+                  f"(mfcc {results[key]['mfcc']['p50_ms']:.2f}, resample {results[key]['resample']['p50_ms']:.2f}, "
+                  f"{decoding['decode_path']})")
+    return results
+
+
+# --- 3. In-Process Load Test ---
+async def _load_test(concurrency_levels, requests_per_level, clip_seconds):
+    # Repeated identical uploads would only measure the result cache
+    os.environ["ECHOGUARD_CACHE_MB"] = "0"
+    os.environ.pop("ECHOGUARD_CACHE_DIR", None)
+    import httpx
+    import app as api
+
+    data = synth_wav(clip_seconds, 16000)
+    results = {}
+    async with api.app.router.lifespan_context(api.app):
+        # Wait for the warm-up so cold start is not counted as latency
+        for _ in range(600):
+            if api.READY:
+                break
+            await asyncio.sleep(0.1)
+
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for concurrency in concurrency_levels:
+                latencies, errors = [], 0
+                queue = asyncio.Queue()
+                for _ in range(requests_per_level):
+                    queue.put_nowait(None)
+
+                async def worker():
+                    nonlocal errors
+                    while not queue.empty():
+                        queue.get_nowait()
+                        start = time.perf_counter()
+                        response = await client.post("/predict", files={"audio_file": ("bench.wav", data)})
+                        latencies.append(time.perf_counter() - start)
+                        if response.status_code != 200:
+                            errors += 1
+
+                started = time.perf_counter()
+                await asyncio.gather(*[worker() for _ in range(concurrency)])
+                elapsed = time.perf_counter() - started
+
+                results[f"c{concurrency}"] = {
+                    **_percentiles(latencies),
+                    "throughput_rps": round(len(latencies) / elapsed, 3),
+                    "errors": errors,
+                }
+                print(f"  concurrency {concurrency:>3}: p50 {results[f'c{concurrency}']['p50_ms']:.1f} ms, "
+                      f"p99 {results[f'c{concurrency}']['p99_ms']:.1f} ms, "
+                      f"{results[f'c{concurrency}']['throughput_rps']:.1f} req/s, {errors} errors")
+    return results
+
+
+# --- 4. Baseline Comparison ---
+def compare(current, baseline, tolerance, min_delta_ms=0.1):
+    """
+    Returns a list of regressions: latencies (p50/p99) more than `tolerance`
+    above the baseline (and by at least min_delta_ms, so microsecond-scale
+    stages do not trip on noise), or throughput more than `tolerance` below it.
+    """
+    regressions = []
+
+    def walk(cur, base, path):
+        for key, value in cur.items():
+            if key not in base:
+                continue
+            if isinstance(value, dict):
+                walk(value, base[key], path + [key])
+            elif (key in ("p50_ms", "p99_ms") and value > base[key] * (1 + tolerance)
+                  and value - base[key] >= min_delta_ms):
+                regressions.append((".".join(path + [key]), base[key], value))
+            elif key == "throughput_rps" and value < base[key] * (1 - tolerance):
+                regressions.append((".".join(path + [key]), base[key], value))
+
+    walk(current.get("stages", {}), baseline.get("stages", {}), ["stages"])
+    walk(current.get("load", {}), baseline.get("load", {}), ["load"])
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Echoguard inference path.")
+    parser.add_argument("--lengths", type=float, nargs="+", default=DEFAULT_LENGTHS, help="Clip lengths (s)")
+    parser.add_argument("--rates", type=int, nargs="+", default=DEFAULT_RATES, help="Clip sample rates (Hz)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per clip for the stage benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--load-clip", type=float, default=5.0, help="Clip length (s) used for the load test")
+    parser.add_argument("--skip-load", action="store_true", help="Only run the stage benchmark")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="Previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "workers": os.environ.get("ECHOGUARD_WORKERS"),
+        },
+    }
+
+    print("Stage timings (per clip):")
+    results["stages"] = bench_stages(args.lengths, args.rates, args.repeats)
+
+    if not args.skip_load:
+        print(f"\nLoad test ({args.requests} x {args.load_clip:g}s clips per level):")
+        results["load"] = asyncio.run(_load_test(args.concurrency, args.requests, args.load_clip))
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to '{args.out}'")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n!!! {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, before, after in regressions:
+                print(f"  {name}: {before} -> {after}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against '{args.baseline}'.")
@@ -0,0 +1,382 @@
+"""
+Vectorized evaluation and score calibration for the Echoguard model.
+
+Scores a whole feature store (or X_features.npy / y_labels.npy) with the
+compiled model in large batches, sweeps every decision threshold at once
+(ROC and DET curves, EER, TPR at fixed FPRs) and fits a Platt mapping from
+decision values to P(FAKE). The mapping is saved as JSON and loaded by the
+API at startup (ECHOGUARD_CALIBRATION), which then reports calibrated
+probabilities instead of raw |decision values| as confidence.
+
+Usage:
+    python calibration.py --out calibration.json
+    python calibration.py --store feature_store --target-fpr 0.01 --operating-fpr 0.01
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+
+# Class meaning used by Echoguard.py when labelling the training folders
+CLASS_NAMES = {0: "REAL", 1: "FAKE"}
+# FAKE is the positive class: a false positive flags a real caller
+POSITIVE = 1
+DEFAULT_TARGET_FPRS = (0.001, 0.01, 0.05)
+
+
+def model_id(compiled):
+    """
+    Identifies a compiled model by its numbers, so a calibration is only
+    applied to the model it was fitted on (whether served from the .pkl
+    files or a memory-mapped export, in float32 or float64).
+    """
+    # Rounded summaries rather than raw bytes, which differ between dtypes
+    parts = [compiled.n_support, compiled.n_features, compiled.classes.tolist(),
+             f"{compiled.intercept:.5g}", f"{compiled.gamma:.5g}"]
+    for array in (compiled.dual_coef, compiled.sv_bias, compiled.offset, compiled.inv_scale):
+        array = np.asarray(array, dtype=np.float64)
+        parts.append(f"{np.abs(array).sum():.5g}|{np.square(array).sum():.5g}")
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+
+
+# --- 1. Batch Scoring ---
+def score_batches(compiled, batches, batch_size=8192):
+    """
+    Scores (X, y) blocks with the compiled model, batch_size rows per kernel
+    evaluation.
+
+    Returns:
+        tuple: (decision values, labels) as float64 / int arrays.
+    """
+    scores, labels = [], []
+    for X, y in batches:
+        for start in range(0, len(X), batch_size):
+            scores.append(compiled.decision_function(X[start:start + batch_size]).astype(np.float64))
+        labels.append(np.asarray(y).astype(int))
+    if not scores:
+        return np.empty(0), np.empty(0, dtype=int)
+    return np.concatenate(scores), np.concatenate(labels)
+
+
+# --- 2. Threshold Sweep ---
+def sweep(scores, labels):
+    """
+    Error rates at every distinct threshold in one sort and two cumulative sums.
+
+    A clip is called FAKE when its score is >= threshold. Thresholds run from
+    high (nothing flagged) to low (everything flagged).
+
+    Returns:
+        dict: arrays threshold, fpr, tpr and fnr.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    positive = np.asarray(labels) == POSITIVE
+    n_pos, n_neg = int(positive.sum()), int((~positive).sum())
+    if n_pos == 0 or n_neg == 0:
+        raise ValueError("Need both REAL and FAKE samples to sweep thresholds.")
+
+    order = np.argsort(-scores, kind="mergesort")
+    scores, positive = scores[order], positive[order]
+    # Last index of every run of equal scores
+    distinct = np.flatnonzero(np.diff(scores)) if len(scores) > 1 else np.empty(0, dtype=int)
+    ends = np.append(distinct, len(scores) - 1)
+
+    tp = np.cumsum(positive)[ends]
+    fp = (ends + 1) - tp
+    threshold = np.concatenate([[np.inf], scores[ends]])
+    tpr = np.concatenate([[0.0], tp / n_pos])
+    fpr = np.concatenate([[0.0], fp / n_neg])
+    return {"threshold": threshold, "fpr": fpr, "tpr": tpr, "fnr": 1.0 - tpr}
+
+
+def auc(curve):
+    """Area under the ROC curve (trapezoidal)."""
+    return float(np.sum(np.diff(curve["fpr"]) * (curve["tpr"][1:] + curve["tpr"][:-1]) / 2))
+
+
+def equal_error_rate(curve):
+    """EER and its threshold, interpolated where FPR crosses FNR."""
+    diff = curve["fpr"] - curve["fnr"]
+    i = int(np.argmax(diff >= 0))
+    if i == 0:
+        return float(curve["fpr"][0]), float(curve["threshold"][1])
+    # Linear interpolation between points i-1 (fpr < fnr) and i (fpr >= fnr)
+    w = -diff[i - 1] / (diff[i] - diff[i - 1])
+    eer = curve["fpr"][i - 1] + w * (curve["fpr"][i] - curve["fpr"][i - 1])
+    return float(eer), float(curve["threshold"][i])
+
+
+def operating_points(curve, target_fprs=DEFAULT_TARGET_FPRS):
+    """
+    For each target FPR, the threshold with the highest TPR whose FPR does not
+    exceed it.
+
+    A target below the first achievable FPR step (one REAL clip scored above
+    every FAKE) would need threshold +inf, i.e. never calling FAKE; it gets
+    threshold None instead.
+
+    Returns:
+        list of dicts: target_fpr, threshold, fpr, tpr.
+    """
+    points = []
+    for target in target_fprs:
+        # fpr is non-decreasing along the sweep: last index still within target
+        i = int(np.searchsorted(curve["fpr"], target, side="right")) - 1
+        points.append({
+            "target_fpr": target,
+            "threshold": float(curve["threshold"][i]) if i > 0 else None,
+            "fpr": float(curve["fpr"][i]),
+            "tpr": float(curve["tpr"][i]),
+        })
+    return points
+
+
+def at_threshold(scores, labels, threshold):
+    """Accuracy and error rates when calling FAKE at score >= threshold."""
+    flagged = np.asarray(scores) >= threshold
+    positive = np.asarray(labels) == POSITIVE
+    return {
+        "threshold": float(threshold),
+        "accuracy": float(np.mean(flagged == positive)),
+        "fpr": float(np.mean(flagged[~positive])),
+        "tpr": float(np.mean(flagged[positive])),
+    }
+
+
+# --- 3. Platt Calibration ---
+def fit_platt(scores, labels, iterations=100, tol=1e-10):
+    """
+    Fits P(FAKE | score) = 1 / (1 + exp(a * score + b)) by Newton's method,
+    with Platt's smoothed targets (as in libsvm's probability estimates).
+
+    Returns:
+        tuple: (a, b)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    positive = np.asarray(labels) == POSITIVE
+    n_pos, n_neg = positive.sum(), (~positive).sum()
+    target = np.where(positive, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+
+    a, b = 0.0, np.log((n_neg + 1.0) / (n_pos + 1.0))
+    for _ in range(iterations):
+        p = _sigmoid(-(a * scores + b))
+        # Gradient and Hessian of the cross-entropy with respect to (a, b)
+        d = target - p
+        w = np.maximum(p * (1 - p), 1e-12)
+        g = np.array([np.dot(d, scores), d.sum()])
+        H = np.array([[np.dot(w, scores * scores), np.dot(w, scores)], [np.dot(w, scores), w.sum()]])
+        H[np.diag_indices(2)] += 1e-12
+        step = np.linalg.solve(H, g)
+        a, b = a - step[0], b - step[1]
+        if np.abs(step).max() < tol:
+            break
+    return float(a), float(b)
+
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def log_loss(probabilities, labels):
+    p = np.clip(probabilities, 1e-12, 1 - 1e-12)
+    positive = np.asarray(labels) == POSITIVE
+    return float(-np.mean(np.where(positive, np.log(p), np.log(1 - p))))
+
+
+class Calibration:
+    """
+    Maps decision values to P(FAKE) and holds the decision threshold the API
+    should use. Saved and loaded as a small JSON file.
+    """
+
+    def __init__(self, a, b, threshold=0.0, classes=None, model_id=None, meta=None):
+        self.a = float(a)
+        self.b = float(b)
+        self.threshold = float(threshold)
+        if not np.isfinite(self.threshold):
+            # +inf would never call FAKE (and is not valid JSON)
+            raise ValueError(f"Calibration threshold must be finite, got {self.threshold}.")
+        self.classes = {int(k): v for k, v in (classes or CLASS_NAMES).items()}
+        self.model_id = model_id
+        self.meta = meta or {}
+
+    def fake_probability(self, scores):
+        return _sigmoid(-(self.a * np.asarray(scores, dtype=np.float64) + self.b))
+
+    def save(self, path):
+        body = {
+            "a": self.a,
+            "b": self.b,
+            "threshold": self.threshold,
+            "classes": {str(k): v for k, v in self.classes.items()},
+            "model_id": self.model_id,
+            **self.meta,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(body, f, indent=2, allow_nan=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            body = json.load(f)
+        meta = {k: v for k, v in body.items() if k not in ("a", "b", "threshold", "classes", "model_id")}
+        return cls(body["a"], body["b"], body.get("threshold", 0.0), body.get("classes"), body.get("model_id"), meta)
+
+
+# --- 4. Label Mapping Check ---
+def check_label_mapping(compiled, curve):
+    """
+    Checks that the saved model's classes and score direction match the
+    training labels (0 = REAL, 1 = FAKE, positive decision value = FAKE).
+
+    Returns:
+        dict: classes, auc and a list of problems (empty when consistent).
+    """
+    problems = []
+    classes = [int(c) for c in compiled.classes]
+    if classes != sorted(CLASS_NAMES):
+        problems.append(f"Model classes are {classes}, expected {sorted(CLASS_NAMES)}.")
+    area = auc(curve)
+    if area < 0.5:
+        problems.append(f"AUC is {area:.3f} (< 0.5): high scores mean REAL, so 0/1 are swapped somewhere.")
+    return {
+        "classes": {str(c): CLASS_NAMES.get(c, "?") for c in classes},
+        "positive_score_means": CLASS_NAMES.get(classes[-1], "?"),
+        "auc": area,
+        "problems": problems,
+    }
+
+
+def _summary(curve, scores, labels, target_fprs):
+    eer, eer_threshold = equal_error_rate(curve)
+    return {
+        "samples": int(len(scores)),
+        "real": int(np.sum(labels != POSITIVE)),
+        "fake": int(np.sum(labels == POSITIVE)),
+        "auc": auc(curve),
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+        "default_threshold": at_threshold(scores, labels, 0.0),
+        "operating_points": operating_points(curve, target_fprs),
+    }
+
+
+def write_curves(path, curve, max_points=1000):
+    """Writes the ROC/DET curve (threshold, fpr, tpr, fnr) as CSV, thinned to at most max_points rows."""
+    n = len(curve["threshold"])
+    keep = np.unique(np.linspace(0, n - 1, min(n, max_points)).round().astype(int))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["threshold", "fpr", "tpr", "fnr"])
+        for i in keep:
+            writer.writerow([repr(float(curve["threshold"][i])), f"{curve['fpr'][i]:.6f}",
+                             f"{curve['tpr'][i]:.6f}", f"{curve['fnr'][i]:.6f}"])
+
+
+def _print_summary(name, s):
+    print(f"\n{name}: {s['samples']} clips ({s['real']} REAL, {s['fake']} FAKE)")
+    print(f"  AUC {s['auc']:.4f}   EER {s['eer'] * 100:.2f}% (threshold {s['eer_threshold']:.4f})")
+    d = s["default_threshold"]
+    print(f"  threshold 0: accuracy {d['accuracy'] * 100:.2f}%, FPR {d['fpr'] * 100:.2f}%, TPR {d['tpr'] * 100:.2f}%")
+    for p in s["operating_points"]:
+        if p["threshold"] is None:
+            print(f"  FPR <= {p['target_fpr'] * 100:g}%: not reachable on these clips")
+            continue
+        print(f"  FPR <= {p['target_fpr'] * 100:g}%: threshold {p['threshold']:.4f}, "
+              f"FPR {p['fpr'] * 100:.2f}%, TPR {p['tpr'] * 100:.2f}%")
+
+
+if __name__ == '__main__':
+    from feature_store import FeatureStore
+    from features import FEATURE_VERSION
+    import inference
+
+    parser = argparse.ArgumentParser(description="Evaluate the Echoguard model on a whole corpus and calibrate it.")
+    parser.add_argument("--store", default=None, help="Feature store directory (default: X_features.npy / y_labels.npy)")
+    parser.add_argument("--features", default=os.path.join(inference.BASE_DIR, "X_features.npy"))
+    parser.add_argument("--labels", default=os.path.join(inference.BASE_DIR, "y_labels.npy"))
+    parser.add_argument("--feature-version", default=FEATURE_VERSION,
+                        help="Only use store rows with this feature version ('all' mixes every version)")
+    parser.add_argument("--model", default=inference.MODEL_PATH)
+    parser.add_argument("--scaler", default=inference.SCALER_PATH)
+    parser.add_argument("--model-export", default=None, help="Score with a compiled export instead of the .pkl files")
+    parser.add_argument("--batch-size", type=int, default=8192, help="Rows per kernel evaluation")
+    parser.add_argument("--target-fpr", type=float, nargs="+", default=list(DEFAULT_TARGET_FPRS))
+    parser.add_argument("--operating-fpr", type=float, default=None,
+                        help="Make the API call FAKE at the threshold for this FPR "
+                             "(default: where the calibrated P(FAKE) reaches 0.5)")
+    parser.add_argument("--fit-on", choices=["holdout", "all"], default="holdout",
+                        help="Fit the calibration on trainmodel.py's held-out 20%% split (default) or on every clip")
+    parser.add_argument("--out", default=os.path.join(inference.BASE_DIR, "calibration.json"))
+    parser.add_argument("--curves", default=os.path.join(inference.BASE_DIR, "calibration_curves.csv"))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    compiled = inference.load_compiled(args.model, args.scaler, export_dir=args.model_export)
+
+    # 1. Score the whole corpus in large batches (shards stay memory-mapped)
+    if args.store:
+        store = FeatureStore(args.store)
+        version = None if args.feature_version == "all" else args.feature_version
+        batches = ((X, y) for X, y, _ in store.iter_batches(version))
+    else:
+        batches = [(np.load(args.features, mmap_mode="r"), np.load(args.labels))]
+    scores, labels = score_batches(compiled, batches, args.batch_size)
+    scored_s = time.perf_counter() - started
+    print(f"Scored {len(scores)} clips in {scored_s:.2f}s "
+          f"({len(scores) / max(scored_s, 1e-9):.0f} clips/s, {compiled.n_support} kernel rows).")
+
+    # 2. Curves and operating points for the whole corpus and the held-out split
+    curve = sweep(scores, labels)
+    report = {"all": _summary(curve, scores, labels, args.target_fpr)}
+    _print_summary("All clips (includes training data, so optimistic)", report["all"])
+
+    from sklearn.model_selection import train_test_split
+    # Same split as trainmodel.py, so these clips were not seen in training
+    _, holdout = train_test_split(np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels)
+    holdout_curve = sweep(scores[holdout], labels[holdout])
+    report["holdout"] = _summary(holdout_curve, scores[holdout], labels[holdout], args.target_fpr)
+    _print_summary("Held-out split", report["holdout"])
+
+    mapping = check_label_mapping(compiled, curve)
+    print(f"\nLabel mapping: classes {mapping['classes']}, positive scores mean {mapping['positive_score_means']}")
+    for problem in mapping["problems"]:
+        print(f"!!! {problem}")
+
+    # 3. Platt calibration on the chosen rows
+    fit_rows = holdout if args.fit_on == "holdout" else np.arange(len(labels))
+    a, b = fit_platt(scores[fit_rows], labels[fit_rows])
+    fit_curve = holdout_curve if args.fit_on == "holdout" else curve
+    # P(FAKE) = 0.5 at a * score + b = 0, so the label always agrees with the probability
+    threshold = -b / a if a < 0 else 0.0
+    if args.operating_fpr is not None:
+        threshold = operating_points(fit_curve, [args.operating_fpr])[0]["threshold"]
+        if threshold is None:
+            print(f"!!! ERROR: No threshold keeps FPR <= {args.operating_fpr:g} on the {len(fit_rows)} calibration "
+                  f"clips; the lowest reachable FPR is {fit_curve['fpr'][1]:g}. Choose a larger --operating-fpr "
+                  f"(or calibrate on more REAL clips).")
+            sys.exit(2)
+    calibration = Calibration(a, b, threshold, model_id=model_id(compiled), meta={
+        "fit_on": args.fit_on,
+        "feature_version": args.feature_version,
+        "operating_fpr": args.operating_fpr,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label_mapping": mapping,
+        "report": report,
+    })
+    probabilities = calibration.fake_probability(scores[fit_rows])
+    calibration.meta["log_loss"] = log_loss(probabilities, labels[fit_rows])
+    calibration.save(args.out)
+    write_curves(args.curves, curve)
+
+    print(f"\nPlatt calibration: P(FAKE) = 1 / (1 + exp({a:.4f} * score {b:+.4f})), "
+          f"log loss {calibration.meta['log_loss']:.4f} on {len(fit_rows)} clips")
+    print(f"API threshold: {threshold:.4f}")
+    print(f"Saved '{args.out}' and '{args.curves}' in {time.perf_counter() - started:.2f}s")
+    sys.exit(1 if mapping["problems"] else 0)
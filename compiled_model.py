@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+
+class CompiledSVM:
+    """
+    A fitted StandardScaler + RBF SVC folded into plain NumPy arrays.
+
+    scikit-learn's predict() and decision_function() each evaluate the RBF
+    kernel against every support vector, so calling both doubles the cost of
+    inference. Here scaling, one kernel evaluation and the thresholding happen
+    in a single vectorized pass, and the label is derived from the sign of
+    the decision value (for a binary SVC, > 0 means classes_[1]).
+    """
+
+    # Arrays written by save() and memory-mapped by load()
+    ARRAYS = ("inv_scale", "offset", "sv_t", "sv_bias", "dual_coef")
+
+    def __init__(self, inv_scale, offset, sv_t, sv_bias, dual_coef, intercept, gamma, classes):
+        # Arrays are used as given (no copies), so memory-mapped ones stay shared
+        self.inv_scale = inv_scale
+        self.offset = offset
+        self.sv_t = sv_t
+        self.sv_bias = sv_bias
+        self.dual_coef = dual_coef
+        self.intercept = float(intercept)
+        self.gamma = float(gamma)
+        self.classes = np.asarray(classes)
+        self.dtype = np.dtype(sv_t.dtype)
+        self.n_features = sv_t.shape[0]
+
+    @classmethod
+    def from_sklearn(cls, model, scaler, dtype=np.float64):
+        """Builds the compiled form from a fitted binary RBF SVC and its StandardScaler."""
+        if getattr(model, "kernel", None) != "rbf":
+            raise ValueError(f"Only RBF SVC models can be compiled (got kernel={getattr(model, 'kernel', None)!r}).")
+        if len(model.classes_) != 2:
+            raise ValueError("Only binary SVC models can be compiled.")
+
+        dtype = np.dtype(dtype)
+        n_features = model.support_vectors_.shape[1]
+        mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(n_features)
+        scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(n_features)
+        inv_scale = 1.0 / np.asarray(scale, dtype=np.float64)
+        # _gamma holds the value gamma='scale'/'auto' resolved to at fit time
+        gamma = float(model._gamma)
+
+        # exp(-gamma * |z - sv|^2) = exp(2*gamma*z.sv - gamma*|z|^2 - gamma*|sv|^2)
+        sv = np.asarray(model.support_vectors_, dtype=np.float64)
+        return cls(
+            # Scaling folded into one multiply-add: z = x * inv_scale + offset
+            inv_scale=inv_scale.astype(dtype),
+            offset=(-np.asarray(mean, dtype=np.float64) * inv_scale).astype(dtype),
+            sv_t=np.ascontiguousarray((2.0 * gamma) * sv.T, dtype=dtype),
+            sv_bias=(-gamma * np.einsum("ij,ij->i", sv, sv)).astype(dtype),
+            dual_coef=np.asarray(model.dual_coef_[0], dtype=dtype),
+            intercept=model.intercept_[0],
+            gamma=gamma,
+            classes=model.classes_,
+        )
+
+    @classmethod
+    def from_nystroem(cls, approx, scaler, dtype=np.float64):
+        """
+        Builds the compiled form of an approximate engine: a Pipeline of
+        Nystroem(kernel='rbf') followed by a binary linear classifier.
+
+        The Nystroem map is K(z, components) @ normalization.T, so the linear
+        decision folds into K(z, components) @ (normalization.T @ coef) + b:
+        the same kernel expansion as an SVM, but over a fixed number of
+        landmarks instead of a support set that grows with the data.
+        """
+        nystroem, linear = approx[0], approx[-1]
+        if getattr(nystroem, "kernel", None) != "rbf" or nystroem.gamma is None:
+            raise ValueError("The approximate engine needs Nystroem(kernel='rbf') with an explicit gamma.")
+        if len(linear.classes_) != 2:
+            raise ValueError("Only binary classifiers can be compiled.")
+
+        dtype = np.dtype(dtype)
+        n_features = nystroem.components_.shape[1]
+        mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(n_features)
+        scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(n_features)
+        inv_scale = 1.0 / np.asarray(scale, dtype=np.float64)
+        gamma = float(nystroem.gamma)
+
+        landmarks = np.asarray(nystroem.components_, dtype=np.float64)
+        weights = nystroem.normalization_.T @ np.asarray(linear.coef_[0], dtype=np.float64)
+        return cls(
+            inv_scale=inv_scale.astype(dtype),
+            offset=(-np.asarray(mean, dtype=np.float64) * inv_scale).astype(dtype),
+            sv_t=np.ascontiguousarray((2.0 * gamma) * landmarks.T, dtype=dtype),
+            sv_bias=(-gamma * np.einsum("ij,ij->i", landmarks, landmarks)).astype(dtype),
+            dual_coef=weights.astype(dtype),
+            intercept=np.ravel(linear.intercept_)[0],
+            gamma=gamma,
+            classes=linear.classes_,
+        )
+
+    @classmethod
+    def from_estimator(cls, model, scaler, dtype=np.float64):
+        """Compiles either engine: an exact RBF SVC or a Nystroem + linear Pipeline."""
+        if hasattr(model, "steps"):
+            return cls.from_nystroem(model, scaler, dtype=dtype)
+        return cls.from_sklearn(model, scaler, dtype=dtype)
+
+    # --- Flat export for fast, shared startup ---
+    def save(self, export_dir):
+        """
+        Writes the compiled arrays as plain .npy files plus meta.json.
+
+        Every worker can then np.load(..., mmap_mode='r') them: nothing is
+        unpickled, and the support vectors sit in the page cache once no
+        matter how many processes serve them.
+        """
+        os.makedirs(export_dir, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(export_dir, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            "intercept": self.intercept,
+            "gamma": self.gamma,
+            "classes": self.classes.tolist(),
+            "dtype": self.dtype.name,
+            "n_features": self.n_features,
+            "n_support": self.n_support,
+        }
+        # meta.json last: its presence marks a complete export
+        with open(os.path.join(export_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, export_dir, mmap=True):
+        """Loads an export written by save(), memory-mapped by default."""
+        with open(os.path.join(export_dir, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(export_dir, name + ".npy"), mmap_mode="r" if mmap else None)
+            for name in cls.ARRAYS
+        }
+        return cls(intercept=meta["intercept"], gamma=meta["gamma"], classes=meta["classes"], **arrays)
+
+    @property
+    def n_support(self):
+        return self.dual_coef.shape[0]
+
+    def scale(self, X):
+        """Applies the folded StandardScaler to raw (n, 78) features."""
+        Z = np.asarray(X, dtype=self.dtype).reshape(-1, self.n_features)
+        Z = Z * self.inv_scale
+        Z += self.offset
+        return Z
+
+    def score_scaled(self, Z):
+        """Returns the decision values of already scaled features."""
+        # One kernel evaluation against all support vectors, done in place
+        K = Z @ self.sv_t
+        K += self.sv_bias
+        K -= (self.gamma * np.einsum("ij,ij->i", Z, Z))[:, None].astype(self.dtype, copy=False)
+        np.exp(K, out=K)
+
+        return K @ self.dual_coef + self.dtype.type(self.intercept)
+
+    def decision_function(self, X):
+        """Scales raw (n, 78) features and returns the SVM decision values."""
+        return self.score_scaled(self.scale(X))
+
+    def labels(self, scores):
+        """Maps decision values to the model's classes (> 0 means classes_[1])."""
+        return self.classes[(np.asarray(scores) > 0).astype(int)]
+
+    def predict(self, X):
+        """
+        Returns:
+            tuple: (labels, scores) where labels are taken from the model's
+            classes_ and scores are the decision values.
+        """
+        scores = self.decision_function(X)
+        return self.labels(scores), scores
+
+
+# --- Parity Check ---
+def check_parity(model, scaler, X, dtype=np.float64, atol=None):
+    """
+    Compares CompiledSVM with scikit-learn on X.
+
+    Returns:
+        dict: max absolute score difference and number of label mismatches.
+    """
+    compiled = CompiledSVM.from_sklearn(model, scaler, dtype=dtype)
+    X_scaled = scaler.transform(X)
+    expected_scores = model.decision_function(X_scaled)
+    expected_labels = model.predict(X_scaled)
+
+    labels, scores = compiled.predict(X)
+    if atol is None:
+        atol = 1e-4 if np.dtype(dtype) == np.float32 else 1e-8
+
+    max_diff = float(np.max(np.abs(scores - expected_scores))) if len(X) else 0.0
+    # Labels may only differ where the float32 score is within atol of the threshold
+    mismatched = labels != expected_labels
+    unexplained = int(np.sum(mismatched & (np.abs(expected_scores) > atol)))
+
+    return {
+        "dtype": np.dtype(dtype).name,
+        "samples": len(X),
+        "max_score_diff": max_diff,
+        "label_mismatches": int(np.sum(mismatched)),
+        "ok": max_diff <= atol and unexplained == 0,
+    }
+
+
+if __name__ == '__main__':
+    # Usage:
+    #   python compiled_model.py check [X_features.npy]     compare with scikit-learn
+    #   python compiled_model.py export model_export [--float32] [--engine approx]
+    import joblib
+    from inference import MODEL_PATH, SCALER_PATH, APPROX_MODEL_PATH, BASE_DIR
+
+    parser = argparse.ArgumentParser(description="Check or export the compiled Echoguard model.")
+    sub = parser.add_subparsers(dest="command")
+    check = sub.add_parser("check", help="Compare with scikit-learn on saved features")
+    check.add_argument("features", nargs="?", default=os.path.join(BASE_DIR, "X_features.npy"))
+    export = sub.add_parser("export", help="Write memory-mappable arrays for ECHOGUARD_MODEL_EXPORT")
+    export.add_argument("out_dir", nargs="?", default=os.path.join(BASE_DIR, "model_export"))
+    export.add_argument("--float32", action="store_true")
+    export.add_argument("--engine", choices=["exact", "approx"], default="exact")
+    args = parser.parse_args()
+
+    model = joblib.load(MODEL_PATH)
+    scaler = joblib.load(SCALER_PATH)
+
+    if args.command == "export":
+        if args.engine == "approx":
+            model = joblib.load(APPROX_MODEL_PATH)
+        compiled = CompiledSVM.from_estimator(model, scaler, dtype=np.float32 if args.float32 else np.float64)
+        compiled.save(args.out_dir)
+        print(f"Exported {compiled.n_support} support vectors ({compiled.dtype.name}) to {args.out_dir}")
+        sys.exit(0)
+
+    X = np.load(getattr(args, "features", os.path.join(BASE_DIR, "X_features.npy"))).astype(np.float64)
+
+    all_ok = True
+    for dtype in (np.float64, np.float32):
+        report = check_parity(model, scaler, X, dtype=dtype)
+        all_ok &= report["ok"]
+        print(f"{report['dtype']}: {report['samples']} samples, max score diff {report['max_score_diff']:.2e}, "
+              f"label mismatches {report['label_mismatches']} -> {'OK' if report['ok'] else 'FAILED'}")
+
+    sys.exit(0 if all_ok else 1)
@@ -0,0 +1,229 @@
+import os
+import csv
+import glob
+import fcntl
+import hashlib
+import numpy as np
+
+INDEX_FIELDS = ['shard', 'offset', 'path', 'label', 'content_hash', 'feature_version']
+
+
+def file_hash(file_path):
+    """sha256 of a file's bytes, used to spot the same clip under different names."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """
+    Append-only, sharded store of feature vectors.
+
+    Layout:
+        <root>/shards/shard_000000.npy   float32 (rows, 78) feature blocks
+        <root>/index.csv                 one line per row: shard, offset, path,
+                                         label, content_hash, feature_version
+
+    Each append writes one new shard (never modifies old ones) and then adds
+    its rows to the index, so a crash can at worst leave an unindexed shard
+    that is ignored. Appends hold a lock file, so several processes (API
+    workers taking feedback, an extraction run) can share one store.
+    Shards are opened with np.load(mmap_mode='r'), so readers page features
+    in from disk instead of holding copies in RAM.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.shard_dir = os.path.join(root, 'shards')
+        self.index_path = os.path.join(root, 'index.csv')
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._index = None
+        self._shards = {}
+        # Read incrementally by latest_labels(): content hash -> latest label, and how far index.csv was read
+        self._latest = {}
+        self._read_to = 0
+        self.indexed_rows = 0
+
+    # --- Index ---
+    def index(self):
+        """Returns the index rows (list of dicts) in store order."""
+        if self._index is None:
+            rows = []
+            if os.path.exists(self.index_path):
+                with open(self.index_path, newline='') as f:
+                    for row in csv.DictReader(f):
+                        row['offset'] = int(row['offset'])
+                        row['label'] = int(float(row['label']))
+                        rows.append(row)
+            self._index = rows
+        return self._index
+
+    def latest_labels(self):
+        """
+        Maps each content hash to the label of its latest row. Only rows
+        appended since the previous call are parsed, so a long-lived store
+        (the API's feedback store) never rescans the whole index.
+        """
+        if not os.path.exists(self.index_path):
+            return self._latest
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._read_to)
+            data = f.read()
+        # Complete lines only: another process may be halfway through a row
+        data = data[:data.rfind(b'\n') + 1]
+        hash_at, label_at = INDEX_FIELDS.index('content_hash'), INDEX_FIELDS.index('label')
+        for row in csv.reader(data.decode().splitlines()):
+            if row == INDEX_FIELDS:
+                continue
+            self.indexed_rows += 1
+            if row[hash_at]:
+                self._latest[row[hash_at]] = int(float(row[label_at]))
+        self._read_to += len(data)
+        return self._latest
+
+    def __len__(self):
+        return len(self.index())
+
+    def known_paths(self, feature_version=None):
+        return {row['path'] for row in self.index()
+                if feature_version is None or row['feature_version'] == feature_version}
+
+    def known_hashes(self, feature_version=None):
+        return {row['content_hash'] for row in self.index()
+                if row['content_hash'] and (feature_version is None or row['feature_version'] == feature_version)}
+
+    # --- Writing ---
+    def append(self, features, paths, labels, feature_version, content_hashes=None, skip_labelled=False):
+        """
+        Adds a block of feature vectors as a new shard and indexes it.
+
+        With skip_labelled, rows whose content hash already has the same
+        label as its latest row are dropped. The check runs under the lock,
+        so two processes cannot both add the same labelled clip.
+
+        Returns:
+            str: the new shard's name, or None if no row was added.
+        """
+        features = np.asarray(features, dtype=np.float32).reshape(len(paths), -1)
+        if len(paths) == 0:
+            return None
+        if len(labels) != len(paths):
+            raise ValueError("paths and labels must have the same length.")
+        content_hashes = content_hashes or [''] * len(paths)
+
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if skip_labelled:
+                latest = dict(self.latest_labels())
+                keep = []
+                for i, (label, content_hash) in enumerate(zip(labels, content_hashes)):
+                    if not content_hash or latest.get(content_hash) != int(label):
+                        keep.append(i)
+                        if content_hash:
+                            latest[content_hash] = int(label)
+                if not keep:
+                    return None
+                features = features[keep]
+                paths = [paths[i] for i in keep]
+                labels = [labels[i] for i in keep]
+                content_hashes = [content_hashes[i] for i in keep]
+            existing = glob.glob(os.path.join(self.shard_dir, 'shard_*.npy'))
+            next_id = 1 + max((int(os.path.basename(p)[6:12]) for p in existing), default=-1)
+            shard = f'shard_{next_id:06d}'
+            shard_path = os.path.join(self.shard_dir, shard + '.npy')
+
+            # Shard first (atomically), index second: the index is the source of truth
+            tmp_path = shard_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, features)
+            os.replace(tmp_path, shard_path)
+
+            new_file = not os.path.exists(self.index_path)
+            with open(self.index_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(INDEX_FIELDS)
+                for offset, (path, label, content_hash) in enumerate(zip(paths, labels, content_hashes)):
+                    writer.writerow([shard, offset, path, int(label), content_hash, feature_version])
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._index = None
+        return shard
+
+    # --- Reading ---
+    def shard(self, name):
+        """Memory-maps one shard (read-only)."""
+        if name not in self._shards:
+            self._shards[name] = np.load(os.path.join(self.shard_dir, name + '.npy'), mmap_mode='r')
+        return self._shards[name]
+
+    def _groups(self, feature_version=None):
+        """Yields (shard name, index rows) for consecutive rows of the same shard."""
+        group, current = [], None
+        for row in self.index():
+            if feature_version is not None and row['feature_version'] != feature_version:
+                continue
+            if row['shard'] != current and group:
+                yield current, group
+                group = []
+            current = row['shard']
+            group.append(row)
+        if group:
+            yield current, group
+
+    def iter_batches(self, feature_version=None):
+        """
+        Streams the store shard by shard without copying.
+
+        Yields:
+            tuple: (X, y, rows) where X is a read-only memmap view of the shard
+            when all its rows are selected.
+        """
+        for name, rows in self._groups(feature_version):
+            data = self.shard(name)
+            offsets = [row['offset'] for row in rows]
+            if offsets == list(range(offsets[0], offsets[0] + len(offsets))):
+                X = data[offsets[0]:offsets[0] + len(offsets)]
+            else:
+                X = data[offsets]
+            y = np.array([row['label'] for row in rows])
+            yield X, y, rows
+
+    def to_arrays(self, feature_version=None, dtype=np.float32):
+        """
+        Materialises the store as one (X, y) pair.
+
+        X is allocated once and filled shard by shard, so peak memory is one
+        copy of the data rather than a list of blocks plus a vstack of them.
+        """
+        rows = [row for row in self.index() if feature_version is None or row['feature_version'] == feature_version]
+        if not rows:
+            return np.empty((0, 0), dtype=dtype), np.empty(0)
+        n_features = self.shard(rows[0]['shard']).shape[1]
+        X = np.empty((len(rows), n_features), dtype=dtype)
+        y = np.empty(len(rows))
+        start = 0
+        for X_batch, y_batch, _ in self.iter_batches(feature_version):
+            X[start:start + len(X_batch)] = X_batch
+            y[start:start + len(y_batch)] = y_batch
+            start += len(X_batch)
+        return X, y
+
+    def export(self, X_path, y_path, feature_version=None):
+        """Writes the legacy X_features.npy / y_labels.npy files, streaming through a memmap."""
+        rows = [row for row in self.index() if feature_version is None or row['feature_version'] == feature_version]
+        n_features = self.shard(rows[0]['shard']).shape[1] if rows else 0
+        X = np.lib.format.open_memmap(X_path, mode='w+', dtype=np.float32, shape=(len(rows), n_features))
+        y = np.empty(len(rows))
+        start = 0
+        for X_batch, y_batch, _ in self.iter_batches(feature_version):
+            X[start:start + len(X_batch)] = X_batch
+            y[start:start + len(y_batch)] = y_batch
+            start += len(X_batch)
+        X.flush()
+        del X
+        np.save(y_path, y)
+        return rows
@@ -0,0 +1,149 @@
+import functools
+import numpy as np
+
+# Bump whenever the computation below changes, so stored vectors and models
+# trained on them are not mixed with new ones.
+FEATURE_VERSION = "mfcc13-d-dd-meanstd-16k-v2"
+
+# Every clip is brought to this rate before extraction, in training and serving
+SAMPLE_RATE = 16000
+# Same framing as librosa.feature.mfcc defaults
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+DELTA_WIDTH = 9
+TOP_DB = 80.0
+AMIN = 1e-10
+
+
+@functools.lru_cache(maxsize=None)
+def bases(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, n_mfcc=N_MFCC):
+    """
+    Builds the constant matrices once per process and shares them between calls.
+
+    Returns:
+        dict: window, mel_basis, dct (float32), delta coefficients for the
+        interior frames and the edge matrices that reproduce the 'interp'
+        mode of librosa.feature.delta at both ends of a clip.
+    """
+    # Deferred: librosa pulls in numba, and only the filterbank is needed from it
+    import librosa
+    import scipy.fft
+    import scipy.signal
+
+    half = DELTA_WIDTH // 2
+    # Columns: the frame itself, its delta and its delta-delta
+    taps = np.zeros((DELTA_WIDTH, 3))
+    taps[half, 0] = 1.0
+    taps[:, 1] = scipy.signal.savgol_coeffs(DELTA_WIDTH, 1, deriv=1, use="dot")
+    taps[:, 2] = scipy.signal.savgol_coeffs(DELTA_WIDTH, 2, deriv=2, use="dot")
+
+    # 'interp' fits the polynomial to the first/last window and evaluates it
+    # at the edge frames: one (width, 3) tap matrix per edge position
+    def edge(pos):
+        column = np.zeros(DELTA_WIDTH)
+        column[pos] = 1.0
+        return np.stack([
+            column,
+            scipy.signal.savgol_coeffs(DELTA_WIDTH, 1, deriv=1, pos=pos, use="dot"),
+            scipy.signal.savgol_coeffs(DELTA_WIDTH, 2, deriv=2, pos=pos, use="dot"),
+        ], axis=1)
+
+    matrices = {
+        "window": scipy.signal.get_window("hann", n_fft, fftbins=True).astype(np.float32),
+        "mel_basis": librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(np.float32),
+        # Orthonormal DCT-II, first n_mfcc rows (what librosa.feature.mfcc applies)
+        "dct": scipy.fft.dct(np.eye(n_mels), type=2, norm="ortho", axis=0)[:n_mfcc].astype(np.float32),
+        "taps": taps.astype(np.float32),
+        "head": np.stack([edge(pos) for pos in range(half)]).astype(np.float32),
+        "tail": np.stack([edge(pos) for pos in range(DELTA_WIDTH - half, DELTA_WIDTH)]).astype(np.float32),
+    }
+    for array in matrices.values():
+        array.setflags(write=False)
+    return matrices
+
+
+def check_rate(sr):
+    if sr != SAMPLE_RATE:
+        raise ValueError(f"Features are defined at {SAMPLE_RATE} Hz, got audio at {sr} Hz; resample first.")
+
+
+# --- 1. MFCCs ---
+def mfcc(y, sr=SAMPLE_RATE, n_mfcc=N_MFCC):
+    """
+    MFCCs of a whole clip as a (frames, n_mfcc) float32 array.
+
+    Same values as librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc) (centred,
+    zero-padded frames, power mel spectrogram, 80 dB floor, orthonormal
+    DCT-II), transposed so frames are rows.
+    """
+    import scipy.fft  # pocketfft with native float32 support, ~3x numpy.fft here
+
+    check_rate(sr)
+    m = bases(sr, N_FFT, N_MELS, n_mfcc)
+    y = np.asarray(y, dtype=np.float32)
+    padded = np.pad(y, N_FFT // 2)
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP_LENGTH]
+
+    spectrum = scipy.fft.rfft(frames * m["window"], axis=1)
+    power = np.square(spectrum.real)
+    power += np.square(spectrum.imag)
+    mel_db = power @ m["mel_basis"].T
+    del spectrum, power
+
+    np.maximum(mel_db, AMIN, out=mel_db)
+    np.log10(mel_db, out=mel_db)
+    mel_db *= 10.0
+    np.maximum(mel_db, mel_db.max() - TOP_DB, out=mel_db)
+    return mel_db @ m["dct"].T
+
+
+# --- 2. Deltas and Statistics (fused) ---
+def summarize(mfccs):
+    """
+    Mean and standard deviation of the MFCCs, their deltas and delta-deltas.
+
+    Every frame's [mfcc, delta, delta2] triple comes out of one matmul of its
+    9-frame window with a (9, 3) tap matrix, and is folded straight into
+    sums and sums of squares: the 39 x T stacked matrix is never built.
+
+    Returns:
+        np.ndarray: 78-dim [means, stds] vector, ordered like
+        np.hstack([mean, std]) of np.vstack([mfcc, delta, delta2]).
+    """
+    mfccs = np.asarray(mfccs, dtype=np.float32)
+    n_frames, n_mfcc = mfccs.shape
+    if n_frames < DELTA_WIDTH:
+        raise ValueError(f"Audio too short: {n_frames} frames, need at least {DELTA_WIDTH}.")
+    m = bases(n_mfcc=n_mfcc)
+
+    # Interior frames: (T - 8, n_mfcc, 9) windows @ (9, 3) taps
+    windows = np.lib.stride_tricks.sliding_window_view(mfccs, DELTA_WIDTH, axis=0)
+    interior = windows @ m["taps"]
+    # Edge frames: the first/last window evaluated at the edge positions
+    head = np.einsum("pwk,wn->pnk", m["head"], mfccs[:DELTA_WIDTH])
+    tail = np.einsum("pwk,wn->pnk", m["tail"], mfccs[-DELTA_WIDTH:])
+
+    total = np.zeros((n_mfcc, 3))
+    total_sq = np.zeros((n_mfcc, 3))
+    for block in (head, interior, tail):
+        total += block.sum(axis=0, dtype=np.float64)
+        total_sq += np.einsum("tnk,tnk->nk", block, block, dtype=np.float64)
+
+    mean = total / n_frames
+    std = np.sqrt(np.maximum(total_sq / n_frames - mean ** 2, 0.0))
+    # (n_mfcc, 3) -> [mfcc..., delta..., delta2...]
+    return np.hstack([mean.T.ravel(), std.T.ravel()])
+
+
+def extract_features(y, sr=SAMPLE_RATE, n_mfcc=N_MFCC):
+    """Extracts the 78-dim MFCC + Delta + Delta-Delta statistics vector from 16 kHz mono audio."""
+    return summarize(mfcc(y, sr, n_mfcc=n_mfcc))
+
+
+def load_audio(file_path):
+    """Loads an audio file as mono float32 at SAMPLE_RATE (the rate the features are defined at)."""
+    import librosa
+    y, _ = librosa.load(file_path, sr=SAMPLE_RATE, mono=True)
+    return y
@@ -0,0 +1,324 @@
+import io
+import os
+import time
+import joblib
+import numpy as np
+from collections import OrderedDict
+
+import features
+from audio_io import decode_audio, iter_audio_blocks
+from compiled_model import CompiledSVM
+
+# Model & scaler live in the root project directory (next to app.py)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "svm_model.pkl")
+SCALER_PATH = os.path.join(BASE_DIR, "scaler.pkl")
+# Optional approximate engine (Nystroem + linear), written by trainmodel.py --approx-components
+APPROX_MODEL_PATH = os.path.join(BASE_DIR, "approx_model.pkl")
+
+# Compiled model of the current process, filled in by init_worker()
+COMPILED = None
+# Registry versions loaded in this process by export directory, least recently used first
+MODELS = OrderedDict()
+MAX_MODELS = 3
+
+
+# --- 1. Model Loading ---
+def load_model(model_path=MODEL_PATH, scaler_path=SCALER_PATH):
+    """Loads the trained model (exact SVM or approximate engine) and feature scaler from disk."""
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    return model, scaler
+
+
+def load_compiled(model_path=MODEL_PATH, scaler_path=SCALER_PATH, float32=False, export_dir=None):
+    """
+    Returns the CompiledSVM used for scoring.
+
+    With export_dir (written by `python compiled_model.py export`) the arrays
+    are memory-mapped, which skips unpickling scikit-learn objects and lets
+    all workers share one copy of the support vectors.
+    """
+    if export_dir:
+        return CompiledSVM.load(export_dir)
+    model, scaler = load_model(model_path, scaler_path)
+    return CompiledSVM.from_estimator(model, scaler, dtype=np.float32 if float32 else np.float64)
+
+
+def init_worker(model_path=MODEL_PATH, scaler_path=SCALER_PATH, float32=False, export_dir=None):
+    """Pool initializer: loads the compiled model once per worker process."""
+    global COMPILED
+    COMPILED = load_compiled(model_path, scaler_path, float32, export_dir)
+    if export_dir:
+        MODELS[export_dir] = COMPILED
+
+
+def compiled_for(model_dir=None):
+    """
+    Returns the model a job asked for: the one loaded by init_worker() when
+    model_dir is None, else the registry export at model_dir, memory-mapped
+    on first use. Jobs name their version, so a worker serves a hot-swapped
+    model without restarting and in-flight jobs finish on the old one.
+    """
+    if model_dir is None:
+        if COMPILED is None:
+            raise RuntimeError("Model not loaded in worker process.")
+        return COMPILED
+    if model_dir in MODELS:
+        MODELS.move_to_end(model_dir)
+        return MODELS[model_dir]
+    MODELS[model_dir] = CompiledSVM.load(model_dir)
+    while len(MODELS) > MAX_MODELS:
+        MODELS.popitem(last=False)
+    return MODELS[model_dir]
+
+
+def warm_up(model_dir=None, runs=1):
+    """
+    Pays the one-off costs before real traffic: imports librosa and runs
+    extraction + scoring on a second of synthetic audio (numba compiles on
+    first use, and a memory-mapped model is paged in).
+
+    Returns:
+        dict: pid and the seconds spent importing and on the first inference.
+    """
+    started = time.perf_counter()
+    import librosa  # noqa: F401
+    imported = time.perf_counter()
+
+    sr = features.SAMPLE_RATE
+    y = (0.1 * np.sin(2 * np.pi * 440 * np.arange(sr) / sr)).astype(np.float32)
+    vector = extract_features(y, sr)
+    compiled = compiled_for(model_dir) if model_dir else COMPILED
+    if compiled is not None:
+        for _ in range(runs):
+            compiled.predict(vector)
+    done = time.perf_counter()
+
+    return {
+        "pid": os.getpid(),
+        "import_s": round(imported - started, 3),
+        "first_inference_s": round(done - imported, 3),
+    }
+
+
+# --- 2. Feature Extraction ---
+def extract_features(y, sr=features.SAMPLE_RATE, n_mfcc=13):
+    """Extracts aggregated MFCC, Delta, and Delta-Delta features from decoded audio (see features.py)."""
+    return features.extract_features(y, sr, n_mfcc=n_mfcc)
+
+
+def extract_features_from_bytes(data, n_mfcc=13, timings=None, max_seconds=None):
+    """
+    Decodes an uploaded audio file in memory and extracts its feature vector.
+    Audio longer than max_seconds is rejected with ValueError.
+
+    If a timings dict is given, the seconds spent in decode, resampling (if
+    any) and feature extraction are stored in it, along with the decode path
+    taken (see audio_io.decode_audio) and the duration of the decoded audio.
+    """
+    try:
+        started = time.perf_counter()
+        decoding = {}
+        # Decode at the fixed feature sample rate (same as training)
+        y, sr = decode_audio(data, sr=features.SAMPLE_RATE, max_seconds=max_seconds, timings=decoding)
+        decoded = time.perf_counter()
+        vector = extract_features(y, sr, n_mfcc=n_mfcc)
+        if timings is not None:
+            timings.update(decoding)
+            timings["decode"] = decoded - started - decoding.get("resample", 0.0)
+            timings["features"] = time.perf_counter() - decoded
+            timings["audio_seconds"] = len(y) / sr
+        return vector
+    except Exception as e:
+        # Raised as ValueError so it survives the trip back from a worker process;
+        # the API turns it into a 400.
+        raise ValueError(f"Error processing audio: {str(e)}")
+
+
+# --- 3. Prediction (runs inside a pool worker) ---
+def predict_bytes(data, max_seconds=None, model_dir=None):
+    """
+    Extracts features from an uploaded audio file and scores them with the
+    loaded model (or the registry version at model_dir).
+
+    Returns:
+        dict: features, prediction, score and per-stage timings (seconds).
+    """
+    compiled = compiled_for(model_dir)
+
+    timings = {}
+    vector = extract_features_from_bytes(data, timings=timings, max_seconds=max_seconds)
+
+    # Scaling and scoring timed separately for /metrics
+    started = time.perf_counter()
+    Z = compiled.scale(vector)
+    scaled = time.perf_counter()
+    scores = compiled.score_scaled(Z)
+    timings["scale"] = scaled - started
+    timings["score"] = time.perf_counter() - scaled
+
+    return {
+        "features": vector,
+        "prediction": int(compiled.labels(scores)[0]),
+        "score": float(scores[0]),
+        "timings": timings,
+    }
+
+
+# --- 4. Long Audio (runs inside a pool worker) ---
+def predict_stream(source, segment_seconds=None, max_seconds=None, model_dir=None, block_seconds=10.0):
+    """
+    Scores an audio file of any length with constant memory.
+
+    The file (a path, or the upload bytes) is decoded block_seconds at a
+    time and folded into a StreamingFeatureExtractor, so neither the audio
+    nor the MFCC matrix is ever held whole. With segment_seconds, every
+    segment is also scored on its own, giving a timeline of where the audio
+    looks fake.
+
+    Returns:
+        dict: features, prediction, score, timings and segments (a list of
+        {start, end, prediction, score}, empty without segment_seconds).
+    """
+    from streaming import StreamingFeatureExtractor
+
+    compiled = compiled_for(model_dir)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    sr = features.SAMPLE_RATE
+    segment_samples = int(round(segment_seconds * sr)) if segment_seconds else None
+    extractor = StreamingFeatureExtractor()
+    bounds, marks = [], [extractor.checkpoint()]
+    timings = {"decode": 0.0, "features": 0.0}
+
+    def close_segment():
+        bounds.append(extractor.samples_seen)
+        marks.append(extractor.checkpoint())
+
+    try:
+        started = time.perf_counter()
+        for block in iter_audio_blocks(source, sr=sr, block_seconds=block_seconds, max_seconds=max_seconds,
+                                       timings=timings):
+            decoded = time.perf_counter()
+            timings["decode"] += decoded - started
+            # Split at segment boundaries so each segment's frames are folded before its checkpoint
+            while len(block):
+                take = len(block)
+                if segment_samples:
+                    take = min(take, segment_samples - extractor.samples_seen % segment_samples)
+                extractor.push(block[:take])
+                block = block[take:]
+                if segment_samples and extractor.samples_seen % segment_samples == 0:
+                    close_segment()
+            started = time.perf_counter()
+            timings["features"] += started - decoded
+
+        finishing = time.perf_counter()
+        extractor.finish()
+        if segment_samples and extractor.samples_seen % segment_samples:
+            close_segment()
+        elif bounds:
+            # The audio ended on a boundary: the final frames belong to the last segment
+            marks[-1] = extractor.checkpoint()
+        timings["features"] += time.perf_counter() - finishing
+        timings["decode"] -= timings.get("resample", 0.0)
+    except Exception as e:
+        raise ValueError(f"Error processing audio: {str(e)}")
+    if not extractor.ready():
+        raise ValueError("Error processing audio: too short to extract features.")
+    timings["audio_seconds"] = extractor.seconds
+
+    # Whole clip and every segment scored as one matrix
+    rows = [extractor.vector()]
+    kept = []
+    for i, end in enumerate(bounds):
+        # A trailing sliver without a full delta window is left unscored
+        if marks[i + 1][3] > marks[i][3]:
+            rows.append(extractor.vector(since=marks[i], until=marks[i + 1]))
+            kept.append((bounds[i - 1] if i else 0, end))
+
+    started = time.perf_counter()
+    Z = compiled.scale(np.vstack(rows))
+    scaled = time.perf_counter()
+    scores = compiled.score_scaled(Z)
+    timings["scale"] = scaled - started
+    timings["score"] = time.perf_counter() - scaled
+    labels = compiled.labels(scores)
+
+    return {
+        "features": rows[0],
+        "prediction": int(labels[0]),
+        "score": float(scores[0]),
+        "timings": timings,
+        "segments": [
+            {"start": round(start / sr, 3), "end": round(end / sr, 3),
+             "prediction": int(label), "score": float(score)}
+            for (start, end), label, score in zip(kept, labels[1:], scores[1:])
+        ],
+    }
+
+
+def predict_archive(path, allowed_ext=("wav",), max_files=None, max_seconds=None, model_dir=None, max_bytes=None):
+    """
+    Scores every audio file in a zip/tar archive on disk (queued /jobs uploads).
+
+    Returns:
+        list: one {"filename", "prediction", "score", "features"} or
+        {"filename", "error"} per member, in archive order.
+    """
+    from audio_io import read_archive
+
+    with open(path, "rb") as f:
+        members = read_archive(f.read(), allowed_ext, max_files, max_bytes)
+    extracted = extract_many([data for _, data in members], max_seconds)
+
+    good = [i for i, (vector, _, _) in enumerate(extracted) if vector is not None]
+    scored = score_matrix(np.vstack([extracted[i][0] for i in good]), model_dir) if good else {"predictions": [], "scores": []}
+    by_index = dict(zip(good, zip(scored["predictions"], scored["scores"])))
+
+    results = []
+    for i, (name, _) in enumerate(members):
+        if i in by_index:
+            prediction, score = by_index[i]
+            results.append({"filename": name, "prediction": prediction, "score": score,
+                            "features": extracted[i][0]})
+        else:
+            results.append({"filename": name, "error": extracted[i][1]})
+    return results
+
+
+# --- 5. Batch Prediction (runs inside a pool worker) ---
+def extract_many(blobs, max_seconds=None):
+    """
+    Extracts features for several uploads in one worker job.
+
+    Returns:
+        list: one (feature vector, None, timings) or (None, error message, timings)
+        per blob, so a bad file does not fail the rest of its chunk.
+    """
+    results = []
+    for data in blobs:
+        timings = {}
+        try:
+            results.append((extract_features_from_bytes(data, timings=timings, max_seconds=max_seconds), None, timings))
+        except ValueError as e:
+            results.append((None, str(e), timings))
+    return results
+
+
+def score_matrix(matrix, model_dir=None):
+    """Scales and scores a stacked (n, 78) feature matrix in one pass."""
+    compiled = compiled_for(model_dir)
+
+    started = time.perf_counter()
+    Z = compiled.scale(matrix)
+    scaled = time.perf_counter()
+    scores = compiled.score_scaled(Z)
+
+    return {
+        "predictions": compiled.labels(scores).astype(int).tolist(),
+        "scores": scores.astype(float).tolist(),
+        "timings": {"scale": scaled - started, "score": time.perf_counter() - scaled},
+    }
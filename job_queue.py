@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+from contextlib import closing
+
+# Job states, in order
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# callback_status while a process is POSTing it
+SENDING = "sending"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    filename TEXT,
+    params TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    input_path TEXT,
+    callback_url TEXT,
+    callback_status TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status);
+CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status);
+"""
+
+
+class ClientLimitError(Exception):
+    """Raised when a client already has its maximum number of queued jobs."""
+
+
+class JobQueue:
+    """
+    A durable job queue in one SQLite file, with no outside broker.
+
+    Inputs are spooled under <root>/inputs and only their paths go in the
+    database. Every uvicorn worker can claim jobs from the same file: claims
+    run in BEGIN IMMEDIATE transactions, so two processes never take the
+    same job. A job left RUNNING longer than `timeout` (its process died) is
+    queued again, up to `max_attempts` times.
+    """
+
+    def __init__(self, root, fingerprint="", max_running_per_client=2, max_queued_per_client=20,
+                 ttl=86400, timeout=1800, max_attempts=3):
+        self.root = root
+        self.input_dir = os.path.join(root, "inputs")
+        self.db_path = os.path.join(root, "jobs.sqlite3")
+        self.fingerprint = fingerprint
+        self.max_running_per_client = max_running_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        os.makedirs(self.input_dir, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    # --- Submitting ---
+    def new_input(self):
+        """Returns (job id, path) to spool a new job's input to."""
+        job_id = uuid.uuid4().hex
+        return job_id, os.path.join(self.input_dir, job_id)
+
+    def dedup_key(self, kind, params, content_hash, client="", callback_url=None):
+        """
+        Same model, work, parameters and bytes from the same client with the
+        same callback -> same job. Other clients get their own job (and their
+        own callback), never someone else's.
+        """
+        key = json.dumps([self.fingerprint, kind, params, content_hash, client, callback_url], sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def submit(self, job_id, input_path, client, kind, filename, params, content_hash, callback_url=None):
+        """
+        Queues a job whose input is already at input_path.
+
+        Returns:
+            tuple: (job dict, deduplicated). When an identical job is queued,
+            running or finished within ttl, that job is returned and the new
+            input is deleted.
+        """
+        key = self.dedup_key(kind, params, content_hash, client, callback_url)
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            existing = db.execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND status != ? AND created_at > ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, FAILED, now - self.ttl),
+            ).fetchone()
+            if existing is not None:
+                db.execute("COMMIT")
+                _remove(input_path)
+                return self._row(existing), True
+
+            queued = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN (?, ?)", (client, QUEUED, RUNNING)
+            ).fetchone()[0]
+            if queued >= self.max_queued_per_client:
+                db.execute("ROLLBACK")
+                _remove(input_path)
+                raise ClientLimitError(f"Client already has {queued} unfinished jobs.")
+
+            db.execute(
+                "INSERT INTO jobs (id, client, kind, filename, params, dedup_key, input_path, callback_url, "
+                "status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, client, kind, filename, json.dumps(params), key, input_path, callback_url, QUEUED, now),
+            )
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return self.get(job_id), False
+
+    # --- Working ---
+    def claim(self):
+        """
+        Takes the oldest queued job whose client is below its running cap.
+
+        Returns:
+            dict: the job (now RUNNING), or None if nothing can run.
+        """
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            # Jobs whose worker died: retry, or give up after max_attempts (and drop their input)
+            db.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ? AND attempts < ?",
+                (QUEUED, RUNNING, now - self.timeout, self.max_attempts),
+            )
+            timed_out = db.execute(
+                "SELECT input_path FROM jobs WHERE status = ? AND started_at < ? AND input_path IS NOT NULL",
+                (RUNNING, now - self.timeout),
+            ).fetchall()
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, input_path = NULL "
+                "WHERE status = ? AND started_at < ?",
+                (FAILED, "Job timed out.", now, RUNNING, now - self.timeout),
+            )
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = ? AND client NOT IN "
+                "(SELECT client FROM jobs WHERE status = ? GROUP BY client HAVING COUNT(*) >= ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, self.max_running_per_client),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, now, row["id"]),
+                )
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        for (path,) in timed_out:
+            _remove(path)
+        if row is None:
+            return None
+        job = self._row(row)
+        job.update(status=RUNNING, started_at=now, attempts=job["attempts"] + 1)
+        return job
+
+    def release(self, job_id):
+        """Puts a claimed job back in the queue (e.g. the worker pool was full)."""
+        with closing(self._connect()) as db:
+            db.execute("UPDATE jobs SET status = ?, started_at = NULL, attempts = attempts - 1 WHERE id = ?",
+                       (QUEUED, job_id))
+
+    def finish(self, job_id, result=None, error=None):
+        """Stores a job's result (or error) and deletes its input."""
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT input_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, input_path = NULL WHERE id = ?",
+                (FAILED if error is not None else DONE, json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id),
+            )
+        if row is not None and row["input_path"]:
+            _remove(row["input_path"])
+
+    def claim_callback(self):
+        """
+        Takes the oldest finished job whose callback has not been sent yet
+        and marks it as being sent, so only one process delivers it.
+
+        Returns:
+            dict: the job, or None if no callback is due.
+        """
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) AND callback_url IS NOT NULL "
+                "AND callback_status IS NULL ORDER BY finished_at LIMIT 1",
+                (DONE, FAILED),
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (SENDING, row["id"]))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return self._row(row) if row is not None else None
+
+    def set_callback_status(self, job_id, status):
+        with closing(self._connect()) as db:
+            db.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
+
+    def purge(self):
+        """Deletes finished jobs older than ttl (and any input a timed-out job left behind)."""
+        cutoff = time.time() - self.ttl
+        with closing(self._connect()) as db:
+            paths = db.execute("SELECT input_path FROM jobs WHERE status IN (?, ?) AND finished_at < ? "
+                               "AND input_path IS NOT NULL", (DONE, FAILED, cutoff)).fetchall()
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff))
+        for (path,) in paths:
+            _remove(path)
+
+    # --- Reading ---
+    def get(self, job_id):
+        db = self._connect()
+        try:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            db.close()
+        return self._row(row) if row is not None else None
+
+    def stats(self):
+        """Backlog numbers for sizing workers: counts by state, queue age and recent wait/run times."""
+        now = time.time()
+        db = self._connect()
+        try:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = db.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            recent = db.execute(
+                "SELECT AVG(started_at - created_at), AVG(finished_at - started_at), COUNT(*) FROM jobs "
+                "WHERE status = ? AND finished_at > ?",
+                (DONE, now - 3600),
+            ).fetchone()
+            clients = db.execute(
+                "SELECT COUNT(DISTINCT client) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+        finally:
+            db.close()
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "active_clients": clients,
+            "oldest_queued_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "last_hour": {
+                "completed": recent[2],
+                "avg_queue_seconds": round(recent[0], 3) if recent[0] is not None else None,
+                "avg_run_seconds": round(recent[1], 3) if recent[1] is not None else None,
+            },
+        }
+
+    @staticmethod
+    def _row(row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
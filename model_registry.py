@@ -0,0 +1,268 @@
+"""
+Local registry of versioned models for zero-downtime deploys.
+
+Every registered version is an immutable directory holding the estimators it
+was trained as, their compiled export, the feature version they expect and
+their training metrics. Which version serves is a one-line pointer file that
+is replaced atomically; a running API polls it and swaps models without a
+restart (see app.py).
+
+Usage:
+    python model_registry.py register --model svm_model.pkl --scaler scaler.pkl --metrics model_metrics.json
+    python model_registry.py list
+    python model_registry.py candidate v0003      # shadow-score a sample of traffic on v0003
+    python model_registry.py promote v0003
+    python model_registry.py rollback
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.path.join(BASE_DIR, "models")
+
+# Pointer files in the registry root
+CURRENT, CANDIDATE = "CURRENT", "CANDIDATE"
+
+
+class ModelRegistry:
+    """
+    Versioned model directories plus two pointers.
+
+    Layout:
+        <root>/v0001/svm_model.pkl     the estimator as trained (exact SVC or approx Pipeline)
+        <root>/v0001/scaler.pkl
+        <root>/v0001/export/           CompiledSVM export, memory-mapped by every worker
+        <root>/v0001/calibration.json  optional, fitted on this version (see calibration.py)
+        <root>/v0001/version.json      feature version, engine, model id, metrics
+        <root>/CURRENT                 the version the API serves
+        <root>/CANDIDATE               optional version shadow-scored on a sample of traffic
+
+    A version is assembled in a temporary directory and renamed into place,
+    so a half-written version is never visible. Pointers are written to a
+    temp file and os.replace()d, so readers see the old or the new one.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    # --- Versions ---
+    def path(self, version):
+        return os.path.join(self.root, version)
+
+    def export_dir(self, version):
+        return os.path.join(self.root, version, "export")
+
+    def info(self, version):
+        """Returns a version's version.json, or None if it is not registered."""
+        try:
+            with open(os.path.join(self.root, version, "version.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def versions(self):
+        """Registered versions, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith("v") and os.path.exists(os.path.join(self.root, name, "version.json")))
+
+    def _last_number(self):
+        """Highest vNNNN number ever used here (deleted versions leave gaps, never reused)."""
+        numbers = [int(name[1:]) for name in os.listdir(self.root)
+                   if name.startswith("v") and name[1:].isdigit()]
+        return max(numbers, default=0)
+
+    def register(self, model_path, scaler_path, metrics_path=None, calibration_path=None,
+                 feature_version=None, float32=False, note=""):
+        """
+        Copies a trained model into a new version and compiles its export.
+
+        Returns:
+            str: the new version name (v0001, v0002, ...).
+        """
+        import joblib
+        from compiled_model import CompiledSVM
+        from calibration import Calibration, model_id
+        from features import FEATURE_VERSION
+
+        model = joblib.load(model_path)
+        scaler = joblib.load(scaler_path)
+        compiled = CompiledSVM.from_estimator(model, scaler, dtype=np.float32 if float32 else np.float64)
+        metrics = None
+        if metrics_path:
+            with open(metrics_path) as f:
+                metrics = json.load(f)
+        if calibration_path and Calibration.load(calibration_path).model_id != model_id(compiled):
+            raise ValueError(f"'{calibration_path}' was fitted on a different model.")
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            shutil.copyfile(model_path, os.path.join(staging, "svm_model.pkl"))
+            shutil.copyfile(scaler_path, os.path.join(staging, "scaler.pkl"))
+            compiled.save(os.path.join(staging, "export"))
+            if calibration_path:
+                shutil.copyfile(calibration_path, os.path.join(staging, "calibration.json"))
+            info = {
+                "feature_version": feature_version or FEATURE_VERSION,
+                "engine": "approx" if hasattr(model, "steps") else "exact",
+                "dtype": compiled.dtype.name,
+                "model_id": model_id(compiled),
+                "n_support": compiled.n_support,
+                "metrics": metrics,
+                "source": {"model": os.path.abspath(model_path), "scaler": os.path.abspath(scaler_path)},
+                "note": note,
+                "created_at": time.time(),
+            }
+            # Renaming onto an existing version fails, so concurrent registrations get distinct names
+            number = self._last_number() + 1
+            while True:
+                version = f"v{number:04d}"
+                info["version"] = version
+                with open(os.path.join(staging, "version.json"), "w") as f:
+                    json.dump(info, f, indent=2)
+                try:
+                    os.rename(staging, self.path(version))
+                    return version
+                except OSError:
+                    if not os.path.exists(self.path(version)):
+                        raise
+                    number += 1
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def load(self, version, mmap=True):
+        """Returns a version's CompiledSVM (memory-mapped by default)."""
+        from compiled_model import CompiledSVM
+        return CompiledSVM.load(self.export_dir(version), mmap=mmap)
+
+    # --- Pointers ---
+    def _read_pointer(self, name):
+        try:
+            with open(os.path.join(self.root, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_pointer(self, name, pointer):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{name}-", dir=self.root)
+        with os.fdopen(fd, "w") as f:
+            json.dump(pointer, f)
+        os.replace(tmp, os.path.join(self.root, name))
+
+    def current(self):
+        """The served version, or None before the first promote."""
+        pointer = self._read_pointer(CURRENT)
+        return pointer["version"] if pointer else None
+
+    def candidate(self):
+        pointer = self._read_pointer(CANDIDATE)
+        return pointer["version"] if pointer else None
+
+    def promote(self, version):
+        """Makes version the served one; running APIs pick it up on their next poll."""
+        from features import FEATURE_VERSION
+
+        info = self.info(version)
+        if info is None:
+            raise ValueError(f"Unknown version {version!r}; registered: {self.versions()}")
+        if info["feature_version"] != FEATURE_VERSION:
+            raise ValueError(f"{version} expects features {info['feature_version']!r}, "
+                             f"but this code extracts {FEATURE_VERSION!r}.")
+        previous = self.current()
+        self._write_pointer(CURRENT, {"version": version, "previous": previous, "promoted_at": time.time()})
+        if self.candidate() == version:
+            self.set_candidate(None)
+        return previous
+
+    def rollback(self):
+        """Promotes the version that was served before the current one."""
+        pointer = self._read_pointer(CURRENT)
+        if not pointer or not pointer.get("previous"):
+            raise ValueError("No previous version to roll back to.")
+        return self.promote(pointer["previous"])
+
+    def set_candidate(self, version):
+        """Sets (or with None, clears) the version shadow-scored next to the current one."""
+        if version is None:
+            try:
+                os.remove(os.path.join(self.root, CANDIDATE))
+            except FileNotFoundError:
+                pass
+            return
+        if self.info(version) is None:
+            raise ValueError(f"Unknown version {version!r}; registered: {self.versions()}")
+        self._write_pointer(CANDIDATE, {"version": version, "set_at": time.time()})
+
+
+def _summary(info):
+    metrics = info.get("metrics") or {}
+    accuracy = metrics.get("test_accuracy")
+    return (f"{info['engine']:>6} {info['dtype']:>7} features {info['feature_version']}"
+            + (f", accuracy {accuracy:.4f}" if accuracy is not None else "")
+            + (f" - {info['note']}" if info.get("note") else ""))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the local model registry.")
+    parser.add_argument("--root", default=os.environ.get("ECHOGUARD_REGISTRY") or REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    register = commands.add_parser("register", help="Add a trained model as a new version")
+    register.add_argument("--model", default="svm_model.pkl")
+    register.add_argument("--scaler", default="scaler.pkl")
+    register.add_argument("--metrics", default=None, help="model_metrics.json written by trainmodel.py")
+    register.add_argument("--calibration", default=None, help="calibration.json fitted on this model")
+    register.add_argument("--float32", action="store_true", help="Compile the export in float32")
+    register.add_argument("--note", default="")
+    register.add_argument("--promote", action="store_true", help="Serve it right away")
+    register.add_argument("--candidate", action="store_true", help="Shadow-score it before promoting")
+
+    commands.add_parser("list", help="Show registered versions and the pointers")
+    promote = commands.add_parser("promote", help="Serve a version")
+    promote.add_argument("version")
+    commands.add_parser("rollback", help="Serve the previously served version again")
+    candidate = commands.add_parser("candidate", help="Shadow-score a version (--clear to stop)")
+    candidate.add_argument("version", nargs="?")
+    candidate.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "register":
+        version = registry.register(args.model, args.scaler, args.metrics, args.calibration,
+                                    float32=args.float32, note=args.note)
+        print(f"Registered {version} in '{registry.root}'.")
+        if args.promote:
+            registry.promote(version)
+            print(f"{version} is now served.")
+        elif args.candidate:
+            registry.set_candidate(version)
+            print(f"{version} is now the shadow candidate.")
+    elif args.command == "list":
+        current, candidate = registry.current(), registry.candidate()
+        for version in registry.versions():
+            mark = "*" if version == current else "~" if version == candidate else " "
+            print(f"{mark} {version}  {_summary(registry.info(version))}")
+        print("(* served, ~ shadow candidate)")
+    elif args.command == "promote":
+        previous = registry.promote(args.version)
+        print(f"{args.version} is now served (was {previous}).")
+    elif args.command == "rollback":
+        current = registry.current()
+        registry.rollback()
+        print(f"{registry.current()} is now served (was {current}).")
+    elif args.command == "candidate":
+        if args.clear or not args.version:
+            registry.set_candidate(None)
+            print("Shadow candidate cleared.")
+        else:
+            registry.set_candidate(args.version)
+            print(f"{args.version} is now the shadow candidate.")
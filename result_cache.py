@@ -0,0 +1,165 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Rough per-entry bookkeeping cost on top of the feature vector itself
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def model_fingerprint(*paths, extra=""):
+    """Hashes the model/scaler files so cached results die with the model that made them."""
+    digest = hashlib.sha256(extra.encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    LRU cache of extracted features and predictions, keyed by upload content.
+
+    Keys are sha256(model fingerprint + raw upload bytes), so the same voicemail
+    forwarded by many users, or a client retry, skips decode and inference.
+    The in-memory tier is bounded by max_bytes and entries expire after ttl
+    seconds. An optional on-disk tier (disk_dir) is shared by every uvicorn
+    worker on the machine.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, disk_dir=None, fingerprint=""):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.fingerprint = fingerprint
+        self._entries = OrderedDict()  # key -> (expires_at, size, entry)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    def key(self, data, fingerprint=None):
+        """Cache key of an upload; fingerprint overrides the cache's (a request pinned to one model version)."""
+        digest = hashlib.sha256((self.fingerprint if fingerprint is None else fingerprint).encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    # --- Lookup ---
+    def get(self, key):
+        """
+        Returns:
+            dict: {"features", "prediction", "score"} or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, size, entry = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                self._drop(key)
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._memory_put(key, entry, now)
+        return entry
+
+    def put(self, key, features, prediction, score):
+        entry = {
+            "features": np.asarray(features, dtype=np.float64),
+            "prediction": int(prediction),
+            "score": float(score),
+        }
+        now = time.time()
+        self._memory_put(key, entry, now)
+        self._disk_put(key, entry)
+
+    # --- Memory tier ---
+    def _memory_put(self, key, entry, now):
+        size = entry["features"].nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now + self.ttl, size, entry)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # --- Disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".npz")
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with np.load(path) as f:
+                return {
+                    "features": f["features"],
+                    "prediction": int(f["prediction"]),
+                    "score": float(f["score"]),
+                }
+        except (OSError, ValueError, KeyError):
+            # Missing, expired by another worker, or half-written: treat as a miss
+            return None
+
+    def _disk_put(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so other workers never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, features=entry["features"], prediction=entry["prediction"], score=entry["score"])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Result cache disk write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "disk_dir": self.disk_dir,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
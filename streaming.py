@@ -0,0 +1,160 @@
+import numpy as np
+
+# Same framing, filterbank and delta filters as the offline extractor, so
+# streamed features line up with the ones the model was trained on.
+from features import SAMPLE_RATE, N_FFT, HOP_LENGTH, N_MELS, N_MFCC, DELTA_WIDTH, TOP_DB, AMIN, bases
+
+
+class StreamingFeatureExtractor:
+    """
+    Incremental MFCC + Delta + Delta-Delta statistics for live audio.
+
+    Audio is pushed in arbitrary-sized blocks of 16 kHz mono samples. Only the
+    last n_fft samples and the last (width - 1) MFCC frames are kept; every
+    coefficient is folded into running sums and sums of squares, so memory
+    does not grow with call length and vector() is O(1).
+
+    Until finish() is called, deltas are only counted for frames with a
+    full window on both sides. finish() zero-pads the end like the offline
+    extractor and adds the edge deltas, after which the only difference left
+    is the 80 dB floor of power_to_db: it is taken from the loudest frame seen
+    so far rather than the whole clip.
+    """
+
+    def __init__(self, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS, n_mfcc=N_MFCC):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mfcc = n_mfcc
+
+        # Built once per process and shared by every stream
+        matrices = bases(sr, n_fft, n_mels, n_mfcc)
+        self.window = matrices["window"]
+        self.mel_basis = matrices["mel_basis"]
+        self.dct = matrices["dct"]
+        # Delta and delta-delta taps, interior frames and the two edges
+        self.taps = np.ascontiguousarray(matrices["taps"][:, 1:])
+        self.head = np.ascontiguousarray(matrices["head"][:, :, 1:])
+        self.tail = np.ascontiguousarray(matrices["tail"][:, :, 1:])
+
+        # librosa centres frames by padding n_fft // 2 zeros in front
+        self._samples = np.zeros(n_fft // 2, dtype=np.float32)
+        self._history = np.zeros((0, n_mfcc), dtype=np.float32)
+        self._max_db = -np.inf
+
+        # Running sums over frames: [mfcc, delta, delta2] x n_mfcc
+        self._sum = np.zeros(3 * n_mfcc)
+        self._sumsq = np.zeros(3 * n_mfcc)
+        self.mfcc_frames = 0
+        self.delta_frames = 0
+        self.samples_seen = 0
+        self.finished = False
+
+    @property
+    def seconds(self):
+        return self.samples_seen / self.sr
+
+    def push(self, samples):
+        """Feeds a block of mono float samples and folds any complete frames into the statistics."""
+        if self.finished:
+            raise RuntimeError("Stream already finished.")
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        self.samples_seen += len(samples)
+        return self._consume(samples)
+
+    def finish(self):
+        """
+        Ends the stream: pads n_fft // 2 zeros like the offline extractor's
+        centred framing and adds the deltas of the last DELTA_WIDTH // 2
+        frames, so frame counts and edge handling match features.summarize().
+        """
+        if self.finished:
+            return
+        self._consume(np.zeros(self.n_fft // 2, dtype=np.float32))
+        if self.mfcc_frames >= DELTA_WIDTH:
+            self._fold_deltas(np.einsum("pwk,wn->pnk", self.tail, self._history[-DELTA_WIDTH:]))
+        self.finished = True
+
+    def _consume(self, samples):
+        buf = np.concatenate([self._samples, samples])
+
+        n_frames = 0 if len(buf) < self.n_fft else 1 + (len(buf) - self.n_fft) // self.hop_length
+        if n_frames == 0:
+            self._samples = buf
+            return 0
+
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.n_fft)[::self.hop_length][:n_frames]
+        # Keep only what the next frame still needs
+        self._samples = buf[n_frames * self.hop_length:].copy()
+
+        mfcc = self._mfcc(frames)
+        self._fold(mfcc)
+        return n_frames
+
+    def _mfcc(self, frames):
+        spectrum = np.fft.rfft(frames * self.window, n=self.n_fft, axis=1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        mel = power @ self.mel_basis.T
+
+        mel_db = 10.0 * np.log10(np.maximum(mel, AMIN))
+        self._max_db = max(self._max_db, float(mel_db.max()))
+        np.maximum(mel_db, self._max_db - TOP_DB, out=mel_db)
+
+        return mel_db @ self.dct.T  # (frames, n_mfcc)
+
+    def _fold(self, mfcc):
+        n = self.n_mfcc
+        seen = self.mfcc_frames
+        self._sum[:n] += mfcc.sum(axis=0)
+        self._sumsq[:n] += np.square(mfcc, dtype=np.float64).sum(axis=0)
+        self.mfcc_frames += len(mfcc)
+
+        # Deltas need DELTA_WIDTH // 2 frames of context on each side; the
+        # history keeps the last DELTA_WIDTH frames (the tail edge needs them all)
+        frames = np.concatenate([self._history, mfcc])
+        if len(frames) >= DELTA_WIDTH:
+            if seen < DELTA_WIDTH:
+                # First full window: deltas of the leading edge frames
+                self._fold_deltas(np.einsum("pwk,wn->pnk", self.head, frames[:DELTA_WIDTH]))
+            # Only windows that end in a new frame; older ones were counted already
+            start = max(0, len(self._history) - (DELTA_WIDTH - 1))
+            windows = np.lib.stride_tricks.sliding_window_view(frames, DELTA_WIDTH, axis=0)[start:]
+            self._fold_deltas(windows @ self.taps)  # (T, n_mfcc, 2)
+
+        self._history = frames[-DELTA_WIDTH:]
+
+    def _fold_deltas(self, deltas):
+        """Folds (T, n_mfcc, 2) delta / delta-delta values into the running sums."""
+        n = self.n_mfcc
+        self._sum[n:] += deltas.sum(axis=0, dtype=np.float64).T.ravel()
+        self._sumsq[n:] += np.einsum("tnk,tnk->kn", deltas, deltas, dtype=np.float64).ravel()
+        self.delta_frames += len(deltas)
+
+    def ready(self):
+        return self.delta_frames > 0
+
+    def checkpoint(self):
+        """Snapshot of the running sums; pass it to vector(since=...) to get the statistics of what came after."""
+        return self._sum.copy(), self._sumsq.copy(), self.mfcc_frames, self.delta_frames
+
+    def vector(self, since=None, until=None):
+        """
+        Returns the current 78-dim [means, stds] vector, same layout as the
+        offline extractor. With since (and until) set to checkpoint()s, only
+        the frames folded in between are summarised (one segment of a long clip).
+        """
+        total, total_sq, mfcc_frames, delta_frames = until if until is not None else self.checkpoint()
+        total, total_sq = total.copy(), total_sq.copy()
+        if since is not None:
+            total -= since[0]
+            total_sq -= since[1]
+            mfcc_frames -= since[2]
+            delta_frames -= since[3]
+
+        n = self.n_mfcc
+        counts = np.empty(3 * n)
+        counts[:n] = max(mfcc_frames, 1)
+        counts[n:] = max(delta_frames, 1)
+        mean = total / counts
+        std = np.sqrt(np.maximum(total_sq / counts - mean ** 2, 0.0))
+        return np.hstack([mean, std])
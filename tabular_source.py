@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "tabular_cache")
+
+# Pre-extracted feature tables that can be trained on. For each source:
+#   path       the CSV file
+#   columns    feature columns to use, in order (None = every column but the label)
+#   label      label column, and how its values map to our classes (0 = REAL, 1 = FAKE)
+#   dtype      dtype the columns are stored and served in
+SOURCES = {
+    "kaggle": {
+        "path": os.path.join(BASE_DIR, "Echoguard", "Echoguard", "archive 1", "KAGGLE", "DATASET-balanced.csv"),
+        "columns": None,
+        "label": "LABEL",
+        "classes": {"REAL": 0, "FAKE": 1},
+        "dtype": "float32",
+    },
+}
+
+
+class ColumnCache:
+    """
+    A CSV table parsed once into typed column files.
+
+    Layout:
+        <root>/<column>.npy   one array per feature column, in the configured dtype
+        <root>/labels.npy     int8 class labels
+        <root>/meta.json      column order, dtype, row count and the CSV's
+                              size and mtime (a changed CSV is re-parsed)
+
+    Later runs np.load(mmap_mode='r') the columns: no CSV parsing, and only
+    the selected columns are paged in.
+    """
+
+    def __init__(self, spec, root):
+        self.spec = spec
+        self.root = root
+        self.meta_path = os.path.join(root, "meta.json")
+
+    def _source_stamp(self):
+        stat = os.stat(self.spec["path"])
+        return {"path": os.path.abspath(self.spec["path"]), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def is_fresh(self):
+        if not os.path.exists(self.meta_path):
+            return False
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return meta.get("source") == self._source_stamp() and meta.get("dtype") == self.spec["dtype"]
+
+    def build(self):
+        """Parses the CSV (the only time pandas reads it) and writes the column files."""
+        import pandas as pd
+
+        label = self.spec["label"]
+        dtype = np.dtype(self.spec["dtype"])
+        table = pd.read_csv(self.spec["path"], dtype={label: str}, engine="c")
+        columns = [c for c in table.columns if c != label]
+
+        unknown = set(table[label].unique()) - set(self.spec["classes"])
+        if unknown:
+            raise ValueError(f"Unknown labels in {self.spec['path']}: {sorted(unknown)}")
+
+        os.makedirs(self.root, exist_ok=True)
+        # meta.json is removed first and written last: its presence marks a complete cache
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        for column in columns:
+            np.save(os.path.join(self.root, column + ".npy"), table[column].to_numpy(dtype=dtype))
+        labels = table[label].map(self.spec["classes"]).to_numpy(dtype=np.int8)
+        np.save(os.path.join(self.root, "labels.npy"), labels)
+
+        meta = {"source": self._source_stamp(), "dtype": dtype.name, "columns": columns, "rows": len(table)}
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+        return meta
+
+    def meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def column(self, name):
+        """Memory-maps one column (read-only)."""
+        return np.load(os.path.join(self.root, name + ".npy"), mmap_mode="r")
+
+    def labels(self):
+        return np.load(os.path.join(self.root, "labels.npy"), mmap_mode="r")
+
+    def to_arrays(self, columns=None):
+        """
+        Returns (X, y) with the selected columns side by side.
+
+        X is allocated once and filled column by column from the memmaps.
+        """
+        available = self.meta()["columns"]
+        columns = columns or available
+        missing = [c for c in columns if c not in available]
+        if missing:
+            raise ValueError(f"Unknown columns {missing}; available: {available}")
+        y = np.asarray(self.labels())
+        X = np.empty((len(y), len(columns)), dtype=np.dtype(self.spec["dtype"]))
+        for i, name in enumerate(columns):
+            X[:, i] = self.column(name)
+        return X, y
+
+
+def open_source(name, cache_dir=CACHE_DIR, rebuild=False):
+    """
+    Returns the ColumnCache of a configured source, parsing its CSV only if
+    the cache is missing, stale or rebuild is set.
+    """
+    if name not in SOURCES:
+        raise ValueError(f"Unknown source {name!r}; configured: {sorted(SOURCES)}")
+    cache = ColumnCache(SOURCES[name], os.path.join(cache_dir, name))
+    if rebuild or not cache.is_fresh():
+        meta = cache.build()
+        print(f"Parsed '{SOURCES[name]['path']}' into {cache.root} ({meta['rows']} rows, "
+              f"{len(meta['columns'])} columns, {meta['dtype']}).")
+    return cache
+
+
+def load_source(name, columns=None, cache_dir=CACHE_DIR, rebuild=False):
+    """Loads (X, y) of a configured source; columns default to the source's configured selection."""
+    cache = open_source(name, cache_dir, rebuild)
+    return cache.to_arrays(columns or SOURCES[name]["columns"])
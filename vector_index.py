@@ -0,0 +1,397 @@
+"""
+Nearest-neighbour index over known feature vectors (training clips and
+confirmed fakes), for matching repeat attacks that reuse a synthetic voice.
+
+An IVF index in NumPy: k-means partitions the scaled 78-dim vectors into
+`nlist` lists, and every vector is stored as its list's centroid plus an
+int8-quantized residual with one float32 scale per row (86 bytes instead
+of 312). A lookup scores the query against the centroids, then only
+against the rows of the `nprobe` closest lists, so its cost does not grow
+with the whole index.
+
+Usage:
+    python vector_index.py build --out vector_index
+    python vector_index.py add vector_index confirmed_fakes.npy --label 1
+    python vector_index.py compact vector_index
+    python vector_index.py bench --rows 1000000
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import threading
+import argparse
+import numpy as np
+
+# Per-row arrays of a generation; the delta segment stores the same columns plus each row's list
+ROW_ARRAYS = (("codes", np.int8), ("scale", np.float32), ("bias", np.float32), ("ids", np.int64),
+              ("labels", np.int8))
+DELTA_ARRAYS = ROW_ARRAYS[:-1] + (("lists", np.int32),) + ROW_ARRAYS[-1:]
+
+
+def _kmeans(X, k, iterations=10, seed=0, chunk=65536):
+    """Plain Lloyd's k-means; returns (k, d) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assign = _nearest(X, centroids, chunk)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack([np.bincount(assign, weights=X[:, j], minlength=k) for j in range(X.shape[1])], axis=1)
+        empty = counts == 0
+        # Empty lists are re-seeded from random points
+        centroids = np.where(empty[:, None], X[rng.choice(len(X), k)], sums / np.maximum(counts, 1)[:, None])
+        centroids = centroids.astype(np.float32)
+    return centroids
+
+
+def _nearest(X, centroids, chunk=65536):
+    """Index of the closest centroid for every row, chunk rows at a time."""
+    norms = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(X), dtype=np.int32)
+    for start in range(0, len(X), chunk):
+        block = np.asarray(X[start:start + chunk], dtype=np.float32)
+        out[start:start + chunk] = np.argmin(norms - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+def _encode(X, centroids, lists):
+    """
+    Quantizes rows as centroid + scale * int8 codes.
+
+    With x ~ c + s * code, |q - x|^2 = |q - c|^2 - 2 s (code . q) + bias, where
+    bias = 2 s (code . c) + s^2 |code|^2 is stored per row: a lookup is then
+    one matmul of the int8 codes with the query, whatever list a row is in.
+    """
+    residual = X - centroids[lists]
+    scale = np.maximum(np.abs(residual).max(axis=1), 1e-12) / 127.0
+    codes = np.rint(residual / scale[:, None]).astype(np.int8)
+    codes_f = codes.astype(np.float32)
+    bias = 2.0 * scale * np.einsum("ij,ij->i", codes_f, centroids[lists]) + scale ** 2 * np.einsum(
+        "ij,ij->i", codes_f, codes_f)
+    return codes, scale.astype(np.float32), bias.astype(np.float32)
+
+
+class VectorIndex:
+    """
+    Layout:
+        <root>/meta.json                 current generation, dims, model id
+        <root>/gen_NNNNNN/centroids.npy  (nlist, d) float32
+        <root>/gen_NNNNNN/codes.npy      (n, d) int8 residuals, sorted by list
+        <root>/gen_NNNNNN/scale.npy, bias.npy   per-row float32 (see _encode)
+        <root>/gen_NNNNNN/offsets.npy    list i is rows offsets[i]:offsets[i+1]
+        <root>/gen_NNNNNN/ids.npy, labels.npy
+        <root>/gen_NNNNNN/delta_*.bin    rows added since the last compact()
+
+    Readers memory-map everything. add() only appends to the delta files
+    (labels last, so their length is the committed row count) and
+    compact() writes a new generation and then swaps meta.json, so readers
+    in other processes never see a half-written index: refresh() picks up
+    either change on the next lookup.
+
+    Within a process, the arrays refresh() swaps in are guarded by a thread
+    lock, so a search never mixes delta arrays of different lengths while
+    another thread add()s. File writes happen outside it.
+    """
+
+    def __init__(self, root, nprobe=4):
+        self.root = root
+        self.nprobe = nprobe
+        self._meta_stamp = None
+        self._delta_stamp = None
+        self._mutex = threading.RLock()
+        self.refresh()
+
+    # --- Reading ---
+    def refresh(self):
+        """Re-opens the index if another process compacted it or added rows."""
+        with self._mutex:
+            meta_path = os.path.join(self.root, "meta.json")
+            stamp = os.stat(meta_path).st_mtime_ns
+            if stamp != self._meta_stamp:
+                with open(meta_path) as f:
+                    self.meta = json.load(f)
+                self.dir = os.path.join(self.root, self.meta["generation"])
+                for name in ("centroids", "offsets") + tuple(name for name, _ in ROW_ARRAYS):
+                    # Plain ndarray views of the mapping: slicing an np.memmap costs more than the math here
+                    setattr(self, name, np.asarray(np.load(os.path.join(self.dir, name + ".npy"), mmap_mode="r")))
+                # Small arrays used on every lookup are kept in RAM
+                self.centroids = np.array(self.centroids)
+                self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+                self.offsets = np.array(self.offsets)
+                self._meta_stamp = stamp
+                self._delta_stamp = None
+
+            labels_path = os.path.join(self.dir, "delta_labels.bin")
+            n = os.path.getsize(labels_path) if os.path.exists(labels_path) else 0
+            if n != self._delta_stamp:
+                # The delta segment is small and scanned in full: read into RAM once per change
+                for name, dtype in DELTA_ARRAYS:
+                    shape = (n, self.centroids.shape[1]) if name == "codes" else (n,)
+                    if n:
+                        data = np.fromfile(os.path.join(self.dir, f"delta_{name}.bin"), dtype=dtype,
+                                           count=int(np.prod(shape)))
+                        setattr(self, "delta_" + name, data.reshape(shape))
+                    else:
+                        setattr(self, "delta_" + name, np.empty(shape, dtype=dtype))
+                self._delta_codes_f = self.delta_codes.astype(np.float32)
+                self._delta_stamp = n
+
+    def __len__(self):
+        return len(self.ids) + len(self.delta_ids)
+
+    @property
+    def model_id(self):
+        return self.meta.get("model_id")
+
+    def search(self, Q, k=5, nprobe=None):
+        """
+        Finds the k nearest stored vectors of every scaled query row.
+
+        Returns:
+            tuple: (ids, labels, distances), each (n, k). Missing neighbours
+            (fewer than k candidates) have id -1 and distance inf.
+        """
+        with self._mutex:
+            self.refresh()
+            Q = np.asarray(Q, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            out_ids = np.full((len(Q), k), -1, dtype=np.int64)
+            out_labels = np.full((len(Q), k), -1, dtype=np.int8)
+            out_dist = np.full((len(Q), k), np.inf, dtype=np.float32)
+
+            # |q - c|^2 for every centroid: picks the lists to probe and is each row's base distance
+            centroid_dist = self.centroid_norms - 2.0 * Q @ self.centroids.T + np.einsum("ij,ij->i", Q, Q)[:, None]
+            probes = np.argpartition(centroid_dist, nprobe - 1, axis=1)[:, :nprobe]
+            for i, q in enumerate(Q):
+                starts = self.offsets[probes[i]]
+                ends = self.offsets[probes[i] + 1]
+                lengths = ends - starts
+                # Lists are contiguous, so each is a slice of the mapping (no gather)
+                codes = np.concatenate([self.codes[a:b] for a, b in zip(starts, ends)] + [self._delta_codes_f])
+                scale = np.concatenate([self.scale[a:b] for a, b in zip(starts, ends)] + [self.delta_scale])
+                dist = np.concatenate([self.bias[a:b] for a, b in zip(starts, ends)] + [self.delta_bias])
+                in_probed = int(lengths.sum())
+                dist[:in_probed] += np.repeat(centroid_dist[i, probes[i]], lengths)
+                dist[in_probed:] += centroid_dist[i, self.delta_lists]
+                dist -= 2.0 * scale * (codes.astype(np.float32, copy=False) @ q)
+
+                n = min(k, len(dist))
+                if n == 0:
+                    continue
+                top = np.argpartition(dist, n - 1)[:n] if n < len(dist) else np.arange(len(dist))
+                top = top[np.argsort(dist[top])]
+                # Candidate positions back to rows: probed lists first, then the delta segment
+                bounds = np.cumsum(lengths)
+                in_lists = top < bounds[-1]
+                which = np.searchsorted(bounds, top[in_lists], side="right")
+                rows = starts[which] + top[in_lists] - (bounds[which] - lengths[which])
+                delta_rows = top[~in_lists] - bounds[-1]
+                out_ids[i, :n][in_lists] = self.ids[rows]
+                out_ids[i, :n][~in_lists] = self.delta_ids[delta_rows]
+                out_labels[i, :n][in_lists] = self.labels[rows]
+                out_labels[i, :n][~in_lists] = self.delta_labels[delta_rows]
+                out_dist[i, :n] = np.sqrt(np.maximum(dist[top], 0.0))
+            return out_ids, out_labels, out_dist
+
+    # --- Writing ---
+    @classmethod
+    def build(cls, root, X, labels, ids=None, nlist=None, model_id=None, feature_version=None, seed=0):
+        """
+        Builds a new index from scaled vectors X (n, d) and their labels.
+
+        nlist defaults to about 2 * sqrt(n) lists; k-means is trained on at
+        most 32 points per list.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n = len(X)
+        nlist = max(1, min(nlist or int(2 * np.sqrt(n)), n))
+        sample = X if n <= 32 * nlist else X[np.random.default_rng(seed).choice(n, 32 * nlist, replace=False)]
+        centroids = _kmeans(sample, nlist, seed=seed)
+        lists = _nearest(X, centroids)
+        codes, scale, bias = _encode(X, centroids, lists)
+
+        rows = {
+            "codes": codes, "scale": scale, "bias": bias, "lists": lists,
+            "ids": np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64),
+            "labels": np.asarray(labels, dtype=np.int8),
+        }
+        meta = {"dim": int(X.shape[1]), "nlist": nlist, "model_id": model_id, "feature_version": feature_version}
+        cls._write_generation(root, meta, centroids, rows)
+        return cls(root)
+
+    @staticmethod
+    def _write_generation(root, meta, centroids, rows):
+        """Writes a complete generation directory (rows sorted by list), then points meta.json at it."""
+        os.makedirs(root, exist_ok=True)
+        existing = [d for d in os.listdir(root) if d.startswith("gen_")]
+        generation = f"gen_{1 + max((int(d[4:]) for d in existing), default=0):06d}"
+        gen_dir = os.path.join(root, generation)
+        os.makedirs(gen_dir)
+
+        order = np.argsort(rows["lists"], kind="stable")
+        np.save(os.path.join(gen_dir, "centroids.npy"), centroids)
+        counts = np.bincount(rows["lists"], minlength=len(centroids))
+        np.save(os.path.join(gen_dir, "offsets.npy"), np.concatenate([[0], np.cumsum(counts)]))
+        for name, dtype in ROW_ARRAYS:
+            np.save(os.path.join(gen_dir, name + ".npy"), np.asarray(rows[name], dtype=dtype)[order])
+
+        meta = dict(meta, generation=generation, count=int(len(order)), updated_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        tmp_path = os.path.join(root, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(root, "meta.json"))
+        return generation
+
+    def _lock(self):
+        f = open(os.path.join(self.root, ".lock"), "w")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def add(self, X, labels, ids=None):
+        """
+        Appends scaled vectors to the delta segment. They are searched by
+        brute force until compact() folds them into the lists.
+
+        Returns:
+            np.ndarray: the ids given to the new rows.
+        """
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        with self._lock():
+            with self._mutex:
+                self.refresh()
+                if ids is None:
+                    ids = np.arange(len(X), dtype=np.int64) + self._next_id()
+            lists = _nearest(X, self.centroids)
+            codes, scale, bias = _encode(X, self.centroids, lists)
+            rows = {
+                "codes": codes, "scale": scale, "bias": bias, "lists": lists,
+                "ids": np.asarray(ids, dtype=np.int64),
+                "labels": np.broadcast_to(np.asarray(labels, dtype=np.int8), (len(X),)),
+            }
+            # Labels last: their file length is the committed row count
+            for name, dtype in DELTA_ARRAYS:
+                with open(os.path.join(self.dir, f"delta_{name}.bin"), "ab") as f:
+                    f.write(np.ascontiguousarray(rows[name], dtype=dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.refresh()
+        return rows["ids"]
+
+    def _next_id(self):
+        current = [self.ids.max() if len(self.ids) else -1, self.delta_ids.max() if len(self.delta_ids) else -1]
+        return int(max(current)) + 1
+
+    def compact(self):
+        """Folds the delta segment into a new generation (same centroids, rows are not re-encoded)."""
+        with self._lock():
+            with self._mutex:
+                self.refresh()
+                if not len(self.delta_ids):
+                    return self.meta["generation"]
+                old_dir = self.dir
+                lists = np.repeat(np.arange(len(self.centroids), dtype=np.int32), np.diff(self.offsets))
+                rows = {name: np.concatenate([getattr(self, name), getattr(self, "delta_" + name)])
+                        for name, _ in ROW_ARRAYS}
+                rows["lists"] = np.concatenate([lists, self.delta_lists])
+                meta = {k: v for k, v in self.meta.items() if k not in ("generation", "count", "updated_at")}
+            generation = self._write_generation(self.root, meta, self.centroids, rows)
+        self.refresh()
+        # Other processes may still have the old files mapped; unlinking is safe on POSIX
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+        return generation
+
+
+def brute_force(X, Q, k):
+    """Exact top-k ids by L2 distance (for measuring recall)."""
+    norms = np.einsum("ij,ij->i", X, X)
+    out = []
+    for q in Q:
+        dist = norms - 2.0 * X @ q
+        top = np.argpartition(dist, k - 1)[:k]
+        out.append(top[np.argsort(dist[top])])
+    return np.array(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build, extend and benchmark the known-sample vector index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Index the training features, scaled with the served model")
+    build.add_argument("--out", default="vector_index")
+    build.add_argument("--store", default=None, help="Feature store directory (default: X_features.npy / y_labels.npy)")
+    build.add_argument("--only", choices=["all", "fake"], default="all", help="Index every clip or only FAKE ones")
+    build.add_argument("--nlist", type=int, default=None)
+    build.add_argument("--model-export", default=None)
+    add = sub.add_parser("add", help="Append confirmed samples (raw 78-dim features in a .npy file)")
+    add.add_argument("index")
+    add.add_argument("features")
+    add.add_argument("--label", type=int, default=1, help="0 = REAL, 1 = FAKE")
+    compact = sub.add_parser("compact", help="Fold appended rows into the lists")
+    compact.add_argument("index")
+    bench = sub.add_parser("bench", help="Lookup latency and recall on synthetic clustered vectors")
+    bench.add_argument("--rows", type=int, default=1_000_000)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--nprobe", type=int, nargs="+", default=[2, 4, 8])
+    bench.add_argument("--dir", default="vector_index_bench")
+    args = parser.parse_args()
+
+    if args.command in ("build", "add"):
+        import inference
+        from calibration import model_id
+        from features import FEATURE_VERSION
+        compiled = inference.load_compiled(export_dir=getattr(args, "model_export", None))
+
+    if args.command == "build":
+        if args.store:
+            from feature_store import FeatureStore
+            X, y = FeatureStore(args.store).to_arrays(FEATURE_VERSION)
+        else:
+            X, y = np.load(os.path.join(inference.BASE_DIR, "X_features.npy")), np.load(
+                os.path.join(inference.BASE_DIR, "y_labels.npy"))
+        ids = np.arange(len(X))
+        if args.only == "fake":
+            keep = y == 1
+            X, y, ids = X[keep], y[keep], ids[keep]
+        started = time.perf_counter()
+        index = VectorIndex.build(args.out, compiled.scale(X), y.astype(np.int8), ids, nlist=args.nlist,
+                                  model_id=model_id(compiled), feature_version=FEATURE_VERSION)
+        print(f"Indexed {len(index)} vectors in {index.meta['nlist']} lists in {time.perf_counter() - started:.2f}s "
+              f"-> '{args.out}'")
+
+    elif args.command == "add":
+        index = VectorIndex(args.index)
+        if index.model_id != model_id(compiled):
+            sys.exit("!!! The index was built with a different model's scaler; rebuild it.")
+        new_ids = index.add(compiled.scale(np.load(args.features)), args.label)
+        print(f"Added {len(new_ids)} vectors (ids {new_ids[0]}..{new_ids[-1]}); {len(index)} in total.")
+
+    elif args.command == "compact":
+        index = VectorIndex(args.index)
+        print(f"Compacted into {index.compact()} ({len(index)} vectors).")
+
+    elif args.command == "bench":
+        rng = np.random.default_rng(0)
+        # Clustered data: many clips per synthetic voice, like a campaign reusing one model
+        voices = rng.standard_normal((max(1, args.rows // 200), 78)).astype(np.float32) * 2
+        X = voices[rng.integers(0, len(voices), args.rows)] + rng.standard_normal((args.rows, 78)).astype(np.float32)
+        started = time.perf_counter()
+        index = VectorIndex.build(args.dir, X, np.ones(args.rows, np.int8))
+        print(f"Built {args.rows} x 78 ({index.meta['nlist']} lists) in {time.perf_counter() - started:.1f}s; "
+              f"codes {index.codes.nbytes / 2**20:.0f} MB on disk")
+
+        Q = X[rng.integers(0, args.rows, args.queries)] + 0.3 * rng.standard_normal((args.queries, 78)).astype(np.float32)
+        truth = brute_force(X, Q, args.k)
+        for nprobe in args.nprobe:
+            timings, found = [], []
+            for q in Q:
+                t0 = time.perf_counter()
+                ids, _, _ = index.search(q, args.k, nprobe=nprobe)
+                timings.append(time.perf_counter() - t0)
+                found.append(ids[0])
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            ms = np.array(timings) * 1000
+            print(f"  nprobe {nprobe:>3}: p50 {np.percentile(ms, 50):.3f} ms, p99 {np.percentile(ms, 99):.3f} ms, "
+                  f"recall@{args.k} {recall:.3f}")
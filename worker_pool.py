@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolFullError(Exception):
+    """Raised when the pool already has max_queue jobs waiting for a worker."""
+
+
+def _timed_call(fn, args):
+    """Runs fn in the worker and reports when it actually started."""
+    return time.time(), fn(*args)
+
+
+class WorkerPool:
+    """
+    A bounded process pool for CPU-heavy work (feature extraction, SVM scoring).
+
+    Jobs run in separate processes so they neither block the event loop nor
+    fight over the GIL. At most `workers` jobs run at once and at most
+    `max_queue` more may wait; beyond that submit() raises PoolFullError so
+    the API can answer 503 instead of piling up requests.
+    """
+
+    def __init__(self, workers=None, max_queue=None, initializer=None, initargs=()):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._invalid_input = 0
+        # Queue wait times (seconds) of the most recent jobs
+        self._waits = deque(maxlen=200)
+
+    def start(self):
+        # "spawn" keeps uvicorn's threads and sockets out of the workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+            initargs=self.initargs,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_depth(self):
+        """Number of accepted jobs still waiting for a free worker."""
+        return max(0, self._pending - self.workers)
+
+    async def submit(self, fn, *args):
+        """
+        Runs fn(*args) in a worker process.
+
+        Returns:
+            tuple: (result, wait_seconds) where wait_seconds is the time the job
+            spent queued before a worker picked it up.
+        """
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not running.")
+        if self._pending >= self.workers + self.max_queue:
+            self._rejected += 1
+            raise PoolFullError("Worker queue is full.")
+
+        self._pending += 1
+        submitted = time.time()
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            started, result = await loop.run_in_executor(executor, _timed_call, fn, args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); replace the executor so later
+            # requests are not stuck with a dead pool. Every job in flight on it
+            # fails at once: only the first one to get here replaces it.
+            self._failed += 1
+            if self._executor is executor:
+                self.shutdown()
+                self.start()
+            raise
+        except ValueError:
+            # Bad client input (unreadable audio, ...): the worker is fine
+            self._invalid_input += 1
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        wait = max(0.0, started - submitted)
+        self._waits.append(wait)
+        self._completed += 1
+        return result, wait
+
+    def stats(self):
+        """Snapshot of pool load for the health endpoint."""
+        waits = sorted(self._waits)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "queue_depth": self.queue_depth,
+            "completed": self._completed,
+            "failed": self._failed,
+            "invalid_input": self._invalid_input,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+            "max_wait_ms": round(1000 * waits[-1], 2) if waits else 0.0,
+        }